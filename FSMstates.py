@@ -133,17 +133,6 @@ class CompletionStates(StatesGroup):
     waiting_for_notes = State()       # Добавление комментариев
 
 
-# ============================================================================
-# СОСТОЯНИЯ ОТМЕНЫ ЗАПИСИ
-# ============================================================================
-
-class CancellationStates(StatesGroup):
-    """
-    Состояния отмены активной записи
-    """
-    waiting_for_record_id = State()  # Выбор записи для отмены
-
-
 # ============================================================================
 # СОСТОЯНИЯ УЧЁТА ТРАТ
 # ============================================================================
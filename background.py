@@ -0,0 +1,47 @@
+"""
+background.py
+=============
+Запуск фоновых задач (fire-and-forget) без ожидания результата.
+Используется для действий, которые не должны задерживать ответ
+пользователю (уведомления и т.п.).
+"""
+
+import asyncio
+import logging
+from typing import Coroutine
+
+logger = logging.getLogger(__name__)
+
+# Ссылки на выполняющиеся задачи: без них задача может быть удалена
+# сборщиком мусора до завершения
+_background_tasks = set()
+
+
+def _on_task_done(task: asyncio.Task):
+    """Убирает завершённую задачу из набора и логирует её ошибку"""
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error(
+            f"Ошибка фоновой задачи {task.get_name()}: {exc}", 
+            exc_info=exc
+        )
+
+
+def run_in_background(coro: Coroutine, name: str | None = None) -> asyncio.Task:
+    """
+    Запускает корутину фоновой задачей.
+    
+    Args:
+        coro (Coroutine): Корутина для выполнения
+        name (str | None): Имя задачи (для логов)
+    
+    Returns:
+        asyncio.Task: Созданная задача
+    """
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
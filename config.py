@@ -15,6 +15,9 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Адрес Redis для хранения состояний FSM (опционально, иначе — в памяти)
+REDIS_URL = os.getenv("REDIS_URL")
+
 # Получаем параметры почты (опционально)
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))  # По умолчанию порт 587
@@ -39,6 +42,7 @@ if not BOT_TOKEN or not DATABASE_URL:
 __all__ = [
     "BOT_TOKEN",
     "DATABASE_URL",
+    "REDIS_URL",
     "EMAIL_HOST",
     "EMAIL_PORT",
     "EMAIL_USER",
@@ -7,8 +7,13 @@ database.py
 
 import asyncpg
 import bcrypt
+import hashlib
 import random
+import secrets
 import string
+import time
+import functools
+from collections import defaultdict, OrderedDict
 from datetime import datetime, timedelta, date as date_type
 import logging  # ← ДОБАВЛЕНО для логгера
 from config import DATABASE_URL
@@ -27,12 +32,186 @@ async def get_db_connection():
     """
     Создаёт асинхронное подключение к PostgreSQL.
     
+    Функции модуля работают через общий пул (get_db_pool); отдельное
+    подключение нужно только для разовых скриптов и миграций.
+    
     Returns:
         asyncpg.Connection: Объект подключения к БД
     """
     return await asyncpg.connect(DATABASE_URL)
 
 
+# Общий пул подключений. В отличие от одноразовых подключений
+# get_db_connection, соединения пула живут долго, поэтому кэш
+# подготовленных выражений asyncpg (statement_cache_size) переиспользуется
+# между вызовами: повторные запросы не разбираются и не планируются заново
+_db_pool = None
+_db_pool_lock = asyncio.Lock()
+
+DB_POOL_MIN_SIZE = 5
+DB_POOL_MAX_SIZE = 20
+DB_STATEMENT_CACHE_SIZE = 256
+# Подготовленные выражения не устаревают по времени (0 — без ограничения):
+# при редких запросах кэш иначе очищается каждые 5 минут (умолчание asyncpg)
+DB_STATEMENT_CACHE_LIFETIME = 0
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    """
+    Возвращает общий пул подключений (создаётся при первом обращении).
+    
+    Returns:
+        asyncpg.Pool: Пул подключений к БД
+    """
+    global _db_pool
+    if _db_pool is None:
+        async with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    max_cached_statement_lifetime=DB_STATEMENT_CACHE_LIFETIME
+                )
+    return _db_pool
+
+
+async def close_db_pool():
+    """
+    Закрывает общий пул подключений (вызывается при остановке бота).
+    """
+    global _db_pool
+    if _db_pool is not None:
+        await _db_pool.close()
+        _db_pool = None
+
+
+# ============================================================================
+# ОБЪЕДИНЕНИЕ ОДИНАКОВЫХ ЗАПРОСОВ
+# ============================================================================
+
+# Выполняющиеся сейчас запросы: (функция, *аргументы) → asyncio.Future
+_inflight_queries = {}
+
+
+def _dedup_inflight(func):
+    """
+    Декоратор: одинаковые вызовы func(*args), пришедшие, пока первый ещё
+    выполняется, не идут в БД, а ждут результата первого.
+    
+    Например, при многократном нажатии одной кнопки выполняется
+    один запрос вместо нескольких параллельных.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args):
+        key = (func.__name__, *args)
+        future = _inflight_queries.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func(*args))
+            _inflight_queries[key] = future
+            future.add_done_callback(lambda _: _inflight_queries.pop(key, None))
+        # shield: отмена одного из ожидающих не отменяет общий запрос
+        return await asyncio.shield(future)
+    
+    return wrapper
+
+
+# ============================================================================
+# ДОПОЛНИТЕЛЬНЫЕ СТОЛБЦЫ И ИНДЕКСЫ ДЛЯ ГОРЯЧИХ ЗАПРОСОВ
+# ============================================================================
+
+# Столбцы, добавленные после создания схемы
+_COLUMNS = [
+    # Хэш SHA-256 кода сброса пароля (сам код в БД не хранится)
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS reset_code_hash bytea",
+]
+
+# Индексы под запросы, выполняемые почти на каждое действие пользователя.
+# Имя индекса → DDL. CONCURRENTLY: сборка не блокирует запись в таблицы
+# (asyncpg выполняет запрос вне транзакции, в режиме autocommit)
+_INDEXES = {
+    # Проверка регистрации (is_user_registered) — на каждом входе в меню
+    "idx_users_telegram_id": """
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_users_telegram_id
+    ON users (telegram_id)
+    """,
+    # Частичные индексы по активным чатам (поиск активного чата клиента/мастера)
+    "idx_chats_active_client": """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chats_active_client
+    ON chats (client_telegram_id) INCLUDE (id, provider_telegram_id)
+    WHERE is_active = true
+    """,
+    "idx_chats_active_provider": """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chats_active_provider
+    ON chats (provider_telegram_id) INCLUDE (id, client_telegram_id)
+    WHERE is_active = true
+    """,
+    # Покрывающие индексы записей на услуги: почти все выборки фильтруют
+    # по мастеру/клиенту, дате и статусу (календарь, история, статистика)
+    "idx_sr_provider_date_status": """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sr_provider_date_status
+    ON service_records (provider_telegram_id, service_date DESC, status)
+    INCLUDE (service_time, service_name, cost, client_telegram_id)
+    """,
+    "idx_sr_client_date_status": """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sr_client_date_status
+    ON service_records (client_telegram_id, service_date DESC, status)
+    INCLUDE (service_time, service_name, cost, provider_telegram_id)
+    """,
+    # Активные записи мастера (списки для отмены/завершения) —
+    # частичный индекс в порядке сортировки get_active_records_for_provider
+    "idx_sr_provider_active": """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sr_provider_active
+    ON service_records (provider_telegram_id, service_date, service_time)
+    INCLUDE (service_name, client_telegram_id)
+    WHERE status = 'active'
+    """,
+    # Адреса мастеров по координатам — предфильтр поиска ближайших
+    # (search_nearby_providers) диапазоном широты вместо полного перебора
+    "idx_provider_addresses_lat_lon": """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_provider_addresses_lat_lon
+    ON provider_addresses (latitude, longitude)
+    INCLUDE (provider_telegram_id, address)
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """,
+}
+
+
+async def ensure_indexes():
+    """
+    Создаёт недостающие столбцы и индексы (идемпотентно).
+    
+    Вызывается разовой миграцией migrate.py перед запуском новой версии
+    бота, а не при каждом старте. Индекс, который не удалось собрать
+    (например, уникальный при дубликатах), пропускается с записью в лог.
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        for ddl in _COLUMNS:
+            await conn.execute(ddl)
+        
+        for name, ddl in _INDEXES.items():
+            # Прерванная сборка CONCURRENTLY оставляет невалидный индекс,
+            # который IF NOT EXISTS не пересоздаст — удаляем его
+            invalid = await conn.fetchval(
+                """
+                SELECT NOT i.indisvalid 
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid 
+                WHERE c.relname = $1
+                """,
+                name
+            )
+            if invalid:
+                await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            
+            try:
+                await conn.execute(ddl)
+            except asyncpg.PostgresError as e:
+                logger.error(f"Не удалось создать индекс {name}: {e}")
+                await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
 # ============================================================================
 # ФУНКЦИИ РЕГИСТРАЦИИ И АУТЕНТИФИКАЦИИ
 # ============================================================================
@@ -47,72 +226,75 @@ async def is_user_registered(telegram_id: int) -> bool:
     Returns:
         bool: True если пользователь зарегистрирован, иначе False
     """
-    conn = await get_db_connection()
-    try:
-        row = await conn.fetchrow(
-            "SELECT 1 FROM users WHERE telegram_id = $1", 
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT EXISTS(SELECT 1 FROM users WHERE telegram_id = $1)", 
             telegram_id
         )
-        return row is not None
-    finally:
-        await conn.close()
 
 
-async def create_user(telegram_id: int, password_hash: str) -> str:
+async def create_user(
+    telegram_id: int, 
+    password_hash: str, 
+    first_name: str = None, 
+    last_name: str = None, 
+    email: str = None
+) -> str:
     """
     Создаёт нового пользователя в системе и генерирует 6-значный код.
     
+    Код, имя, фамилия и email записываются одним INSERT — без отдельной
+    проверки уникальности кода и без последующих UPDATE.
+    
     Args:
         telegram_id (int): ID пользователя в Telegram
-        password_hash (str): Хэш пароля (bcrypt)
+        password_hash (str): Хэш пароля (argon2id)
+        first_name (str, optional): Имя пользователя
+        last_name (str, optional): Фамилия пользователя
+        email (str, optional): Email адрес пользователя
     
     Returns:
         str: Уникальный 6-значный код пользователя
     """
-    conn = await get_db_connection()
-    try:
-        # Генерируем уникальный 6-значный код
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        # Генерируем код и вставляем пользователя, только если код свободен;
+        # при коллизии (строка не вставлена) пробуем другой код
         while True:
             user_code = ''.join(random.choices(string.digits, k=6))
-            exists = await conn.fetchrow(
-                "SELECT 1 FROM users WHERE user_code = $1", 
-                user_code
+            row = await conn.fetchrow(
+                """
+                INSERT INTO users 
+                (telegram_id, password_hash, user_code, first_name, last_name, email)
+                SELECT $1, $2, $3, $4, $5, $6
+                WHERE NOT EXISTS (SELECT 1 FROM users WHERE user_code = $3)
+                RETURNING user_code
+                """,
+                telegram_id, password_hash, user_code, first_name, last_name, email
             )
-            if not exists:
-                break
-        
-        # Вставляем нового пользователя в таблицу users
-        await conn.execute(
-            """
-            INSERT INTO users (telegram_id, password_hash, user_code) 
-            VALUES ($1, $2, $3)
-            """,
-            telegram_id, password_hash, user_code
-        )
-        return user_code
-    finally:
-        await conn.close()
+            if row:
+                return row["user_code"]
 
 
-async def get_password_hash(telegram_id: int) -> str:
+async def get_password_hash(telegram_id: int) -> bytes:
     """
     Получает хэш пароля пользователя из БД.
     
+    Хэш возвращается сразу в bytes (в том виде, который принимают argon2 и bcrypt).
+    
     Args:
         telegram_id (int): ID пользователя в Telegram
     
     Returns:
-        str: Хэш пароля или None, если пользователь не найден
+        bytes: Хэш пароля или None, если пользователь не найден
     """
-    conn = await get_db_connection()
-    try:
-        row = await conn.fetchrow(
-            "SELECT password_hash FROM users WHERE telegram_id = $1", 
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT convert_to(password_hash, 'UTF8') FROM users WHERE telegram_id = $1", 
             telegram_id
         )
-        return row["password_hash"] if row else None
-    finally:
-        await conn.close()
 
 
 async def update_password(telegram_id: int, password_hash: str):
@@ -123,14 +305,12 @@ async def update_password(telegram_id: int, password_hash: str):
         telegram_id (int): ID пользователя в Telegram
         password_hash (str): Новый хэш пароля
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             "UPDATE users SET password_hash = $1 WHERE telegram_id = $2", 
             password_hash, telegram_id
         )
-    finally:
-        await conn.close()
 
 
 # ============================================================================
@@ -145,14 +325,12 @@ async def update_user_email(telegram_id: int, email: str):
         telegram_id (int): ID пользователя в Telegram
         email (str): Email адрес пользователя
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             "UPDATE users SET email = $1 WHERE telegram_id = $2", 
             email, telegram_id
         )
-    finally:
-        await conn.close()
 
 
 async def get_user_email(telegram_id: int):
@@ -165,20 +343,44 @@ async def get_user_email(telegram_id: int):
     Returns:
         str: Email или None, если не задан
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             "SELECT email FROM users WHERE telegram_id = $1", 
             telegram_id
         )
         return row["email"] if row else None
-    finally:
-        await conn.close()
+
+
+async def get_user_profile(telegram_id: int) -> tuple[bool, str | None]:
+    """
+    Получает одним запросом признак регистрации и email пользователя.
+    
+    Args:
+        telegram_id (int): ID пользователя в Telegram
+    
+    Returns:
+        tuple[bool, str | None]: (зарегистрирован, email или None)
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            "SELECT email FROM users WHERE telegram_id = $1", 
+            telegram_id
+        )
+        return (True, row["email"]) if row else (False, None)
+
+
+def _reset_code_hash(telegram_id: int, code: str) -> bytes:
+    """Хэш кода сброса, который хранится в БД вместо самого кода"""
+    return hashlib.sha256(f"{telegram_id}:{code}".encode()).digest()
 
 
 async def generate_reset_code(telegram_id: int):
     """
-    Генерирует 6-значный код для сброса пароля и сохраняет его в БД.
+    Генерирует 6-значный код для сброса пароля и сохраняет его хэш в БД.
+    
+    Код берётся из криптографически стойкого генератора (secrets).
     
     Args:
         telegram_id (int): ID пользователя в Telegram
@@ -186,79 +388,50 @@ async def generate_reset_code(telegram_id: int):
     Returns:
         str: Сгенерированный код (6 цифр)
     """
-    code = ''.join(random.choices(string.digits, k=6))
+    code = f"{secrets.randbelow(1_000_000):06d}"
     expires = datetime.utcnow() + timedelta(minutes=10)
     
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             UPDATE users 
-            SET reset_code = $1, reset_code_expires = $2 
+            SET reset_code = NULL, reset_code_hash = $1, reset_code_expires = $2 
             WHERE telegram_id = $3
             """,
-            code, expires, telegram_id
+            _reset_code_hash(telegram_id, code), expires, telegram_id
         )
         return code
-    finally:
-        await conn.close()
 
 
 async def verify_reset_code(telegram_id: int, code: str) -> bool:
     """
-    Проверяет валидность кода сброса пароля.
+    Проверяет код сброса пароля и сразу погашает его.
+    
+    Проверка и очистка выполняются одним UPDATE ... RETURNING, поэтому
+    один и тот же код нельзя использовать дважды. Сравнивается хэш кода.
     
     Args:
         telegram_id (int): ID пользователя в Telegram
         code (str): Введённый пользователем код
     
     Returns:
-        bool: True если код валиден, иначе False
+        bool: True если код валиден (и был погашен), иначе False
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
-            """
-            SELECT reset_code, reset_code_expires 
-            FROM users 
-            WHERE telegram_id = $1
-            """,
-            telegram_id
-        )
-        
-        if not row or not row["reset_code"] or not row["reset_code_expires"]:
-            return False
-        
-        if row["reset_code"] != code:
-            return False
-        
-        if row["reset_code_expires"] < datetime.utcnow():
-            return False
-        
-        return True
-    finally:
-        await conn.close()
-
-
-async def clear_reset_code(telegram_id: int):
-    """
-    Очищает код сброса пароля после успешного использования.
-    
-    Args:
-        telegram_id (int): ID пользователя в Telegram
-    """
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
             """
             UPDATE users 
-            SET reset_code = NULL, reset_code_expires = NULL 
-            WHERE telegram_id = $1
+            SET reset_code_hash = NULL, reset_code_expires = NULL 
+            WHERE telegram_id = $1 
+              AND reset_code_hash = $2 
+              AND reset_code_expires >= $3
+            RETURNING 1
             """,
-            telegram_id
+            telegram_id, _reset_code_hash(telegram_id, code), datetime.utcnow()
         )
-    finally:
-        await conn.close()
+        return row is not None
 
 
 # ============================================================================
@@ -274,8 +447,8 @@ async def update_user_name(telegram_id: int, first_name: str, last_name: str):
         first_name (str): Имя пользователя
         last_name (str): Фамилия пользователя
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             UPDATE users 
@@ -284,10 +457,10 @@ async def update_user_name(telegram_id: int, first_name: str, last_name: str):
             """,
             first_name, last_name, telegram_id
         )
-    finally:
-        await conn.close()
+        _user_name_cache.pop(telegram_id, None)
 
 
+@_dedup_inflight
 async def get_user_name(telegram_id: int):
     """
     Получает имя, фамилию и код пользователя из БД.
@@ -298,8 +471,8 @@ async def get_user_name(telegram_id: int):
     Returns:
         asyncpg.Record: Запись с полями first_name, last_name, user_code
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             SELECT first_name, last_name, user_code 
@@ -309,8 +482,41 @@ async def get_user_name(telegram_id: int):
             telegram_id
         )
         return row if row else None
-    finally:
-        await conn.close()
+
+
+# Кэш имён пользователей: telegram_id → (запись, момент загрузки).
+# Имена меняются редко; update_user_name сбрасывает запись пользователя.
+# Размер ограничен: при переполнении вытесняются давно не использованные (LRU)
+_user_name_cache = OrderedDict()
+USER_NAME_CACHE_TTL = 300  # секунд
+USER_NAME_CACHE_MAX_SIZE = 10000
+
+
+async def get_user_name_cached(telegram_id: int):
+    """
+    То же, что get_user_name, но с кэшем в памяти процесса на
+    USER_NAME_CACHE_TTL секунд (для частых уведомлений).
+    
+    Args:
+        telegram_id (int): ID пользователя в Telegram
+    
+    Returns:
+        asyncpg.Record: Запись с полями first_name, last_name, user_code
+    """
+    now = time.monotonic()
+    cached = _user_name_cache.get(telegram_id)
+    if cached and now - cached[1] < USER_NAME_CACHE_TTL:
+        _user_name_cache.move_to_end(telegram_id)
+        return cached[0]
+    
+    row = await get_user_name(telegram_id)
+    # Отсутствующего пользователя не кэшируем: он может вскоре зарегистрироваться
+    if row is not None:
+        _user_name_cache[telegram_id] = (row, now)
+        _user_name_cache.move_to_end(telegram_id)
+        if len(_user_name_cache) > USER_NAME_CACHE_MAX_SIZE:
+            _user_name_cache.popitem(last=False)
+    return row
 
 
 # ============================================================================
@@ -328,8 +534,8 @@ async def create_chat(client_id: int, provider_id: int):
     Returns:
         int: ID созданного чата
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             INSERT INTO chats (client_telegram_id, provider_telegram_id)
@@ -338,8 +544,6 @@ async def create_chat(client_id: int, provider_id: int):
             client_id, provider_id
         )
         return row["id"]
-    finally:
-        await conn.close()
 
 
 async def get_active_chat_by_client(client_id: int):
@@ -352,17 +556,16 @@ async def get_active_chat_by_client(client_id: int):
     Returns:
         asyncpg.Record: Запись чата или None, если активного чата нет
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         return await conn.fetchrow(
             """
-            SELECT * FROM chats 
+            SELECT id, client_telegram_id, provider_telegram_id, is_active
+            FROM chats 
             WHERE client_telegram_id = $1 AND is_active = true
             """,
             client_id
         )
-    finally:
-        await conn.close()
 
 
 async def get_active_chat_by_provider(provider_id: int):
@@ -375,34 +578,74 @@ async def get_active_chat_by_provider(provider_id: int):
     Returns:
         asyncpg.Record: Запись чата или None, если активного чата нет
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         return await conn.fetchrow(
             """
-            SELECT * FROM chats 
+            SELECT id, client_telegram_id, provider_telegram_id, is_active
+            FROM chats 
             WHERE provider_telegram_id = $1 AND is_active = true
             """,
             provider_id
         )
-    finally:
-        await conn.close()
 
 
 async def close_chat(chat_id: int):
     """
     Завершает чат (устанавливает is_active = false).
     
+    Один запрос через пул: уже завершённый чат повторно не обновляется.
+    
     Args:
         chat_id (int): ID чата для завершения
     """
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            "UPDATE chats SET is_active = false WHERE id = $1", 
-            chat_id
-        )
-    finally:
-        await conn.close()
+    pool = await get_db_pool()
+    await pool.execute(
+        "UPDATE chats SET is_active = false WHERE id = $1 AND is_active", 
+        chat_id
+    )
+
+
+async def get_chat_by_id(chat_id: int):
+    """
+    Получает чат по его ID (поиск по первичному ключу).
+    
+    Args:
+        chat_id (int): ID чата
+    
+    Returns:
+        asyncpg.Record: Запись с полями id, client_telegram_id,
+            provider_telegram_id, is_active или None, если чат не найден
+    """
+    pool = await get_db_pool()
+    return await pool.fetchrow(
+        """
+        SELECT id, client_telegram_id, provider_telegram_id, is_active 
+        FROM chats 
+        WHERE id = $1
+        """,
+        chat_id
+    )
+
+
+async def get_client_id_by_chat(chat_id: int):
+    """
+    Получает ID клиента по ID чата.
+    
+    Выполняется через общий пул: текст запроса постоянный, поэтому
+    подготовленное выражение берётся из кэша соединения.
+    
+    Args:
+        chat_id (int): ID чата
+    
+    Returns:
+        int: telegram_id клиента или None, если чат не найден
+    """
+    pool = await get_db_pool()
+    return await pool.fetchval(
+        "SELECT client_telegram_id FROM chats WHERE id = $1", 
+        chat_id
+    )
 
 
 async def get_user_telegram_id_by_code(user_code: str):
@@ -415,15 +658,13 @@ async def get_user_telegram_id_by_code(user_code: str):
     Returns:
         int: telegram_id или None, если пользователь не найден
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             "SELECT telegram_id FROM users WHERE user_code = $1", 
             user_code
         )
         return row["telegram_id"] if row else None
-    finally:
-        await conn.close()
 
 
 # ============================================================================
@@ -453,8 +694,8 @@ async def create_service_record(
         time (time): Время услуги
         comments (str): Комментарии
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             INSERT INTO service_records 
@@ -465,125 +706,167 @@ async def create_service_record(
             provider_id, client_id, service_name, cost, 
             address, date, time, comments
         )
-    finally:
-        await conn.close()
+        invalidate_calendar_cache(provider_id, client_id)
 
 
-async def get_record_years(telegram_id: int, role: str) -> list[int]:
+async def create_service_record_with_notifications(
+    provider_id: int, 
+    client_id: int, 
+    service_name: str, 
+    cost: int, 
+    address: str, 
+    date: date_type, 
+    time: datetime, 
+    comments: str,
+    notifications: list[tuple[int, str, str]]
+) -> int:
     """
-    Получает список лет с записями для пользователя.
+    Создаёт запись на услугу и уведомления о ней в одной транзакции.
+    
+    Одно подключение и один коммит вместо отдельных вызовов
+    create_service_record и create_notification.
     
     Args:
-        telegram_id (int): ID пользователя
-        role (str): 'provider' или 'client'
+        provider_id (int): ID мастера
+        client_id (int): ID клиента
+        service_name (str): Название услуги
+        cost (int): Стоимость в рублях
+        address (str): Адрес проведения услуги
+        date (date): Дата услуги
+        time (time): Время услуги
+        comments (str): Комментарии
+        notifications (list[tuple[int, str, str]]): Уведомления в виде
+            (telegram_id, role, message_text)
     
     Returns:
-        list[int]: Список лет (например, [2025, 2026])
+        int: ID созданной записи
     """
-    conn = await get_db_connection()
-    try:
-        if role == "provider":
-            query = """
-                SELECT DISTINCT EXTRACT(YEAR FROM service_date) 
-                FROM service_records 
-                WHERE provider_telegram_id = $1 
-                  AND status != 'completed'
-                ORDER BY 1 DESC
-            """
-        else:  # client
-            query = """
-                SELECT DISTINCT EXTRACT(YEAR FROM service_date) 
-                FROM service_records 
-                WHERE client_telegram_id = $1 
-                  AND status != 'completed'
-                ORDER BY 1 DESC
-            """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            record_id = await conn.fetchval(
+                """
+                INSERT INTO service_records 
+                (provider_telegram_id, client_telegram_id, service_name, cost, 
+                 address, service_date, service_time, comments, status)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'active')
+                RETURNING id
+                """,
+                provider_id, client_id, service_name, cost, 
+                address, date, time, comments
+            )
+            
+            if notifications:
+                await conn.executemany(
+                    """
+                    INSERT INTO notifications (user_telegram_id, role, message_text)
+                    VALUES ($1, $2, $3)
+                    """,
+                    notifications
+                )
         
-        rows = await conn.fetch(query, telegram_id)
-        return [int(row[0]) for row in rows if row[0]]
-    finally:
-        await conn.close()
+        invalidate_calendar_cache(provider_id, client_id)
+        return record_id
+
+
+# ============================================================================
+# КЭШ КАЛЕНДАРНЫХ ЗАПРОСОВ
+# ============================================================================
+
+# Кэш результатов get_record_calendar_tree (cache-aside):
+# (роль, telegram_id) → {(функция, *аргументы): (значение, момент загрузки)}
+# Сбрасывается при любом изменении записей пользователя.
+# Размер ограничен: при переполнении вытесняются давно не использованные
+# пользователи (LRU)
+_calendar_cache = OrderedDict()
+CALENDAR_CACHE_TTL = 60  # секунд
+CALENDAR_CACHE_MAX_USERS = 4096
 
 
-async def get_record_months(telegram_id: int, role: str, year: int) -> dict[int, int]:
+def _calendar_cached(func):
     """
-    Получает количество записей по месяцам для заданного года.
+    Декоратор кэширования календарных запросов вида func(telegram_id, role, *args).
+    """
+    @functools.wraps(func)
+    async def wrapper(telegram_id: int, role: str, *args):
+        key = (func.__name__, *args)
+        now = time.monotonic()
+        
+        bucket = _calendar_cache.get((role, telegram_id))
+        if bucket is not None:
+            _calendar_cache.move_to_end((role, telegram_id))
+            cached = bucket.get(key)
+            if cached and now - cached[1] < CALENDAR_CACHE_TTL:
+                return cached[0]
+        
+        value = await func(telegram_id, role, *args)
+        
+        bucket = _calendar_cache.get((role, telegram_id))
+        if bucket is None:
+            bucket = _calendar_cache[(role, telegram_id)] = {}
+            if len(_calendar_cache) > CALENDAR_CACHE_MAX_USERS:
+                _calendar_cache.popitem(last=False)
+        bucket[key] = (value, now)
+        return value
     
-    Args:
-        telegram_id (int): ID пользователя
-        role (str): 'provider' или 'client'
-        year (int): Год для фильтрации
+    return wrapper
+
+
+def invalidate_calendar_cache(*telegram_ids: int):
+    """
+    Сбрасывает кэш календаря указанных пользователей (для обеих ролей).
     
-    Returns:
-        dict[int, int]: Словарь {номер_месяца: количество_записей}
+    Вызывается после создания, отмены или завершения записи.
     """
-    conn = await get_db_connection()
-    try:
-        if role == "provider":
-            query = """
-                SELECT EXTRACT(MONTH FROM service_date), COUNT(*)
-                FROM service_records
-                WHERE provider_telegram_id = $1 
-                  AND EXTRACT(YEAR FROM service_date) = $2
-                  AND status != 'completed'
-                GROUP BY EXTRACT(MONTH FROM service_date)
-            """
-        else:  # client
-            query = """
-                SELECT EXTRACT(MONTH FROM service_date), COUNT(*)
-                FROM service_records
-                WHERE client_telegram_id = $1 
-                  AND EXTRACT(YEAR FROM service_date) = $2
-                  AND status != 'completed'
-                GROUP BY EXTRACT(MONTH FROM service_date)
-            """
-        
-        rows = await conn.fetch(query, telegram_id, year)
-        return {int(row[0]): int(row[1]) for row in rows if row[0]}
-    finally:
-        await conn.close()
+    for telegram_id in telegram_ids:
+        _calendar_cache.pop(("provider", telegram_id), None)
+        _calendar_cache.pop(("client", telegram_id), None)
 
 
-async def get_record_days(telegram_id: int, role: str, year: int, month: int) -> dict[int, int]:
+@_calendar_cached
+@_dedup_inflight
+async def get_record_calendar_tree(telegram_id: int, role: str) -> dict[int, dict[int, dict[int, int]]]:
     """
-    Получает количество записей по дням для заданного месяца.
+    Получает все уровни календаря (годы → месяцы → дни) одним запросом.
+    
+    Дерево загружается целиком, поэтому навигация по годам, месяцам
+    и дням календаря не требует отдельных запросов.
     
     Args:
         telegram_id (int): ID пользователя
         role (str): 'provider' или 'client'
-        year (int): Год
-        month (int): Месяц (1-12)
     
     Returns:
-        dict[int, int]: Словарь {день_месяца: количество_записей}
+        dict[int, dict[int, dict[int, int]]]: {год: {месяц: {день: количество_записей}}}
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         if role == "provider":
             query = """
-                SELECT EXTRACT(DAY FROM service_date), COUNT(*)
+                SELECT service_date, COUNT(*)
                 FROM service_records
                 WHERE provider_telegram_id = $1 
-                  AND EXTRACT(YEAR FROM service_date) = $2
-                  AND EXTRACT(MONTH FROM service_date) = $3
                   AND status != 'completed'
-                GROUP BY EXTRACT(DAY FROM service_date)
+                GROUP BY service_date
             """
         else:  # client
             query = """
-                SELECT EXTRACT(DAY FROM service_date), COUNT(*)
+                SELECT service_date, COUNT(*)
                 FROM service_records
                 WHERE client_telegram_id = $1 
-                  AND EXTRACT(YEAR FROM service_date) = $2
-                  AND EXTRACT(MONTH FROM service_date) = $3
                   AND status != 'completed'
-                GROUP BY EXTRACT(DAY FROM service_date)
+                GROUP BY service_date
             """
         
-        rows = await conn.fetch(query, telegram_id, year, month)
-        return {int(row[0]): int(row[1]) for row in rows if row[0]}
-    finally:
-        await conn.close()
+        rows = await conn.fetch(query, telegram_id)
+        
+        tree = {}
+        for service_date, count in rows:
+            if service_date is None:
+                continue
+            months = tree.setdefault(service_date.year, {})
+            months.setdefault(service_date.month, {})[service_date.day] = int(count)
+        return tree
 
 
 async def get_records_by_date(telegram_id: int, role: str, year: int, month: int, day: int):
@@ -600,8 +883,8 @@ async def get_records_by_date(telegram_id: int, role: str, year: int, month: int
     Returns:
         list[asyncpg.Record]: Список записей на эту дату
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         target_date = date_type(year, month, day)
         
         if role == "provider":
@@ -624,8 +907,6 @@ async def get_records_by_date(telegram_id: int, role: str, year: int, month: int
             """
         
         return await conn.fetch(query, telegram_id, target_date)
-    finally:
-        await conn.close()
 
 
 # ============================================================================
@@ -641,8 +922,8 @@ async def create_notification(telegram_id: int, role: str, message_text: str):
         role (str): 'client' или 'provider'
         message_text (str): Текст уведомления
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             INSERT INTO notifications (user_telegram_id, role, message_text)
@@ -650,8 +931,6 @@ async def create_notification(telegram_id: int, role: str, message_text: str):
             """,
             telegram_id, role, message_text
         )
-    finally:
-        await conn.close()
 
 
 async def get_unread_count(telegram_id: int, role: str) -> int:
@@ -665,8 +944,8 @@ async def get_unread_count(telegram_id: int, role: str) -> int:
     Returns:
         int: Количество непрочитанных уведомлений
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             SELECT COUNT(*) FROM notifications
@@ -675,8 +954,32 @@ async def get_unread_count(telegram_id: int, role: str) -> int:
             telegram_id, role
         )
         return row[0] if row else 0
-    finally:
-        await conn.close()
+
+
+async def get_menu_state(telegram_id: int) -> tuple[bool, int, int]:
+    """
+    Получает одним запросом всё, что нужно для главного меню:
+    зарегистрирован ли пользователь и число непрочитанных уведомлений по ролям.
+    
+    Args:
+        telegram_id (int): ID пользователя
+    
+    Returns:
+        tuple[bool, int, int]: (зарегистрирован, уведомлений клиента, уведомлений мастера)
+    """
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        """
+        SELECT 
+            EXISTS(SELECT 1 FROM users WHERE telegram_id = $1) AS registered,
+            COUNT(*) FILTER (WHERE role = 'client') AS client_count,
+            COUNT(*) FILTER (WHERE role = 'provider') AS provider_count
+        FROM notifications
+        WHERE user_telegram_id = $1 AND is_read = false
+        """,
+        telegram_id
+    )
+    return row["registered"], row["client_count"], row["provider_count"]
 
 
 async def mark_notifications_as_read(telegram_id: int, role: str):
@@ -687,8 +990,8 @@ async def mark_notifications_as_read(telegram_id: int, role: str):
         telegram_id (int): ID пользователя
         role (str): 'client' или 'provider'
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             UPDATE notifications
@@ -697,34 +1000,39 @@ async def mark_notifications_as_read(telegram_id: int, role: str):
             """,
             telegram_id, role
         )
-    finally:
-        await conn.close()
 
 
-async def get_unread_notifications(telegram_id: int, role: str):
+async def get_unread_notifications(telegram_id: int, role: str, max_length: int = 4000):
     """
     Получает список непрочитанных уведомлений.
     
+    Слишком длинные тексты обрезаются на стороне БД (с "..." в конце),
+    поэтому лишние данные не передаются по сети.
+    
     Args:
         telegram_id (int): ID пользователя
         role (str): 'client' или 'provider'
+        max_length (int): Максимальная длина текста уведомления
     
     Returns:
         list[asyncpg.Record]: Список уведомлений с полями message_text, created_at
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         return await conn.fetch(
             """
-            SELECT message_text, created_at
+            SELECT 
+                CASE WHEN length(message_text) > $3 
+                     THEN substring(message_text, 1, $3 - 3) || '...' 
+                     ELSE message_text 
+                END AS message_text, 
+                created_at
             FROM notifications
             WHERE user_telegram_id = $1 AND role = $2 AND is_read = false
             ORDER BY created_at
             """,
-            telegram_id, role
+            telegram_id, role, max_length
         )
-    finally:
-        await conn.close()
 
 
 # ============================================================================
@@ -740,21 +1048,25 @@ async def cancel_service_record(record_id: int, provider_id: int):
         provider_id (int): ID мастера
     
     Returns:
-        bool: True если запись успешно отменена, иначе False
+        tuple[bool, asyncpg.Record | None]: (True, отменённая запись с полями
+            client_telegram_id, service_name, service_date, service_time)
+            если запись успешно отменена, иначе (False, None)
     """
-    conn = await get_db_connection()
-    try:
-        result = await conn.execute(
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        record = await conn.fetchrow(
             """
             UPDATE service_records 
             SET status = 'cancelled', cancelled_at = NOW()
             WHERE id = $1 AND provider_telegram_id = $2 AND status = 'active'
+            RETURNING client_telegram_id, service_name, service_date, service_time
             """,
             record_id, provider_id
         )
-        return result.split()[1] == '1'
-    finally:
-        await conn.close()
+        if record is None:
+            return False, None
+        invalidate_calendar_cache(provider_id, record['client_telegram_id'])
+        return True, record
 
 
 async def complete_service(record_id: int, provider_id: int, duration_minutes: int, rating: bool, notes: str):
@@ -769,55 +1081,57 @@ async def complete_service(record_id: int, provider_id: int, duration_minutes: i
         notes (str): Комментарии
     
     Returns:
-        bool: True если услуга успешно завершена, иначе False
+        asyncpg.Record | None: Завершённая запись (client_telegram_id, service_name)
+            или None, если завершить не удалось
     """
-    conn = await get_db_connection()
-    try:
-        row = await conn.fetchrow(
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        # Проверка владельца/статуса и обновление — одним запросом;
+        # ID клиента нужен для сброса его кэша календаря и уведомления
+        record = await conn.fetchrow(
             """
-            SELECT id FROM service_records 
+            UPDATE service_records SET status = 'completed' 
             WHERE id = $1 AND provider_telegram_id = $2 AND status = 'active'
+            RETURNING client_telegram_id, service_name
             """,
             record_id, provider_id
         )
-        if not row:
-            return False
-        
-        await conn.execute(
-            """
-            UPDATE service_records SET status = 'completed' WHERE id = $1
-            """,
-            record_id
-        )
+        if record is None:
+            return None
         
-        return True
-    finally:
-        await conn.close()
+        invalidate_calendar_cache(provider_id, record['client_telegram_id'])
+        return record
 
 
 async def get_active_records_for_provider(provider_id: int):
     """
     Получает все активные записи мастера для отмены/завершения.
     
+    Имена клиентов подтягиваются тем же запросом (LEFT JOIN users),
+    поэтому для вывода списка дополнительные запросы не нужны.
+    
     Args:
         provider_id (int): ID мастера
     
     Returns:
         list[asyncpg.Record]: Список активных записей
+            (с полями client_first_name, client_last_name)
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         return await conn.fetch(
             """
-            SELECT id, service_name, service_date, service_time, client_telegram_id
-            FROM service_records
-            WHERE provider_telegram_id = $1 AND status = 'active'
-            ORDER BY service_date, service_time
+            SELECT sr.id, sr.service_name, sr.service_date, sr.service_time, 
+                   sr.client_telegram_id, 
+                   u.first_name AS client_first_name, 
+                   u.last_name AS client_last_name
+            FROM service_records sr
+            LEFT JOIN users u ON u.telegram_id = sr.client_telegram_id
+            WHERE sr.provider_telegram_id = $1 AND sr.status = 'active'
+            ORDER BY sr.service_date, sr.service_time
             """,
             provider_id
         )
-    finally:
-        await conn.close()
 
 
 async def get_client_from_record(record_id: int):
@@ -830,8 +1144,8 @@ async def get_client_from_record(record_id: int):
     Returns:
         int: ID клиента или None, если запись не найдена
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             SELECT client_telegram_id FROM service_records WHERE id = $1
@@ -839,8 +1153,6 @@ async def get_client_from_record(record_id: int):
             record_id
         )
         return row['client_telegram_id'] if row else None
-    finally:
-        await conn.close()
 
 
 # ============================================================================
@@ -856,8 +1168,8 @@ async def add_expense(provider_id: int, amount: int, description: str):
         amount (int): Сумма траты в рублях
         description (str): Описание траты
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             INSERT INTO expenses (provider_telegram_id, amount, description)
@@ -865,8 +1177,6 @@ async def add_expense(provider_id: int, amount: int, description: str):
             """,
             provider_id, amount, description
         )
-    finally:
-        await conn.close()
 
 
 async def get_statistics(provider_id: int, period: str, tax_rate: float = 4.0):
@@ -881,8 +1191,8 @@ async def get_statistics(provider_id: int, period: str, tax_rate: float = 4.0):
     Returns:
         dict: Словарь с ключами income, expenses, tax, net, period, tax_updated
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         now = datetime.now().date()
         
         if period == 'day':
@@ -944,8 +1254,6 @@ async def get_statistics(provider_id: int, period: str, tax_rate: float = 4.0):
             'period': period,
             'tax_updated': tax_updated
         }
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ КАЛЕНДАРЯ И ПРОВЕРКИ ЗАПИСЕЙ
@@ -966,8 +1274,8 @@ async def get_records_by_date_for_provider(provider_id: int, year: int, month: i
     Returns:
         list[asyncpg.Record]: Список записей с полями service_time, service_name
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         target_date = date_type(year, month, day)
         query = """
             SELECT service_time, service_name
@@ -978,8 +1286,6 @@ async def get_records_by_date_for_provider(provider_id: int, year: int, month: i
             ORDER BY service_time
         """
         return await conn.fetch(query, provider_id, target_date)
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ СИСТЕМЫ ЗАПРОСОВ ПОВТОРНОЙ ЗАПИСИ
@@ -995,8 +1301,8 @@ async def get_client_providers_for_repeat(client_id: int):
     Returns:
         list[dict]: Список мастеров с услугами и количеством записей
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT 
@@ -1031,8 +1337,6 @@ async def get_client_providers_for_repeat(client_id: int):
         
         return result
     
-    finally:
-        await conn.close()
 
 
 async def search_providers_for_repeat(client_id: int, query: str, search_type: str):
@@ -1047,8 +1351,8 @@ async def search_providers_for_repeat(client_id: int, query: str, search_type: s
     Returns:
         list[dict]: Список найденных мастеров
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         if search_type == 'service':
             rows = await conn.fetch(
                 """
@@ -1108,8 +1412,6 @@ async def search_providers_for_repeat(client_id: int, query: str, search_type: s
         
         return result
     
-    finally:
-        await conn.close()
 
 
 async def create_repeat_request(client_id: int, provider_id: int, service_name: str = None):
@@ -1124,8 +1426,8 @@ async def create_repeat_request(client_id: int, provider_id: int, service_name:
     Returns:
         int: ID созданного запроса
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         provider_info = await conn.fetchrow(
             "SELECT first_name, last_name FROM users WHERE telegram_id = $1",
             provider_id
@@ -1147,88 +1449,85 @@ async def create_repeat_request(client_id: int, provider_id: int, service_name:
         
         return row['id']
     
-    finally:
-        await conn.close()
 
 
 async def get_pending_requests_for_provider(provider_id: int):
     """
     Получает список НОВЫХ запросов для мастера с полной диагностикой.
     """
-    conn = await get_db_connection()
+    pool = await get_db_pool()
     try:
-        # ДИАГНОСТИКА: Логируем входящий ID
-        import logging
-        logging.info(f"🔍 Запрос запросов для мастера ID: {provider_id} (тип: {type(provider_id)})")
+        async with pool.acquire() as conn:
+            # ДИАГНОСТИКА: Логируем входящий ID
+            import logging
+            logging.info(f"🔍 Запрос запросов для мастера ID: {provider_id} (тип: {type(provider_id)})")
         
-        # Проверка 1: Существует ли пользователь с таким ID?
-        user_exists = await conn.fetchval(
-            "SELECT 1 FROM users WHERE telegram_id = $1::BIGINT",
-            provider_id
-        )
-        logging.info(f"👤 Пользователь существует: {'Да' if user_exists else 'Нет'}")
+            # Проверка 1: Существует ли пользователь с таким ID?
+            user_exists = await conn.fetchval(
+                "SELECT 1 FROM users WHERE telegram_id = $1::BIGINT",
+                provider_id
+            )
+            logging.info(f"👤 Пользователь существует: {'Да' if user_exists else 'Нет'}")
         
-        # Проверка 2: Есть ли вообще какие-либо запросы в таблице?
-        total_requests = await conn.fetchval("SELECT COUNT(*) FROM repeat_requests")
-        logging.info(f"📊 Всего запросов в таблице: {total_requests}")
+            # Проверка 2: Есть ли вообще какие-либо запросы в таблице?
+            total_requests = await conn.fetchval("SELECT COUNT(*) FROM repeat_requests")
+            logging.info(f"📊 Всего запросов в таблице: {total_requests}")
         
-        # Проверка 3: Есть ли запросы с любым provider_telegram_id?
-        any_provider_requests = await conn.fetchval(
-            "SELECT COUNT(*) FROM repeat_requests WHERE provider_telegram_id IS NOT NULL"
-        )
-        logging.info(f"📊 Запросов с заполненным provider_telegram_id: {any_provider_requests}")
+            # Проверка 3: Есть ли запросы с любым provider_telegram_id?
+            any_provider_requests = await conn.fetchval(
+                "SELECT COUNT(*) FROM repeat_requests WHERE provider_telegram_id IS NOT NULL"
+            )
+            logging.info(f"📊 Запросов с заполненным provider_telegram_id: {any_provider_requests}")
         
-        # Основной запрос с явным приведением типов
-        rows = await conn.fetch(
-            """
-            SELECT 
-                rr.id as request_id,
-                rr.client_telegram_id,
-                rr.service_name,
-                rr.created_at,
-                rr.status,
-                u.first_name as client_first_name,
-                u.last_name as client_last_name,
-                u.user_code as client_code
-            FROM repeat_requests rr
-            LEFT JOIN users u ON rr.client_telegram_id = u.telegram_id
-            WHERE CAST(rr.provider_telegram_id AS BIGINT) = $1::BIGINT 
-              AND rr.status = 'pending'
-            ORDER BY rr.created_at DESC
-            """,
-            provider_id
-        )
+            # Основной запрос с явным приведением типов
+            rows = await conn.fetch(
+                """
+                SELECT 
+                    rr.id as request_id,
+                    rr.client_telegram_id,
+                    rr.service_name,
+                    rr.created_at,
+                    rr.status,
+                    u.first_name as client_first_name,
+                    u.last_name as client_last_name,
+                    u.user_code as client_code
+                FROM repeat_requests rr
+                LEFT JOIN users u ON rr.client_telegram_id = u.telegram_id
+                WHERE CAST(rr.provider_telegram_id AS BIGINT) = $1::BIGINT 
+                  AND rr.status = 'pending'
+                ORDER BY rr.created_at DESC
+                """,
+                provider_id
+            )
         
-        logging.info(f"✅ Найдено запросов для мастера {provider_id}: {len(rows)}")
+            logging.info(f"✅ Найдено запросов для мастера {provider_id}: {len(rows)}")
         
-        # Детальный лог каждой записи
-        for i, row in enumerate(rows):
-            logging.info(
-                f"  Запись {i+1}: ID={row['request_id']}, "
-                f"client_id={row['client_telegram_id']}, "
-                f"status={row['status']}"
-            )
+            # Детальный лог каждой записи
+            for i, row in enumerate(rows):
+                logging.info(
+                    f"  Запись {i+1}: ID={row['request_id']}, "
+                    f"client_id={row['client_telegram_id']}, "
+                    f"status={row['status']}"
+                )
         
-        result = []
-        for row in rows:
-            client_name = f"{row['client_first_name'] or ''} {row['client_last_name'] or ''}".strip() or "Клиент"
-            result.append({
-                'request_id': row['request_id'],
-                'client_id': row['client_telegram_id'],
-                'client_name': client_name,
-                'client_code': row['client_code'] or "???",
-                'service_name': row['service_name'] or "Не указана",
-                'created_at': row['created_at'],
-                'message_count': 0  # Будет заполнено отдельно
-            })
+            result = []
+            for row in rows:
+                client_name = f"{row['client_first_name'] or ''} {row['client_last_name'] or ''}".strip() or "Клиент"
+                result.append({
+                    'request_id': row['request_id'],
+                    'client_id': row['client_telegram_id'],
+                    'client_name': client_name,
+                    'client_code': row['client_code'] or "???",
+                    'service_name': row['service_name'] or "Не указана",
+                    'created_at': row['created_at'],
+                    'message_count': 0  # Будет заполнено отдельно
+                })
         
-        return result
+            return result
     
     except Exception as e:
         logging.error(f"❌ Ошибка в get_pending_requests_for_provider: {e}", exc_info=True)
         raise
-    finally:
-        await conn.close()
 
 async def get_all_client_requests(client_id: int):
     """
@@ -1236,8 +1535,8 @@ async def get_all_client_requests(client_id: int):
     
     ИСПРАВЛЕНО: Явное приведение client_id к BIGINT в SQL-запросе.
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT 
@@ -1283,8 +1582,6 @@ async def get_all_client_requests(client_id: int):
         
         return result
     
-    finally:
-        await conn.close()
 
 
 async def get_pending_requests_for_client(client_id: int):
@@ -1300,8 +1597,8 @@ async def get_pending_requests_for_client(client_id: int):
     Returns:
         list[dict]: Список запросов с информацией о мастере
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         # ИСПРАВЛЕНО: Убрано условие "AND rr.status IN ('pending', 'accepted')"
         # Клиент должен видеть ВСЕ свои запросы для истории
         rows = await conn.fetch(
@@ -1350,8 +1647,6 @@ async def get_pending_requests_for_client(client_id: int):
         
         return result
     
-    finally:
-        await conn.close()
 
 
 async def add_request_message(request_id: int, sender_role: str, sender_id: int, message_text: str, photo_file_id: str = None):
@@ -1368,8 +1663,8 @@ async def add_request_message(request_id: int, sender_role: str, sender_id: int,
     Returns:
         int: ID созданного сообщения
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             INSERT INTO request_messages 
@@ -1395,8 +1690,6 @@ async def add_request_message(request_id: int, sender_role: str, sender_id: int,
         
         return row['id']
     
-    finally:
-        await conn.close()
 
 
 async def get_request_messages(request_id: int):
@@ -1409,8 +1702,8 @@ async def get_request_messages(request_id: int):
     Returns:
         list[dict]: Список сообщений с информацией об отправителе
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT 
@@ -1441,8 +1734,6 @@ async def get_request_messages(request_id: int):
         
         return result
     
-    finally:
-        await conn.close()
 
 
 async def accept_repeat_request(request_id: int, provider_id: int):
@@ -1456,8 +1747,8 @@ async def accept_repeat_request(request_id: int, provider_id: int):
     Returns:
         bool: True если запрос принят успешно
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         result = await conn.execute(
             """
             UPDATE repeat_requests 
@@ -1469,8 +1760,6 @@ async def accept_repeat_request(request_id: int, provider_id: int):
         )
         return result.split()[1] == '1'
     
-    finally:
-        await conn.close()
 
 
 async def reject_repeat_request(request_id: int, provider_id: int):
@@ -1484,8 +1773,8 @@ async def reject_repeat_request(request_id: int, provider_id: int):
     Returns:
         bool: True если запрос отклонён успешно
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         result = await conn.execute(
             """
             UPDATE repeat_requests 
@@ -1497,22 +1786,61 @@ async def reject_repeat_request(request_id: int, provider_id: int):
         )
         return result.split()[1] == '1'
     
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ ГЕОКОДИРОВАНИЯ И РАСЧЁТА РАССТОЯНИЯ
 # ============================================================================
 
 from math import radians, sin, cos, sqrt, atan2
+from contextlib import AsyncExitStack
+from geopy.adapters import AioHTTPAdapter
+from geopy.extra.rate_limiter import AsyncRateLimiter
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import asyncio
 
-# Глобальный геокодер (с кэшированием для уменьшения запросов)
-_geolocator = Nominatim(user_agent="secretariat_bot")
+# Глобальный асинхронный геокодер: одна HTTP-сессия aiohttp (keep-alive)
+# на все запросы, вместо нового соединения и потока на каждый адрес.
+# Создаётся при первом запросе, закрывается close_geocoder().
+_geocoder_stack: AsyncExitStack | None = None
+_geocode = None  # geocode с ограничением 1 запрос/сек (требование Nominatim)
+_geocoder_lock = asyncio.Lock()
 _geocode_cache = {}  # Кэш: адрес → (широта, долгота)
 
+
+async def _get_geocode():
+    """Возвращает общую функцию геокодирования, создавая сессию при первом вызове"""
+    global _geocoder_stack, _geocode
+    if _geocode is None:
+        # Одна сессия и один ограничитель на всех: параллельные первые
+        # вызовы ждут, пока инициализацию завершит первый из них
+        async with _geocoder_lock:
+            if _geocode is None:
+                _geocoder_stack = AsyncExitStack()
+                geolocator = await _geocoder_stack.enter_async_context(
+                    Nominatim(user_agent="secretariat_bot", adapter_factory=AioHTTPAdapter)
+                )
+                # Без повторов и с пробросом ошибок — их обрабатывает geocode_address
+                _geocode = AsyncRateLimiter(
+                    geolocator.geocode, 
+                    min_delay_seconds=1, 
+                    max_retries=0, 
+                    swallow_exceptions=False
+                )
+    return _geocode
+
+
+async def close_geocoder():
+    """
+    Закрывает HTTP-сессию геокодера (при остановке бота).
+    """
+    global _geocoder_stack, _geocode
+    if _geocoder_stack is not None:
+        await _geocoder_stack.aclose()
+    _geocoder_stack = None
+    _geocode = None
+
+
 async def geocode_address(address: str) -> tuple[float, float] | None:
     """
     Преобразует адрес в координаты (широта, долгота)
@@ -1531,9 +1859,9 @@ async def geocode_address(address: str) -> tuple[float, float] | None:
         return _geocode_cache[address]
     
     try:
-        # Асинхронный вызов геокодера (обёртка над синхронным вызовом)
-        loop = asyncio.get_event_loop()
-        location = await loop.run_in_executor(None, _geolocator.geocode, address)
+        # Асинхронный запрос через общую сессию геокодера
+        geocode = await _get_geocode()
+        location = await geocode(address)
         
         if location:
             coords = (float(location.latitude), float(location.longitude))
@@ -1582,348 +1910,181 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return R * c
 
 
-# ============================================================================
-# ФУНКЦИИ РАБОТЫ С АДРЕСАМИ МАСТЕРОВ
-# ============================================================================
-
-async def search_nearby_providers(client_address: str, service_query: str, limit: int = 10):
+def bounding_box(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
     """
-    Ищет ближайших мастеров по адресу клиента и названию услуги
+    Рассчитывает прямоугольник координат, содержащий круг заданного радиуса
     
-    Алгоритм поиска:
-    1. Геокодируем адрес клиента → получаем координаты
-    2. Ищем мастеров с услугами:
-       а) Точное совпадение названия (регистронезависимое)
-       б) Совпадение по словам (полнотекстовый поиск)
-    3. Рассчитываем расстояние до каждого мастера
-    4. Сортируем по расстоянию, возвращаем топ-10
+    Используется как индексируемый предфильтр перед точным расчётом расстояния.
     
     Args:
-        client_address (str): Адрес клиента для поиска
-        service_query (str): Название услуги для поиска
-        limit (int): Максимальное количество результатов
+        lat (float): Широта центра
+        lon (float): Долгота центра
+        radius_km (float): Радиус в километрах
     
     Returns:
-        list[dict]: Список мастеров с расстоянием и услугами
-    """
-    # Шаг 1: Геокодируем адрес клиента
-    client_coords = await geocode_address(client_address)
-    if not client_coords:
-        raise ValueError(f"Не удалось определить координаты для адреса: {client_address}")
-    
-    client_lat, client_lon = client_coords
-    
-    # Шаг 2: Получаем всех мастеров с подходящими услугами
-    conn = await get_db_connection()
-    try:
-        # Сначала ищем точное совпадение
-        exact_match_query = """
-            SELECT DISTINCT u.telegram_id, u.first_name, u.last_name, u.user_code,
-                   pa.address, pa.latitude, pa.longitude,
-                   ps.service_name, ps.description, ps.price_range
-            FROM users u
-            JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
-            JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
-            WHERE LOWER(ps.service_name) = LOWER($1)
-              AND pa.latitude IS NOT NULL 
-              AND pa.longitude IS NOT NULL
-        """
-        
-        # Затем ищем по словам (полнотекстовый поиск)
-        fuzzy_match_query = """
-            SELECT DISTINCT u.telegram_id, u.first_name, u.last_name, u.user_code,
-                   pa.address, pa.latitude, pa.longitude,
-                   ps.service_name, ps.description, ps.price_range
-            FROM users u
-            JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
-            JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
-            WHERE to_tsvector('russian', ps.service_name || ' ' || COALESCE(ps.description, ''))
-                  @@ to_tsquery('russian', replace($1, ' ', ' & '))
-              AND pa.latitude IS NOT NULL 
-              AND pa.longitude IS NOT NULL
-              AND u.telegram_id NOT IN (
-                  SELECT DISTINCT u2.telegram_id
-                  FROM users u2
-                  JOIN provider_services ps2 ON u2.telegram_id = ps2.provider_telegram_id
-                  WHERE LOWER(ps2.service_name) = LOWER($1)
-              )
-        """
-        
-        # Выполняем оба запроса
-        exact_rows = await conn.fetch(exact_match_query, service_query)
-        fuzzy_rows = await conn.fetch(fuzzy_match_query, service_query)
-        
-        # Объединяем результаты (сначала точные совпадения)
-        all_rows = list(exact_rows) + list(fuzzy_rows)
-        
-        if not all_rows:
-            return []  # Нет мастеров с такими услугами
-        
-        # Шаг 3: Рассчитываем расстояние и сортируем
-        providers_with_distance = []
-        seen_providers = set()  # Для избежания дубликатов
-        
-        for row in all_rows:
-            provider_id = row['telegram_id']
-            
-            # Пропускаем дубликаты
-            if provider_id in seen_providers:
-                continue
-            seen_providers.add(provider_id)
-            
-            # Рассчитываем расстояние
-            distance = calculate_distance(
-                client_lat,
-                client_lon,
-                float(row['latitude']),
-                float(row['longitude'])
-            )
-            
-            # Формируем данные мастера
-            full_name = f"{row['first_name'] or ''} {row['last_name'] or ''}".strip() or "Мастер"
-            
-            providers_with_distance.append({
-                'provider_id': provider_id,
-                'full_name': full_name,
-                'user_code': row['user_code'],
-                'address': row['address'],
-                'distance_km': round(distance, 1),
-                'service_name': row['service_name'],
-                'description': row['description'],
-                'price_range': row['price_range']
-            })
-        
-        # Сортируем по расстоянию
-        providers_with_distance.sort(key=lambda x: x['distance_km'])
-        
-        # Возвращаем топ-N
-        return providers_with_distance[:limit]
-    
-    finally:
-        await conn.close()
-
-
-async def get_provider_addresses(provider_id: int):
+        tuple[float, float, float, float]: (мин. широта, макс. широта, мин. долгота, макс. долгота)
     """
-    Получает все адреса мастера
+    # Один градус широты ≈ 111.2 км; градус долготы короче в cos(широты) раз
+    dlat = radius_km / 111.2
+    dlon = radius_km / (111.2 * max(cos(radians(lat)), 0.01))
+    min_lat, max_lat = lat - dlat, lat + dlat
+    min_lon, max_lon = lon - dlon, lon + dlon
     
-    Returns:
-        list[dict]: Список адресов с координатами
-    """
-    conn = await get_db_connection()
-    try:
-        rows = await conn.fetch(
-            """
-            SELECT id, address, latitude, longitude, is_primary, created_at
-            FROM provider_addresses
-            WHERE provider_telegram_id = $1
-            ORDER BY is_primary DESC, created_at DESC
-            """,
-            provider_id
-        )
-        return [
-            {
-                'id': row['id'],
-                'address': row['address'],
-                'latitude': row['latitude'],
-                'longitude': row['longitude'],
-                'is_primary': row['is_primary'],
-                'created_at': row['created_at']
-            }
-            for row in rows
-        ]
-    finally:
-        await conn.close()
-
-
-async def delete_provider_address(address_id: int, provider_id: int):
-    """
-    Удаляет адрес мастера (только свой)
-    """
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            """
-            DELETE FROM provider_addresses 
-            WHERE id = $1 AND provider_telegram_id = $2
-            """,
-            address_id, provider_id
-        )
-    finally:
-        await conn.close()
+    # Круг пересекает антимеридиан (±180°) или полюс: диапазон долготы
+    # «переворачивается», поэтому долготу не ограничиваем
+    if min_lon < -180 or max_lon > 180 or min_lat < -90 or max_lat > 90:
+        min_lon, max_lon = -180.0, 180.0
+    return max(min_lat, -90.0), min(max_lat, 90.0), min_lon, max_lon
 
 
 # ============================================================================
-# ФУНКЦИИ РАБОТЫ С УСЛУГАМИ МАСТЕРОВ
+# ФУНКЦИЯ ПОИСКА БЛИЖАЙШИХ МАСТЕРОВ
 # ============================================================================
 
-async def add_provider_service(provider_id: int, service_name: str, description: str = None, price_range: str = None):
-    """
-    Добавляет услугу для мастера
-    """
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            """
-            INSERT INTO provider_services 
-            (provider_telegram_id, service_name, description, price_range)
-            VALUES ($1, $2, $3, $4)
-            """,
-            provider_id, service_name.strip(), description, price_range
-        )
-    finally:
-        await conn.close()
-
-
-async def get_provider_services(provider_id: int):
-    """
-    Получает все услуги мастера
-    """
-    conn = await get_db_connection()
-    try:
-        rows = await conn.fetch(
-            """
-            SELECT id, service_name, description, price_range, created_at
-            FROM provider_services
-            WHERE provider_telegram_id = $1
-            ORDER BY created_at DESC
-            """,
-            provider_id
-        )
-        return [
-            {
-                'id': row['id'],
-                'service_name': row['service_name'],
-                'description': row['description'],
-                'price_range': row['price_range'],
-                'created_at': row['created_at']
-            }
-            for row in rows
-        ]
-    finally:
-        await conn.close()
-
+# Радиусы поиска мастеров вокруг клиента (км). Квадрат предфильтра
+# расширяется, пока не найдено limit мастеров; последний шаг (None) —
+# без ограничения расстояния, поэтому результат тот же, что и без
+# предфильтра: ближайшие limit мастеров на любом расстоянии
+NEARBY_SEARCH_RADII_KM = (10, 50, 200, None)
+
+# Сколько всего мастеров с подходящей услугой и адресом с координатами
+# (без ограничения расстояния). Если их нет (опечатка в запросе) — искать
+# нечего; если их не больше limit — в результат попадут все, квадраты не нужны
+_NEARBY_MATCH_COUNT_QUERY = """
+    SELECT COUNT(DISTINCT ps.provider_telegram_id)
+    FROM provider_services ps
+    JOIN provider_addresses pa ON ps.provider_telegram_id = pa.provider_telegram_id
+    WHERE (
+          LOWER(ps.service_name) = LOWER($1)
+          OR to_tsvector('russian', ps.service_name || ' ' || COALESCE(ps.description, ''))
+             @@ to_tsquery('russian', replace($1, ' ', ' & '))
+      )
+      AND pa.latitude IS NOT NULL AND pa.longitude IS NOT NULL
+"""
 
-async def delete_provider_service(service_id: int, provider_id: int):
-    """
-    Удаляет услугу мастера (только свою)
-    """
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            """
-            DELETE FROM provider_services 
-            WHERE id = $1 AND provider_telegram_id = $2
-            """,
-            service_id, provider_id
-        )
-    finally:
-        await conn.close()
+# Запросы мастеров с услугой в квадрате координат ($2..$5)
+_NEARBY_EXACT_QUERY = """
+    SELECT DISTINCT u.telegram_id, u.first_name, u.last_name, u.user_code,
+           pa.address, pa.latitude, pa.longitude,
+           ps.service_name, ps.description, ps.price_range
+    FROM users u
+    JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
+    JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
+    WHERE LOWER(ps.service_name) = LOWER($1)
+      AND pa.latitude BETWEEN $2 AND $3
+      AND pa.longitude BETWEEN $4 AND $5
+"""
 
+_NEARBY_FUZZY_QUERY = """
+    SELECT DISTINCT u.telegram_id, u.first_name, u.last_name, u.user_code,
+           pa.address, pa.latitude, pa.longitude,
+           ps.service_name, ps.description, ps.price_range
+    FROM users u
+    JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
+    JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
+    WHERE to_tsvector('russian', ps.service_name || ' ' || COALESCE(ps.description, ''))
+          @@ to_tsquery('russian', replace($1, ' ', ' & '))
+      AND pa.latitude BETWEEN $2 AND $3
+      AND pa.longitude BETWEEN $4 AND $5
+      AND u.telegram_id NOT IN (
+          SELECT DISTINCT u2.telegram_id
+          FROM users u2
+          JOIN provider_services ps2 ON u2.telegram_id = ps2.provider_telegram_id
+          WHERE LOWER(ps2.service_name) = LOWER($1)
+      )
+"""
 
-# ============================================================================
-# ФУНКЦИЯ ПОИСКА БЛИЖАЙШИХ МАСТЕРОВ
-# ============================================================================
 
-async def search_nearby_providers(client_address: str, service_query: str, limit: int = 10):
+async def search_nearby_providers(
+    client_address: str, 
+    service_query: str, 
+    limit: int = 10, 
+    coords: tuple[float, float] | None = None
+):
     """
     Ищет ближайших мастеров по адресу клиента и названию услуги
     
     Алгоритм поиска:
-    1. Геокодируем адрес клиента → получаем координаты
-    2. Ищем мастеров с услугами:
+    1. Геокодируем адрес клиента → получаем координаты (если не переданы)
+    2. Ищем мастеров с услугами в квадрате вокруг клиента (индекс по координатам):
        а) Точное совпадение названия (регистронезависимое)
        б) Совпадение по словам (полнотекстовый поиск)
-    3. Рассчитываем расстояние до каждого мастера
-    4. Сортируем по расстоянию, возвращаем топ-10
+    3. Рассчитываем точное расстояние; у мастера берём ближайший адрес
+    4. Если в радиусе меньше limit мастеров — расширяем квадрат
+       (NEARBY_SEARCH_RADII_KM, последний шаг без ограничения). Если всего
+       подходящих мастеров не больше limit — сразу ищем без ограничения,
+       если их нет вовсе — не ищем
+    5. Сортируем по расстоянию, возвращаем топ-limit
     
     Args:
         client_address (str): Адрес клиента для поиска
         service_query (str): Название услуги для поиска
         limit (int): Максимальное количество результатов
+        coords (tuple[float, float] | None): Уже известные координаты клиента
     
     Returns:
         list[dict]: Список мастеров с расстоянием и услугами
     """
-    # Шаг 1: Геокодируем адрес клиента
-    client_coords = await geocode_address(client_address)
+    # Шаг 1: Геокодируем адрес клиента (если координаты ещё не известны)
+    client_coords = coords or await geocode_address(client_address)
     if not client_coords:
         raise ValueError(f"Не удалось определить координаты для адреса: {client_address}")
     
     client_lat, client_lon = client_coords
     
-    # Шаг 2: Получаем всех мастеров с подходящими услугами
-    conn = None
-    try:
-        conn = await get_db_connection()
-        
-        # Сначала ищем точное совпадение
-        exact_match_query = """
-            SELECT DISTINCT u.telegram_id, u.first_name, u.last_name, u.user_code,
-                   pa.address, pa.latitude, pa.longitude,
-                   ps.service_name, ps.description, ps.price_range
-            FROM users u
-            JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
-            JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
-            WHERE LOWER(ps.service_name) = LOWER($1)
-              AND pa.latitude IS NOT NULL 
-              AND pa.longitude IS NOT NULL
-        """
-        
-        # Затем ищем по словам (полнотекстовый поиск)
-        fuzzy_match_query = """
-            SELECT DISTINCT u.telegram_id, u.first_name, u.last_name, u.user_code,
-                   pa.address, pa.latitude, pa.longitude,
-                   ps.service_name, ps.description, ps.price_range
-            FROM users u
-            JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
-            JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
-            WHERE to_tsvector('russian', ps.service_name || ' ' || COALESCE(ps.description, ''))
-                  @@ to_tsquery('russian', replace($1, ' ', ' & '))
-              AND pa.latitude IS NOT NULL 
-              AND pa.longitude IS NOT NULL
-              AND u.telegram_id NOT IN (
-                  SELECT DISTINCT u2.telegram_id
-                  FROM users u2
-                  JOIN provider_services ps2 ON u2.telegram_id = ps2.provider_telegram_id
-                  WHERE LOWER(ps2.service_name) = LOWER($1)
-              )
-        """
-        
-        # Выполняем оба запроса
-        exact_rows = await conn.fetch(exact_match_query, service_query)
-        fuzzy_rows = await conn.fetch(fuzzy_match_query, service_query)
-        
-        # Объединяем результаты (сначала точные совпадения)
-        all_rows = list(exact_rows) + list(fuzzy_rows)
-        
-        if not all_rows:
-            return []  # Нет мастеров с такими услугами
-        
-        # Шаг 3: Рассчитываем расстояние и сортируем
-        providers_with_distance = []
-        seen_providers = set()  # Для избежания дубликатов
-        
-        for row in all_rows:
-            provider_id = row['telegram_id']
+    pool = await get_db_pool()
+    try:
+        # Всего подходящих мастеров: больше их в результате не будет
+        total = await pool.fetchval(_NEARBY_MATCH_COUNT_QUERY, service_query)
+        if not total:
+            return []
+        
+        # Мастеров не больше limit — в результат попадут все, квадраты не нужны
+        radii = NEARBY_SEARCH_RADII_KM if total > limit else (None,)
+        for radius in radii:
+            # Шаг 2: Мастера с подходящими услугами в квадрате вокруг клиента
+            if radius is None:
+                box = (-90.0, 90.0, -180.0, 180.0)
+            else:
+                box = bounding_box(client_lat, client_lon, radius)
             
-            # Пропускаем дубликаты
-            if provider_id in seen_providers:
-                continue
-            seen_providers.add(provider_id)
+            # Выполняем оба запроса параллельно (на разных соединениях пула)
+            exact_rows, fuzzy_rows = await asyncio.gather(
+                pool.fetch(_NEARBY_EXACT_QUERY, service_query, *box),
+                pool.fetch(_NEARBY_FUZZY_QUERY, service_query, *box)
+            )
             
-            # Рассчитываем расстояние (проверяем, что координаты не NULL)
-            try:
-                lat = float(row['latitude'])
-                lon = float(row['longitude'])
-                distance = calculate_distance(client_lat, client_lon, lat, lon)
-            except (TypeError, ValueError) as e:
-                logger.warning(f"Ошибка расчёта расстояния для мастера {provider_id}: {e}")
-                continue
+            # Шаг 3: Расстояние до каждого адреса; мастер попадает в результат
+            # один раз — с ближайшим адресом в пределах радиуса
+            nearest = {}
+            for row in (*exact_rows, *fuzzy_rows):
+                provider_id = row['telegram_id']
+                
+                # Рассчитываем расстояние (проверяем, что координаты не NULL)
+                try:
+                    lat = float(row['latitude'])
+                    lon = float(row['longitude'])
+                    distance = calculate_distance(client_lat, client_lon, lat, lon)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"Ошибка расчёта расстояния для мастера {provider_id}: {e}")
+                    continue
+                
+                # Углы квадрата дальше радиуса поиска
+                if radius is not None and distance > radius:
+                    continue
+                
+                if provider_id in nearest and nearest[provider_id][0] <= distance:
+                    continue
+                nearest[provider_id] = (distance, row)
             
-            # Формируем данные мастера
+            # Шаг 4: Достаточно мастеров в радиусе — ближайшие найдены
+            if len(nearest) >= limit or radius is None:
+                break
+        
+        # Шаг 5: Формируем данные мастеров и сортируем по расстоянию
+        providers_with_distance = []
+        for provider_id, (distance, row) in nearest.items():
             full_name = f"{row['first_name'] or ''} {row['last_name'] or ''}".strip() or "Мастер"
-            
             providers_with_distance.append({
                 'provider_id': provider_id,
                 'full_name': full_name,
@@ -1934,8 +2095,6 @@ async def search_nearby_providers(client_address: str, service_query: str, limit
                 'description': row['description'],
                 'price_range': row['price_range']
             })
-        
-        # Сортируем по расстоянию
         providers_with_distance.sort(key=lambda x: x['distance_km'])
         
         # Возвращаем топ-N
@@ -1944,10 +2103,6 @@ async def search_nearby_providers(client_address: str, service_query: str, limit
     except Exception as e:
         logger.error(f"Ошибка поиска ближайших мастеров: {e}")
         raise
-    
-    finally:
-        if conn is not None:
-            await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ РАБОТЫ С АДРЕСАМИ МАСТЕРОВ
@@ -1975,8 +2130,8 @@ async def add_provider_address(provider_id: int, address: str, latitude: float =
             # Если геокодирование не удалось — сохраняем без координат
             latitude = longitude = None
     
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         # Если устанавливаем как основной — снимаем флаг с других адресов
         if is_primary:
             await conn.execute(
@@ -1997,8 +2152,6 @@ async def add_provider_address(provider_id: int, address: str, latitude: float =
             """,
             provider_id, address, latitude, longitude, is_primary
         )
-    finally:
-        await conn.close()
 
 
 async def get_provider_addresses(provider_id: int):
@@ -2008,8 +2161,8 @@ async def get_provider_addresses(provider_id: int):
     Returns:
         list[dict]: Список адресов с координатами
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT id, address, latitude, longitude, is_primary, created_at
@@ -2030,16 +2183,14 @@ async def get_provider_addresses(provider_id: int):
             }
             for row in rows
         ]
-    finally:
-        await conn.close()
 
 
 async def delete_provider_address(address_id: int, provider_id: int):
     """
     Удаляет адрес мастера (только свой)
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             DELETE FROM provider_addresses 
@@ -2047,8 +2198,6 @@ async def delete_provider_address(address_id: int, provider_id: int):
             """,
             address_id, provider_id
         )
-    finally:
-        await conn.close()
 
 
 # ============================================================================
@@ -2059,8 +2208,8 @@ async def add_provider_service(provider_id: int, service_name: str, description:
     """
     Добавляет услугу для мастера
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             INSERT INTO provider_services 
@@ -2069,16 +2218,14 @@ async def add_provider_service(provider_id: int, service_name: str, description:
             """,
             provider_id, service_name.strip(), description, price_range
         )
-    finally:
-        await conn.close()
 
 
 async def get_provider_services(provider_id: int):
     """
     Получает все услуги мастера
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT id, service_name, description, price_range, created_at
@@ -2098,16 +2245,14 @@ async def get_provider_services(provider_id: int):
             }
             for row in rows
         ]
-    finally:
-        await conn.close()
 
 
 async def delete_provider_service(service_id: int, provider_id: int):
     """
     Удаляет услугу мастера (только свою)
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             DELETE FROM provider_services 
@@ -2115,61 +2260,11 @@ async def delete_provider_service(service_id: int, provider_id: int):
             """,
             service_id, provider_id
         )
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ РАБОТЫ С ОТЗЫВАМИ И РЕЙТИНГАМИ
 # ============================================================================
 
-async def create_provider_review(provider_id: int, client_id: int, service_record_id: int, rating: int, comment: str = None):
-    """
-    Создаёт отзыв о мастере после завершения услуги
-    
-    Автоматически обновляет кэшированные значения рейтинга в таблице users.
-    
-    Args:
-        provider_id (int): ID мастера
-        client_id (int): ID клиента
-        service_record_id (int): ID записи на услугу
-        rating (int): Оценка от 1 до 5
-        comment (str, optional): Текстовый комментарий
-    """
-    conn = await get_db_connection()
-    try:
-        # Создаём отзыв
-        await conn.execute(
-            """
-            INSERT INTO provider_reviews 
-            (provider_telegram_id, client_telegram_id, service_record_id, rating, comment)
-            VALUES ($1, $2, $3, $4, $5)
-            """,
-            provider_id, client_id, service_record_id, rating, comment
-        )
-        
-        # Обновляем кэшированные значения рейтинга
-        await conn.execute(
-            """
-            UPDATE users u
-            SET 
-                average_rating = (
-                    SELECT AVG(rating) 
-                    FROM provider_reviews 
-                    WHERE provider_telegram_id = $1
-                ),
-                review_count = (
-                    SELECT COUNT(*) 
-                    FROM provider_reviews 
-                    WHERE provider_telegram_id = $1
-                )
-            WHERE telegram_id = $1
-            """,
-            provider_id
-        )
-    finally:
-        await conn.close()
-
-
 async def get_provider_reviews(provider_id: int, limit: int = 10):
     """
     Получает отзывы о мастере с информацией о клиентах
@@ -2179,316 +2274,86 @@ async def get_provider_reviews(provider_id: int, limit: int = 10):
         limit (int): Максимальное количество отзывов
     
     Returns:
-        list[dict]: Список отзывов с рейтингом, комментарием и данными клиента
-    """
-    conn = await get_db_connection()
-    try:
-        rows = await conn.fetch(
-            """
-            SELECT 
-                pr.rating,
-                pr.comment,
-                pr.created_at,
-                u.first_name as client_first_name,
-                u.last_name as client_last_name,
-                u.user_code as client_code
-            FROM provider_reviews pr
-            JOIN users u ON pr.client_telegram_id = u.telegram_id
-            WHERE pr.provider_telegram_id = $1
-            ORDER BY pr.created_at DESC
-            LIMIT $2
-            """,
-            provider_id, limit
-        )
-        
-        return [
-            {
-                'rating': row['rating'],
-                'comment': row['comment'] or 'Без комментария',
-                'created_at': row['created_at'],
-                'client_name': f"{row['client_first_name'] or ''} {row['client_last_name'] or ''}".strip() or "Клиент",
-                'client_code': row['client_code']
-            }
-            for row in rows
-        ]
-    finally:
-        await conn.close()
-
-
-async def get_provider_rating_summary(provider_id: int):
-    """
-    Получает сводку рейтинга мастера
-    
-    Возвращает среднюю оценку, количество отзывов и клиентскую базу (завершённые записи).
-    
-    Args:
-        provider_id (int): ID мастера
-    
-    Returns:
-        dict: Сводка с полями:
-            - average_rating: средняя оценка (0.0 если нет отзывов)
-            - review_count: количество отзывов
-            - client_base: количество уникальных клиентов
-            - completed_services: количество завершённых услуг
-    """
-    conn = await get_db_connection()
-    try:
-        # Получаем кэшированные значения из таблицы users
-        row = await conn.fetchrow(
-            """
-            SELECT average_rating, review_count
-            FROM users
-            WHERE telegram_id = $1
-            """,
-            provider_id
-        )
-        
-        average_rating = float(row['average_rating']) if row and row['average_rating'] else 0.0
-        review_count = int(row['review_count']) if row and row['review_count'] else 0
-        
-        # Получаем клиентскую базу (уникальные клиенты)
-        client_base_row = await conn.fetchrow(
-            """
-            SELECT 
-                COUNT(DISTINCT client_telegram_id) as unique_clients,
-                COUNT(*) as completed_services
-            FROM service_records
-            WHERE provider_telegram_id = $1 AND status = 'completed'
-            """,
-            provider_id
-        )
-        
-        unique_clients = int(client_base_row['unique_clients']) if client_base_row else 0
-        completed_services = int(client_base_row['completed_services']) if client_base_row else 0
-        
-        return {
-            'average_rating': average_rating,
-            'review_count': review_count,
-            'client_base': unique_clients,
-            'completed_services': completed_services
-        }
-    
-    finally:
-        await conn.close()
-
-
-# ============================================================================
-# ФУНКЦИИ РАБОТЫ С ФОТО ПРОФИЛЯ
-# ============================================================================
-
-async def update_provider_profile_photo(provider_id: int, photo_file_id: str):
-    """
-    Обновляет фото профиля мастера
-    
-    Args:
-        provider_id (int): ID мастера
-        photo_file_id (str): file_id фотографии в Telegram
-    """
-    conn = await get_db_connection()
-    try:
-        await conn.execute(
-            """
-            UPDATE users 
-            SET profile_photo_file_id = $1 
-            WHERE telegram_id = $2
-            """,
-            photo_file_id, provider_id
-        )
-    finally:
-        await conn.close()
-
-
-async def get_provider_profile_photo(provider_id: int):
-    """
-    Получает фото профиля мастера
-    
-    Args:
-        provider_id (int): ID мастера
-    
-    Returns:
-        str | None: file_id фотографии или None
-    """
-    conn = await get_db_connection()
-    try:
-        row = await conn.fetchrow(
-            """
-            SELECT profile_photo_file_id 
-            FROM users 
-            WHERE telegram_id = $1
-            """,
-            provider_id
-        )
-        return row['profile_photo_file_id'] if row else None
-    finally:
-        await conn.close()
-
-
-# ============================================================================
-# ОБНОВЛЁННАЯ ФУНКЦИЯ ПОИСКА С РЕЙТИНГОМ
-# ============================================================================
-
-async def search_nearby_providers_with_rating(client_address: str, service_query: str, limit: int = 10):
-    """
-    Расширенный поиск ближайших мастеров с рейтингом и статистикой
-    
-    Возвращает дополнительно:
-    - Среднюю оценку мастера
-    - Количество отзывов
-    - Размер клиентской базы
-    
-    Args:
-        client_address (str): Адрес клиента
-        service_query (str): Название услуги
-        limit (int): Максимум результатов
-    
-    Returns:
-        list[dict]: Мастера с полной статистикой
-    """
-    # Геокодируем адрес клиента
-    client_coords = await geocode_address(client_address)
-    if not client_coords:
-        raise ValueError(f"Не удалось определить координаты для адреса: {client_address}")
-    
-    client_lat, client_lon = client_coords
-    
-    conn = await get_db_connection()
-    try:
-        # Поиск мастеров с услугами и статистикой рейтинга
-        query = """
-            SELECT 
-                u.telegram_id,
-                u.first_name,
-                u.last_name,
-                u.user_code,
-                u.average_rating,
-                u.review_count,
-                pa.address,
-                pa.latitude,
-                pa.longitude,
-                ps.service_name,
-                ps.description,
-                ps.price_range,
-                -- Клиентская база: уникальные клиенты
-                (SELECT COUNT(DISTINCT client_telegram_id) 
-                 FROM service_records 
-                 WHERE provider_telegram_id = u.telegram_id 
-                   AND status = 'completed') as client_base,
-                -- Завершённые услуги
-                (SELECT COUNT(*) 
-                 FROM service_records 
-                 WHERE provider_telegram_id = u.telegram_id 
-                   AND status = 'completed') as completed_services
-            FROM users u
-            JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
-            JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
-            WHERE LOWER(ps.service_name) LIKE LOWER($1)
-              AND pa.latitude IS NOT NULL 
-              AND pa.longitude IS NOT NULL
-            ORDER BY 
-                -- Сначала по расстоянию, затем по рейтингу
-                ( 6371 * acos(
-                    cos(radians($2)) * cos(radians(pa.latitude)) * 
-                    cos(radians(pa.longitude) - radians($3)) + 
-                    sin(radians($2)) * sin(radians(pa.latitude))
-                )) ASC,
-                u.average_rating DESC NULLS LAST,
-                u.review_count DESC
-            LIMIT $4
-        """
-        
-        # Выполняем поиск (с использованием триграмм для поиска по словам)
-        rows = await conn.fetch(
-            query,
-            f"%{service_query}%",
-            client_lat,
-            client_lon,
-            limit
-        )
-        
-        if not rows:
-            # Повторяем поиск с полнотекстовым поиском
-            fuzzy_query = """
-                SELECT 
-                    u.telegram_id,
-                    u.first_name,
-                    u.last_name,
-                    u.user_code,
-                    u.average_rating,
-                    u.review_count,
-                    pa.address,
-                    pa.latitude,
-                    pa.longitude,
-                    ps.service_name,
-                    ps.description,
-                    ps.price_range,
-                    (SELECT COUNT(DISTINCT client_telegram_id) 
-                     FROM service_records 
-                     WHERE provider_telegram_id = u.telegram_id 
-                       AND status = 'completed') as client_base,
-                    (SELECT COUNT(*) 
-                     FROM service_records 
-                     WHERE provider_telegram_id = u.telegram_id 
-                       AND status = 'completed') as completed_services
-                FROM users u
-                JOIN provider_services ps ON u.telegram_id = ps.provider_telegram_id
-                JOIN provider_addresses pa ON u.telegram_id = pa.provider_telegram_id
-                WHERE to_tsvector('russian', ps.service_name || ' ' || COALESCE(ps.description, ''))
-                      @@ to_tsquery('russian', replace($1, ' ', ' & '))
-                  AND pa.latitude IS NOT NULL 
-                  AND pa.longitude IS NOT NULL
-                ORDER BY 
-                    ( 6371 * acos(
-                        cos(radians($2)) * cos(radians(pa.latitude)) * 
-                        cos(radians(pa.longitude) - radians($3)) + 
-                        sin(radians($2)) * sin(radians(pa.latitude))
-                    )) ASC,
-                    u.average_rating DESC NULLS LAST,
-                    u.review_count DESC
-                LIMIT $4
+        list[dict]: Список отзывов с рейтингом, комментарием и данными клиента
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
             """
-            
-            rows = await conn.fetch(
-                fuzzy_query,
-                service_query,
-                client_lat,
-                client_lon,
-                limit
-            )
-        
-        # Формируем результат с расстоянием
-        providers = []
-        for row in rows:
-            try:
-                distance = calculate_distance(
-                    client_lat,
-                    client_lon,
-                    float(row['latitude']),
-                    float(row['longitude'])
-                )
-                
-                full_name = f"{row['first_name'] or ''} {row['last_name'] or ''}".strip() or "Мастер"
-                
-                providers.append({
-                    'provider_id': row['telegram_id'],
-                    'full_name': full_name,
-                    'user_code': row['user_code'],
-                    'address': row['address'],
-                    'distance_km': round(distance, 1),
-                    'service_name': row['service_name'],
-                    'description': row['description'],
-                    'price_range': row['price_range'],
-                    'average_rating': float(row['average_rating']) if row['average_rating'] else 0.0,
-                    'review_count': int(row['review_count']) if row['review_count'] else 0,
-                    'client_base': int(row['client_base']) if row['client_base'] else 0,
-                    'completed_services': int(row['completed_services']) if row['completed_services'] else 0
-                })
-            except (TypeError, ValueError):
-                continue  # Пропускаем записи с некорректными координатами
+            SELECT 
+                pr.rating,
+                pr.comment,
+                pr.created_at,
+                u.first_name as client_first_name,
+                u.last_name as client_last_name,
+                u.user_code as client_code
+            FROM provider_reviews pr
+            JOIN users u ON pr.client_telegram_id = u.telegram_id
+            WHERE pr.provider_telegram_id = $1
+            ORDER BY pr.created_at DESC
+            LIMIT $2
+            """,
+            provider_id, limit
+        )
         
-        return providers[:limit]
+        return [
+            {
+                'rating': row['rating'],
+                'comment': row['comment'] or 'Без комментария',
+                'created_at': row['created_at'],
+                'client_name': f"{row['client_first_name'] or ''} {row['client_last_name'] or ''}".strip() or "Клиент",
+                'client_code': row['client_code']
+            }
+            for row in rows
+        ]
+
+
+# ============================================================================
+# ФУНКЦИИ РАБОТЫ С ФОТО ПРОФИЛЯ
+# ============================================================================
+
+async def update_provider_profile_photo(provider_id: int, photo_file_id: str):
+    """
+    Обновляет фото профиля мастера
+    
+    Args:
+        provider_id (int): ID мастера
+        photo_file_id (str): file_id фотографии в Telegram
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            UPDATE users 
+            SET profile_photo_file_id = $1 
+            WHERE telegram_id = $2
+            """,
+            photo_file_id, provider_id
+        )
+
+
+async def get_provider_profile_photo(provider_id: int):
+    """
+    Получает фото профиля мастера
+    
+    Args:
+        provider_id (int): ID мастера
     
-    finally:
-        await conn.close()
+    Returns:
+        str | None: file_id фотографии или None
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT profile_photo_file_id 
+            FROM users 
+            WHERE telegram_id = $1
+            """,
+            provider_id
+        )
+        return row['profile_photo_file_id'] if row else None
+
 
 # ============================================================================
 # РАСШИРЕННЫЙ ПОИСК МАСТЕРОВ С РЕЙТИНГОМ И СТАТИСТИКОЙ
@@ -2518,8 +2383,8 @@ async def search_nearby_providers_with_rating(client_address: str, service_query
     
     client_lat, client_lon = client_coords
     
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         # Поиск мастеров с услугами и статистикой рейтинга (точное совпадение)
         exact_query = """
             SELECT 
@@ -2653,8 +2518,6 @@ async def search_nearby_providers_with_rating(client_address: str, service_query
         
         return providers[:limit]
     
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ РАБОТЫ С ФОТОГРАФИЯМИ УСЛУГ
@@ -2669,8 +2532,8 @@ async def add_service_photo(record_id: int, photo_file_id: str, caption: str = N
         photo_file_id (str): file_id фотографии в Telegram
         caption (str, optional): Подпись к фотографии
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             INSERT INTO service_photos (service_record_id, photo_file_id, caption)
@@ -2678,8 +2541,34 @@ async def add_service_photo(record_id: int, photo_file_id: str, caption: str = N
             """,
             record_id, photo_file_id, caption
         )
-    finally:
-        await conn.close()
+
+
+async def add_service_photos_bulk(record_id: int, items: list[tuple[str, str]]):
+    """
+    Добавляет несколько фотографий к услуге одним запросом
+    
+    Args:
+        record_id (int): ID записи на услугу
+        items (list[tuple[str, str]]): Пары (file_id фотографии, подпись)
+    """
+    if not items:
+        return
+    if len(items) == 1:
+        photo_file_id, caption = items[0]
+        await add_service_photo(record_id, photo_file_id, caption)
+        return
+    
+    file_ids, captions = zip(*items)
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO service_photos (service_record_id, photo_file_id, caption)
+            SELECT $1, photo_file_id, caption
+            FROM unnest($2::text[], $3::text[]) AS t(photo_file_id, caption)
+            """,
+            record_id, list(file_ids), list(captions)
+        )
 
 
 async def get_service_photos(record_id: int):
@@ -2692,8 +2581,8 @@ async def get_service_photos(record_id: int):
     Returns:
         list[dict]: Список фотографий с метаданными
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT photo_file_id, caption, uploaded_at
@@ -2712,8 +2601,6 @@ async def get_service_photos(record_id: int):
             }
             for row in rows
         ]
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ РАБОТЫ С ОЖИДАЮЩИМИ ОЦЕНКАМИ
@@ -2731,8 +2618,8 @@ async def create_pending_review(client_id: int, provider_id: int, record_id: int
         record_id (int): ID записи на услугу
         service_name (str): Название услуги
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             INSERT INTO pending_reviews 
@@ -2741,8 +2628,6 @@ async def create_pending_review(client_id: int, provider_id: int, record_id: int
             """,
             client_id, provider_id, record_id, service_name
         )
-    finally:
-        await conn.close()
 
 
 async def get_pending_reviews(client_id: int):
@@ -2755,8 +2640,8 @@ async def get_pending_reviews(client_id: int):
     Returns:
         list[dict]: Список ожидающих оценок
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT id, provider_telegram_id, service_record_id, service_name, created_at
@@ -2777,8 +2662,6 @@ async def get_pending_reviews(client_id: int):
             }
             for row in rows
         ]
-    finally:
-        await conn.close()
 
 
 async def delete_pending_review(review_id: int, client_id: int):
@@ -2789,8 +2672,8 @@ async def delete_pending_review(review_id: int, client_id: int):
         review_id (int): ID записи в pending_reviews
         client_id (int): ID клиента (для безопасности)
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         await conn.execute(
             """
             DELETE FROM pending_reviews 
@@ -2798,8 +2681,6 @@ async def delete_pending_review(review_id: int, client_id: int):
             """,
             review_id, client_id
         )
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ ПРОСМОТРА ПРОФИЛЯ МАСТЕРА
@@ -2815,8 +2696,8 @@ async def get_provider_profile(provider_id: int):
     Returns:
         dict: Полная информация о мастере или None если не найден
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         # Основная информация о мастере
         user_row = await conn.fetchrow(
             """
@@ -2929,8 +2810,6 @@ async def get_provider_profile(provider_id: int):
             ]
         }
     
-    finally:
-        await conn.close()
 
 
 async def get_client_provider_history(client_id: int):
@@ -2945,8 +2824,8 @@ async def get_client_provider_history(client_id: int):
     Returns:
         list[dict]: Список мастеров из истории
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         rows = await conn.fetch(
             """
             SELECT 
@@ -2985,8 +2864,6 @@ async def get_client_provider_history(client_id: int):
         
         return result
     
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ РАБОТЫ С ОТЗЫВАМИ И РЕЙТИНГАМИ
@@ -3005,8 +2882,8 @@ async def create_provider_review(provider_id: int, client_id: int, service_recor
         rating (int): Оценка от 1 до 5
         comment (str, optional): Текстовый комментарий
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         # Создаём отзыв
         await conn.execute(
             """
@@ -3036,8 +2913,6 @@ async def create_provider_review(provider_id: int, client_id: int, service_recor
             """,
             provider_id
         )
-    finally:
-        await conn.close()
 
 
 async def get_provider_rating_summary(provider_id: int):
@@ -3056,8 +2931,8 @@ async def get_provider_rating_summary(provider_id: int):
             - client_base: количество уникальных клиентов
             - completed_services: количество завершённых услуг
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         # Получаем кэшированные значения из таблицы users
         row = await conn.fetchrow(
             """
@@ -3093,142 +2968,45 @@ async def get_provider_rating_summary(provider_id: int):
             'completed_services': completed_services
         }
     
-    finally:
-        await conn.close()
 
 # ============================================================================
-# ФУНКЦИИ РАБОТЫ С ОТЗЫВАМИ И РЕЙТИНГАМИ
+# ФУНКЦИИ РАБОТЫ С НАЛОГОВЫМИ СТАВКАМИ
 # ============================================================================
 
-async def create_provider_review(provider_id: int, client_id: int, service_record_id: int, rating: int, comment: str = None):
-    """
-    Создаёт отзыв о мастере после завершения услуги
-    
-    Автоматически обновляет кэшированные значения рейтинга в таблице users.
-    
-    Args:
-        provider_id (int): ID мастера
-        client_id (int): ID клиента
-        service_record_id (int): ID записи на услугу
-        rating (int): Оценка от 1 до 5
-        comment (str, optional): Текстовый комментарий
-    """
-    conn = await get_db_connection()
-    try:
-        # Создаём отзыв
-        await conn.execute(
-            """
-            INSERT INTO provider_reviews 
-            (provider_telegram_id, client_telegram_id, service_record_id, rating, comment)
-            VALUES ($1, $2, $3, $4, $5)
-            """,
-            provider_id, client_id, service_record_id, rating, comment
-        )
-        
-        # Обновляем кэшированные значения рейтинга
-        await conn.execute(
-            """
-            UPDATE users u
-            SET 
-                average_rating = (
-                    SELECT AVG(rating) 
-                    FROM provider_reviews 
-                    WHERE provider_telegram_id = $1
-                ),
-                review_count = (
-                    SELECT COUNT(*) 
-                    FROM provider_reviews 
-                    WHERE provider_telegram_id = $1
-                )
-            WHERE telegram_id = $1
-            """,
-            provider_id
-        )
-    finally:
-        await conn.close()
-
-
-async def get_provider_rating_summary(provider_id: int):
-    """
-    Получает сводку рейтинга мастера
-    
-    Возвращает среднюю оценку, количество отзывов и клиентскую базу.
-    
-    Args:
-        provider_id (int): ID мастера
-    
-    Returns:
-        dict: Сводка с полями:
-            - average_rating: средняя оценка (0.0 если нет отзывов)
-            - review_count: количество отзывов
-            - client_base: количество уникальных клиентов
-            - completed_services: количество завершённых услуг
-    """
-    conn = await get_db_connection()
-    try:
-        # Получаем кэшированные значения из таблицы users
-        row = await conn.fetchrow(
-            """
-            SELECT average_rating, review_count
-            FROM users
-            WHERE telegram_id = $1
-            """,
-            provider_id
-        )
-        
-        average_rating = float(row['average_rating']) if row and row['average_rating'] else 0.0
-        review_count = int(row['review_count']) if row and row['review_count'] else 0
-        
-        # Получаем клиентскую базу (уникальные клиенты)
-        client_base_row = await conn.fetchrow(
-            """
-            SELECT 
-                COUNT(DISTINCT client_telegram_id) as unique_clients,
-                COUNT(*) as completed_services
-            FROM service_records
-            WHERE provider_telegram_id = $1 AND status = 'completed'
-            """,
-            provider_id
-        )
-        
-        unique_clients = int(client_base_row['unique_clients']) if client_base_row else 0
-        completed_services = int(client_base_row['completed_services']) if client_base_row else 0
-        
-        return {
-            'average_rating': average_rating,
-            'review_count': review_count,
-            'client_base': unique_clients,
-            'completed_services': completed_services
-        }
-    
-    finally:
-        await conn.close()
+# Кэш налоговых ставок: тип налога → (ставка, момент загрузки по time.monotonic)
+# Ставки меняются редко, поэтому достаточно обновлять их раз в несколько минут
+_tax_cache = {}
+TAX_CACHE_TTL = 300  # секунд
 
-# ============================================================================
-# ФУНКЦИИ РАБОТЫ С НАЛОГОВЫМИ СТАВКАМИ
-# ============================================================================
 
 async def get_tax_rate(tax_type: str) -> float:
     """
     Получает налоговую ставку из БД
     
+    Результат кэшируется в памяти процесса на TAX_CACHE_TTL секунд.
+    
     Args:
         tax_type (str): Тип налога ('npd_individual', 'npd_entity', 'nds')
     
     Returns:
         float: Ставка в процентах или 4.0 (дефолт) если не найдена
     """
-    conn = await get_db_connection()
-    try:
+    now = time.monotonic()
+    cached = _tax_cache.get(tax_type)
+    if cached and now - cached[1] < TAX_CACHE_TTL:
+        return cached[0]
+    
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         row = await conn.fetchrow(
             """
             SELECT rate_percent FROM tax_rates WHERE tax_type = $1
             """,
             tax_type
         )
-        return float(row['rate_percent']) if row else 4.0  # Дефолтная ставка НПД 4%
-    finally:
-        await conn.close()
+        rate = float(row['rate_percent']) if row else 4.0  # Дефолтная ставка НПД 4%
+        _tax_cache[tax_type] = (rate, now)
+        return rate
 
 # ============================================================================
 # ФУНКЦИИ ИСТОРИИ ЗАПИСЕЙ (КЛИЕНТ И МАСТЕР)
@@ -3246,14 +3024,13 @@ async def get_client_history_for_month(client_id: int):
     Returns:
         list[dict]: Список мастеров с услугами и количеством записей
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         now = datetime.now().date()
         start_of_month = now.replace(day=1)
         
-        # Получаем все записи клиента за месяц
-        records = await conn.fetch(
-            """
+        # Все записи клиента за месяц
+        query = """
             SELECT 
                 sr.provider_telegram_id,
                 sr.service_name,
@@ -3266,29 +3043,27 @@ async def get_client_history_for_month(client_id: int):
               AND sr.service_date >= $2
               AND sr.status IN ('active', 'completed')
             ORDER BY sr.service_date DESC, sr.service_time DESC
-            """,
-            client_id, start_of_month
-        )
+        """
         
-        # Группируем по мастерам
+        # Группируем по мастерам, читая записи серверным курсором порциями
+        # (вся выборка не буферизуется в памяти перед обработкой)
         providers_summary = {}
-        for record in records:
-            provider_id = record['provider_telegram_id']
-            if provider_id not in providers_summary:
-                providers_summary[provider_id] = {
-                    'first_name': record['first_name'] or '',
-                    'last_name': record['last_name'] or '',
-                    'user_code': record['user_code'],
-                    'services': {},
-                    'total_records': 0
-                }
-            
-            # Считаем услуги
-            service_name = record['service_name']
-            if service_name not in providers_summary[provider_id]['services']:
-                providers_summary[provider_id]['services'][service_name] = 0
-            providers_summary[provider_id]['services'][service_name] += 1
-            providers_summary[provider_id]['total_records'] += 1
+        async with conn.transaction():
+            async for record in conn.cursor(query, client_id, start_of_month, prefetch=256):
+                provider_id = record['provider_telegram_id']
+                summary = providers_summary.get(provider_id)
+                if summary is None:
+                    summary = providers_summary[provider_id] = {
+                        'first_name': record['first_name'] or '',
+                        'last_name': record['last_name'] or '',
+                        'user_code': record['user_code'],
+                        'services': defaultdict(int),
+                        'total_records': 0
+                    }
+                
+                # Считаем услуги
+                summary['services'][record['service_name']] += 1
+                summary['total_records'] += 1
         
         # Преобразуем в список
         result = []
@@ -3298,14 +3073,12 @@ async def get_client_history_for_month(client_id: int):
                 'provider_id': provider_id,
                 'full_name': full_name,
                 'user_code': data['user_code'],
-                'services': data['services'],
+                'services': dict(data['services']),
                 'total_records': data['total_records']
             })
         
         return sorted(result, key=lambda x: x['total_records'], reverse=True)
     
-    finally:
-        await conn.close()
 
 
 async def get_provider_client_history_for_month(provider_id: int):
@@ -3320,14 +3093,13 @@ async def get_provider_client_history_for_month(provider_id: int):
     Returns:
         list[dict]: Список клиентов с услугами и количеством записей
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         now = datetime.now().date()
         start_of_month = now.replace(day=1)
         
-        # Получаем все записи мастера за месяц
-        records = await conn.fetch(
-            """
+        # Все записи мастера за месяц
+        query = """
             SELECT 
                 sr.client_telegram_id,
                 sr.service_name,
@@ -3340,29 +3112,26 @@ async def get_provider_client_history_for_month(provider_id: int):
               AND sr.service_date >= $2
               AND sr.status IN ('active', 'completed')
             ORDER BY sr.service_date DESC, sr.service_time DESC
-            """,
-            provider_id, start_of_month
-        )
+        """
         
-        # Группируем по клиентам
+        # Группируем по клиентам, читая записи серверным курсором порциями
         clients_summary = {}
-        for record in records:
-            client_id = record['client_telegram_id']
-            if client_id not in clients_summary:
-                clients_summary[client_id] = {
-                    'first_name': record['first_name'] or '',
-                    'last_name': record['last_name'] or '',
-                    'user_code': record['user_code'],
-                    'services': {},
-                    'total_records': 0
-                }
-            
-            # Считаем услуги
-            service_name = record['service_name']
-            if service_name not in clients_summary[client_id]['services']:
-                clients_summary[client_id]['services'][service_name] = 0
-            clients_summary[client_id]['services'][service_name] += 1
-            clients_summary[client_id]['total_records'] += 1
+        async with conn.transaction():
+            async for record in conn.cursor(query, provider_id, start_of_month, prefetch=256):
+                client_id = record['client_telegram_id']
+                summary = clients_summary.get(client_id)
+                if summary is None:
+                    summary = clients_summary[client_id] = {
+                        'first_name': record['first_name'] or '',
+                        'last_name': record['last_name'] or '',
+                        'user_code': record['user_code'],
+                        'services': defaultdict(int),
+                        'total_records': 0
+                    }
+                
+                # Считаем услуги
+                summary['services'][record['service_name']] += 1
+                summary['total_records'] += 1
         
         # Преобразуем в список
         result = []
@@ -3372,14 +3141,12 @@ async def get_provider_client_history_for_month(provider_id: int):
                 'client_id': client_id,
                 'full_name': full_name,
                 'user_code': data['user_code'],
-                'services': data['services'],
+                'services': dict(data['services']),
                 'total_records': data['total_records']
             })
         
         return sorted(result, key=lambda x: x['total_records'], reverse=True)
     
-    finally:
-        await conn.close()
 
 # ============================================================================
 # ФУНКЦИИ УЧЁТА ТРАТ МАСТЕРА
@@ -3395,8 +3162,8 @@ async def get_expenses_for_month(provider_id: int):
     Returns:
         list[dict]: Список трат с полями amount, description, created_at
     """
-    conn = await get_db_connection()
-    try:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
         now = datetime.now()
         start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
@@ -3409,5 +3176,3 @@ async def get_expenses_for_month(provider_id: int):
             """,
             provider_id, start_of_month
         )
-    finally:
-        await conn.close()
\ No newline at end of file
@@ -3,12 +3,125 @@ email_utils.py
 ==============
 Модуль для отправки email-сообщений через SMTP.
 Используется для отправки кодов подтверждения при сбросе пароля.
+
+SMTP-сессия (TCP + STARTTLS + AUTH) открывается один раз и переиспользуется
+для всех писем; при обрыве соединение восстанавливается автоматически.
+
+Письма с кодами отправляются фоновым обработчиком из очереди: бот отвечает
+пользователю сразу, не дожидаясь SMTP-сервера.
 """
 
+import asyncio
+import logging
 import aiosmtplib
 from email.mime.text import MIMEText
 from config import EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD
 
+logger = logging.getLogger(__name__)
+
+# Общее SMTP-соединение и блокировка для последовательного доступа к нему
+_smtp: aiosmtplib.SMTP | None = None
+_smtp_lock = asyncio.Lock()
+
+# Очередь писем с кодами сброса: (telegram_id, email, код)
+EMAIL_QUEUE_SIZE = 100
+_email_queue: asyncio.Queue = asyncio.Queue(maxsize=EMAIL_QUEUE_SIZE)
+_email_worker: asyncio.Task | None = None
+
+
+async def _connect_smtp() -> aiosmtplib.SMTP:
+    """
+    Открывает новое SMTP-соединение и выполняет авторизацию.
+    
+    Returns:
+        aiosmtplib.SMTP: Подключённый и авторизованный клиент
+    """
+    smtp = aiosmtplib.SMTP(
+        hostname=EMAIL_HOST, 
+        port=EMAIL_PORT, 
+        start_tls=True, 
+        timeout=10
+    )
+    await smtp.connect()
+    await smtp.login(EMAIL_USER, EMAIL_PASSWORD)
+    return smtp
+
+
+async def _get_smtp() -> aiosmtplib.SMTP:
+    """
+    Возвращает открытое SMTP-соединение, подключаясь при необходимости.
+    
+    Вызывать только под _smtp_lock.
+    """
+    global _smtp
+    if _smtp is None or not _smtp.is_connected:
+        _smtp = await _connect_smtp()
+    return _smtp
+
+
+async def _drop_smtp():
+    """
+    Закрывает текущее SMTP-соединение (без ошибок, если оно уже разорвано).
+    
+    Вызывать только под _smtp_lock.
+    """
+    global _smtp
+    if _smtp is not None:
+        try:
+            _smtp.close()
+        except Exception:
+            pass
+    _smtp = None
+
+
+async def _send_message(msg: MIMEText):
+    """
+    Отправляет письмо через общее соединение.
+    
+    Если соединение оказалось разорванным — переподключается и повторяет
+    отправку один раз.
+    """
+    async with _smtp_lock:
+        try:
+            smtp = await _get_smtp()
+            await smtp.send_message(msg)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError) as e:
+            logger.warning(f"SMTP-соединение разорвано, переподключаемся: {e}")
+            await _drop_smtp()
+            smtp = await _get_smtp()
+            await smtp.send_message(msg)
+
+
+async def smtp_keepalive():
+    """
+    Поддерживает SMTP-соединение открытым (команда NOOP).
+    
+    Выполняется планировщиком периодически; если соединения нет — ничего
+    не делает, если оно разорвано — закрывает его до следующей отправки.
+    """
+    async with _smtp_lock:
+        if _smtp is None:
+            return
+        try:
+            await _smtp.noop()
+        except aiosmtplib.SMTPException as e:
+            logger.info(f"SMTP keepalive не удался, соединение закрыто: {e}")
+            await _drop_smtp()
+
+
+async def close_smtp():
+    """
+    Корректно завершает SMTP-сессию (при остановке бота).
+    """
+    global _smtp
+    async with _smtp_lock:
+        if _smtp is not None and _smtp.is_connected:
+            try:
+                await _smtp.quit()
+            except aiosmtplib.SMTPException:
+                pass
+        _smtp = None
+
 
 async def send_reset_code_email(to_email: str, code: str):
     """
@@ -30,11 +143,75 @@ async def send_reset_code_email(to_email: str, code: str):
     msg["From"] = EMAIL_USER
     msg["To"] = to_email
     
-    await aiosmtplib.send(
-        msg,
-        hostname=EMAIL_HOST,
-        port=EMAIL_PORT,
-        start_tls=True,
-        username=EMAIL_USER,
-        password=EMAIL_PASSWORD
-    )
\ No newline at end of file
+    await _send_message(msg)
+
+
+# ============================================================================
+# ФОНОВАЯ ОТПРАВКА ПИСЕМ
+# ============================================================================
+
+def queue_reset_code_email(telegram_id: int, to_email: str, code: str):
+    """
+    Ставит письмо с кодом сброса в очередь на отправку (без ожидания SMTP).
+    
+    Args:
+        telegram_id (int): ID пользователя (для уведомления при ошибке)
+        to_email (str): Email получателя
+        code (str): 6-значный код подтверждения
+    
+    Raises:
+        asyncio.QueueFull: Очередь переполнена
+    """
+    _email_queue.put_nowait((telegram_id, to_email, code))
+
+
+async def _process_email_queue(bot):
+    """
+    Отправляет письма из очереди по одному через общее SMTP-соединение.
+    
+    При ошибке отправки сообщает пользователю в Telegram.
+    """
+    while True:
+        telegram_id, to_email, code = await _email_queue.get()
+        try:
+            await send_reset_code_email(to_email, code)
+        except Exception as e:
+            logger.error(f"Ошибка отправки email: {e}")
+            try:
+                await bot.send_message(
+                    telegram_id, 
+                    "Не удалось отправить код на email. Попробуйте позже."
+                )
+            except Exception as e:
+                logger.error(f"Ошибка уведомления {telegram_id}: {e}")
+        finally:
+            _email_queue.task_done()
+
+
+def start_email_worker(bot):
+    """
+    Запускает фоновый обработчик очереди писем (при старте бота).
+    
+    Args:
+        bot: Экземпляр бота для уведомлений об ошибках отправки
+    """
+    global _email_worker
+    if _email_worker is None or _email_worker.done():
+        _email_worker = asyncio.create_task(
+            _process_email_queue(bot), 
+            name="email_worker"
+        )
+
+
+async def stop_email_worker():
+    """
+    Останавливает обработчик очереди писем (при остановке бота).
+    """
+    global _email_worker
+    if _email_worker is not None:
+        _email_worker.cancel()
+        try:
+            await _email_worker
+        except asyncio.CancelledError:
+            pass
+        _email_worker = None
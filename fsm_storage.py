@@ -0,0 +1,96 @@
+"""
+fsm_storage.py
+==============
+Выбор хранилища состояний FSM.
+Если в .env указан REDIS_URL — состояния хранятся в Redis (общие для
+нескольких процессов бота), иначе — в памяти процесса.
+"""
+
+import base64
+from datetime import date, datetime, time
+from decimal import Decimal
+
+import msgpack
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import REDIS_URL
+
+# Коды msgpack-расширений для значений из БД (хранятся в ISO-формате)
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_TIME = 3
+_EXT_DECIMAL = 4
+
+_EXT_DECODERS = {
+    _EXT_DATETIME: datetime.fromisoformat,
+    _EXT_DATE: date.fromisoformat,
+    _EXT_TIME: time.fromisoformat,
+    _EXT_DECIMAL: Decimal,
+}
+
+
+def _encode_ext(obj):
+    """Упаковывает date/time/Decimal; остальные типы в FSM не допускаются"""
+    # datetime — подкласс date, поэтому проверяется первым
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, time):
+        return msgpack.ExtType(_EXT_TIME, obj.isoformat().encode())
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(obj).encode())
+    raise TypeError(f"Значение типа {type(obj).__name__} нельзя сохранить в FSM")
+
+
+def _decode_ext(code: int, data: bytes):
+    """Распаковывает значения, упакованные функцией _encode_ext"""
+    decoder = _EXT_DECODERS.get(code)
+    if decoder is None:
+        return msgpack.ExtType(code, data)
+    return decoder(data.decode())
+
+
+def _dumps(data: dict) -> str:
+    """
+    Сериализует данные FSM.
+    
+    msgpack сохраняет целочисленные ключи словарей (дерево календаря),
+    date/time/Decimal упаковываются явными расширениями. Кортежи
+    возвращаются списками. Записи asyncpg в FSM не кладутся — обработчики
+    сохраняют словари. Результат кодируется в base64, т.к. aiogram читает
+    значение из Redis как UTF-8 строку.
+    """
+    packed = msgpack.packb(data, default=_encode_ext, use_bin_type=True)
+    return base64.b64encode(packed).decode("ascii")
+
+
+def _loads(value: str) -> dict:
+    """Десериализует данные FSM, сохранённые функцией _dumps"""
+    return msgpack.unpackb(
+        base64.b64decode(value),
+        ext_hook=_decode_ext,
+        strict_map_key=False,
+        raw=False
+    )
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Создаёт хранилище состояний FSM.
+    
+    Returns:
+        BaseStorage: RedisStorage при заданном REDIS_URL, иначе MemoryStorage
+    """
+    if not REDIS_URL:
+        return MemoryStorage()
+    
+    # Импорт внутри функции: пакет redis нужен только при работе через Redis
+    from aiogram.fsm.storage.redis import RedisStorage
+    
+    return RedisStorage.from_url(
+        REDIS_URL,
+        json_dumps=_dumps,
+        json_loads=_loads
+    )
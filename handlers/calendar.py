@@ -5,40 +5,96 @@ handlers/calendar.py
 Навигация: год → месяц → день → список записей.
 """
 
+import asyncio
+import hashlib
+import re
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
-from calendar import month_name
 from FSMstates import CalendarStates
 from database import (
-    get_record_years,
-    get_record_months,
-    get_record_days,
+    get_record_calendar_tree,
     get_records_by_date
 )
 from keyboards import (
     get_years_inline,
     get_months_inline,
     get_calendar_inline,
-    main_menu_keyboard
+    main_menu_keyboard,
+    MONTH_NAMES
 )
 from handlers.logout import return_to_role_menu  # ← ПРАВИЛЬНЫЙ ИМПОРТ ФУНКЦИИ
+from middlewares import FSMDataMiddleware
+from telegram_utils import safe_edit
 
 # Создаём роутер для обработки календаря
 router = Router()
 
+# Данные FSM загружаются один раз на событие и передаются как fsm_data
+router.message.middleware(FSMDataMiddleware())
+router.callback_query.middleware(FSMDataMiddleware())
+
+# Единый шаблон callback_data календаря: cal_<действие>[_<число>]
+CAL_RE = re.compile(r"^cal_(year|month|day|back_year|back_month|menu)(?:_(\d+))?$")
+
+
+async def _get_calendar_tree(data: dict) -> dict[int, dict[int, dict[int, int]]]:
+    """
+    Возвращает дерево календаря {год: {месяц: {день: количество}}}.
+    
+    Берёт его из состояния (загружено в start_calendar), из БД — только
+    если в состоянии его нет.
+    """
+    tree = data.get("calendar_tree")
+    if tree is None:
+        tree = await get_record_calendar_tree(data["telegram_id"], data["role"])
+    return tree
+
+
+async def _edit_calendar(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    text: str, 
+    reply_markup: InlineKeyboardMarkup | None = None
+):
+    """
+    Редактирует сообщение календаря, если его содержимое изменилось.
+    
+    Хеш последнего показанного содержимого хранится в состоянии:
+    повторное нажатие «Назад» на том же экране не отправляет в Telegram
+    запрос, который вернул бы «message is not modified».
+    """
+    markup_json = reply_markup.model_dump_json() if reply_markup is not None else ""
+    msg_hash = hashlib.blake2s(
+        f"{callback.message.message_id}\n{text}\n{markup_json}".encode()
+    ).hexdigest()
+    if data.get("last_msg_hash") == msg_hash:
+        return
+    
+    await safe_edit(callback.message, text, reply_markup=reply_markup)
+    await state.update_data(last_msg_hash=msg_hash)
+
+
+def _month_counts(tree: dict, year: int) -> dict[int, int]:
+    """Количество записей по месяцам года: {номер_месяца: количество}"""
+    return {
+        month: sum(day_counts.values())
+        for month, day_counts in tree.get(year, {}).items()
+    }
+
 
 @router.message(F.text == "Календарь")
-async def start_calendar(message: Message, state: FSMContext):
+async def start_calendar(message: Message, state: FSMContext, fsm_data: dict):
     """
     Начало навигации по календарю.
     
-    Показывает список доступных годов с записями.
+    Загружает все уровни календаря одним запросом и показывает
+    список доступных годов с записями.
     """
     # Получаем роль пользователя из состояния
-    data = await state.get_data()
-    role = data.get("user_role")
+    role = fsm_data.get("user_role")
     
     # Проверяем авторизацию
     if role not in ("client", "provider"):
@@ -48,20 +104,26 @@ async def start_calendar(message: Message, state: FSMContext):
         )
         return
     
-    # Получаем список годов с записями для пользователя
+    # Получаем годы, месяцы и дни с записями для пользователя
     telegram_id = message.from_user.id
-    years = await get_record_years(telegram_id, role)
+    tree = await get_record_calendar_tree(telegram_id, role)
     
     # Проверяем наличие записей
-    if not years:
+    if not tree:
         await message.answer(
             "У вас нет записей.", 
             reply_markup=main_menu_keyboard()
         )
         return
     
-    # Сохраняем роль и ID для последующих шагов
-    await state.update_data(role=role, telegram_id=telegram_id)
+    # Сохраняем роль, ID и дерево календаря для последующих шагов
+    # (дерево живёт в состоянии только в рамках одного просмотра
+    # календаря — при следующем открытии оно загружается заново)
+    await state.update_data(
+        role=role, 
+        telegram_id=telegram_id, 
+        calendar_tree=tree
+    )
     
     # Устанавливаем состояние выбора года
     await state.set_state(CalendarStates.waiting_for_year)
@@ -69,7 +131,7 @@ async def start_calendar(message: Message, state: FSMContext):
     # Показываем список годов
     await message.answer(
         "Выберите год:", 
-        reply_markup=get_years_inline(years)
+        reply_markup=get_years_inline(list(tree))
     )
 
 
@@ -77,151 +139,160 @@ async def start_calendar(message: Message, state: FSMContext):
 # ВЫБОР ГОДА
 # ============================================================================
 
-@router.callback_query(CalendarStates.waiting_for_year, F.data.startswith("cal_year_"))
-async def process_year(callback: CallbackQuery, state: FSMContext):
+async def process_year(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    year: int
+):
     """
     Обработка выбора года.
     
     Показывает список месяцев с записями в выбранном году.
     """
-    # Извлекаем год из callback_data
-    year = int(callback.data.split("_")[-1])
-    
-    # Получаем данные из состояния
-    data = await state.get_data()
-    role = data["role"]
-    telegram_id = data["telegram_id"]
-    
-    # Получаем месяцы с записями в этом году
-    months = await get_record_months(telegram_id, role, year)
+    # Получаем месяцы с записями в этом году из дерева календаря
+    months = _month_counts(await _get_calendar_tree(data), year)
     if not months:
         await callback.answer("В этом году нет записей.", show_alert=True)
         return
     
-    # Сохраняем выбранный год
-    await state.update_data(selected_year=year)
+    # Сохраняем выбранный год (повторный выбор того же года не пишет в хранилище)
+    if data.get("selected_year") != year:
+        await state.update_data(selected_year=year)
     
     # Устанавливаем состояние выбора месяца
     await state.set_state(CalendarStates.waiting_for_month)
     
-    # Редактируем сообщение на список месяцев
-    await callback.message.edit_text(
-        "Выберите месяц:", 
-        reply_markup=get_months_inline(year, months)
+    # Редактируем сообщение на список месяцев и параллельно
+    # подтверждаем нажатие кнопки
+    await asyncio.gather(
+        _edit_calendar(
+            callback, 
+            state, 
+            data, 
+            "Выберите месяц:", 
+            reply_markup=get_months_inline(year, months)
+        ),
+        callback.answer()
     )
-    
-    # Подтверждаем нажатие кнопки
-    await callback.answer()
 
 
-@router.callback_query(F.data == "cal_back_year")
-async def back_to_year(callback: CallbackQuery, state: FSMContext):
+async def back_to_year(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    _: int | None = None
+):
     """
     Возврат к выбору года из месяца.
     """
-    # Получаем данные из состояния
-    data = await state.get_data()
-    role = data["role"]
-    telegram_id = data["telegram_id"]
-    
-    # Получаем список годов
-    years = await get_record_years(telegram_id, role)
+    # Получаем список годов из дерева календаря
+    years = list(await _get_calendar_tree(data))
     
     # Устанавливаем состояние выбора года
     await state.set_state(CalendarStates.waiting_for_year)
     
-    # Редактируем сообщение на список годов
-    await callback.message.edit_text(
-        "Выберите год:", 
-        reply_markup=get_years_inline(years)
+    # Редактируем сообщение на список годов и параллельно
+    # подтверждаем нажатие кнопки
+    await asyncio.gather(
+        _edit_calendar(
+            callback, 
+            state, 
+            data, 
+            "Выберите год:", 
+            reply_markup=get_years_inline(years)
+        ),
+        callback.answer()
     )
-    
-    # Подтверждаем нажатие кнопки
-    await callback.answer()
 
 
 # ============================================================================
 # ВЫБОР МЕСЯЦА
 # ============================================================================
 
-@router.callback_query(CalendarStates.waiting_for_month, F.data.startswith("cal_month_"))
-async def process_month(callback: CallbackQuery, state: FSMContext):
+async def process_month(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    month_num: int
+):
     """
     Обработка выбора месяца.
     
     Показывает календарную сетку дней с записями.
     """
-    # Извлекаем номер месяца
-    month_num = int(callback.data.split("_")[-1])
-    
-    # Получаем данные из состояния
-    data = await state.get_data()
-    role = data["role"]
-    telegram_id = data["telegram_id"]
+    # Получаем дни с записями в этом месяце из дерева календаря
     year = data["selected_year"]
+    tree = await _get_calendar_tree(data)
+    days = tree.get(year, {}).get(month_num, {})
     
-    # Получаем дни с записями в этом месяце
-    days = await get_record_days(telegram_id, role, year, month_num)
-    
-    # Сохраняем выбранный месяц
-    await state.update_data(selected_month=month_num)
+    # Сохраняем выбранный месяц (повторный выбор того же месяца не пишет в хранилище)
+    if data.get("selected_month") != month_num:
+        await state.update_data(selected_month=month_num)
     
     # Устанавливаем состояние выбора дня
     await state.set_state(CalendarStates.waiting_for_day)
     
-    # Редактируем сообщение на календарную сетку
-    await callback.message.edit_text(
-        f"📅 {month_name[month_num]} {year}\n\nВыберите день:",
-        reply_markup=get_calendar_inline(year, month_num, days)
+    # Редактируем сообщение на календарную сетку и параллельно
+    # подтверждаем нажатие кнопки
+    await asyncio.gather(
+        _edit_calendar(
+            callback, 
+            state, 
+            data, 
+            f"📅 {MONTH_NAMES[month_num]} {year}\n\nВыберите день:",
+            reply_markup=get_calendar_inline(year, month_num, days)
+        ),
+        callback.answer()
     )
-    
-    # Подтверждаем нажатие кнопки
-    await callback.answer()
 
 
-@router.callback_query(F.data == "cal_back_month")
-async def back_to_month(callback: CallbackQuery, state: FSMContext):
+async def back_to_month(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    _: int | None = None
+):
     """
     Возврат к выбору месяца из дня.
     """
-    # Получаем данные из состояния
-    data = await state.get_data()
-    role = data["role"]
-    telegram_id = data["telegram_id"]
+    # Получаем месяцы выбранного года из дерева календаря
     year = data["selected_year"]
-    
-    # Получаем месяцы в этом году
-    months = await get_record_months(telegram_id, role, year)
+    months = _month_counts(await _get_calendar_tree(data), year)
     
     # Устанавливаем состояние выбора месяца
     await state.set_state(CalendarStates.waiting_for_month)
     
-    # Редактируем сообщение на список месяцев
-    await callback.message.edit_text(
-        "Выберите месяц:", 
-        reply_markup=get_months_inline(year, months)
+    # Редактируем сообщение на список месяцев и параллельно
+    # подтверждаем нажатие кнопки
+    await asyncio.gather(
+        _edit_calendar(
+            callback, 
+            state, 
+            data, 
+            "Выберите месяц:", 
+            reply_markup=get_months_inline(year, months)
+        ),
+        callback.answer()
     )
-    
-    # Подтверждаем нажатие кнопки
-    await callback.answer()
 
 
 # ============================================================================
 # ВЫБОР ДНЯ
 # ============================================================================
 
-@router.callback_query(F.data.startswith("cal_day_"))
-async def process_day(callback: CallbackQuery, state: FSMContext):
+async def process_day(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    day: int
+):
     """
     Обработка выбора дня.
     
     Показывает список записей на выбранный день.
     """
-    # Извлекаем номер дня
-    day = int(callback.data.split("_")[-1])
-    
     # Получаем данные из состояния
-    data = await state.get_data()
     role = data["role"]
     telegram_id = data["telegram_id"]
     year = data["selected_year"]
@@ -234,42 +305,90 @@ async def process_day(callback: CallbackQuery, state: FSMContext):
         return
     
     # Формируем сообщение со списком записей
-    response = f"📅 Записи на {day:02d}.{month:02d}.{year}:\n\n"
+    parts = [f"📅 Записи на {day:02d}.{month:02d}.{year}:\n\n"]
     for record in records:
-        response += (
+        parts.append(
             f"🔹 {record['service_name']}\n"
             f"   Время: {record['service_time']}\n"
             f"   Адрес: {record['address']}\n"
             f"   Комментарии: {record['comments']}\n\n"
         )
     
-    # Редактируем сообщение на список записей
-    await callback.message.edit_text(response.strip())
-    
-    # Подтверждаем нажатие кнопки
-    await callback.answer()
+    # Редактируем сообщение на список записей и параллельно
+    # подтверждаем нажатие кнопки
+    await asyncio.gather(
+        _edit_calendar(callback, state, data, "".join(parts).strip()),
+        callback.answer()
+    )
 
 
 # ============================================================================
 # НАВИГАЦИЯ
 # ============================================================================
 
-@router.callback_query(F.data == "cal_menu")
-async def back_to_main_menu(callback: CallbackQuery, state: FSMContext):
+async def back_to_main_menu(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    data: dict, 
+    _: int | None = None
+):
     """
     Возврат в главное меню из календаря.
     """
     # Очищаем состояние
     await state.clear()
     
-    # Редактируем сообщение на главное меню
-    await callback.message.edit_text(
-        "Вы вернулись в главное меню.", 
-        reply_markup=main_menu_keyboard()
+    # Редактируем сообщение на главное меню и параллельно
+    # подтверждаем нажатие кнопки
+    await asyncio.gather(
+        safe_edit(
+            callback.message, 
+            "Вы вернулись в главное меню.", 
+            reply_markup=main_menu_keyboard()
+        ),
+        callback.answer()
     )
+
+
+# Обработчики действий календаря: действие → (функция, требуемое состояние)
+_CAL_HANDLERS = {
+    "year": (process_year, CalendarStates.waiting_for_year),
+    "month": (process_month, CalendarStates.waiting_for_month),
+    "day": (process_day, None),
+    "back_year": (back_to_year, None),
+    "back_month": (back_to_month, None),
+    "menu": (back_to_main_menu, None),
+}
+
+
+@router.callback_query(F.data.regexp(CAL_RE).as_("match"))
+async def calendar_callback(
+    callback: CallbackQuery, 
+    state: FSMContext, 
+    match: re.Match, 
+    raw_state: str | None, 
+    fsm_data: dict
+):
+    """
+    Единая точка входа для всех callback календаря.
+    
+    Разбирает callback_data одним регулярным выражением и передаёт
+    управление нужному обработчику.
+    """
+    action, value = match.group(1), match.group(2)
+    handler, required_state = _CAL_HANDLERS[action]
+    
+    # Выбор года/месяца доступен только на соответствующем шаге
+    if required_state is not None and raw_state != required_state.state:
+        await callback.answer()
+        return
+    
+    # Действия выбора (год, месяц, день) обязательно содержат число
+    if action in ("year", "month", "day") and value is None:
+        await callback.answer()
+        return
     
-    # Подтверждаем нажатие кнопки
-    await callback.answer()
+    await handler(callback, state, fsm_data, int(value) if value is not None else None)
 
 
 @router.callback_query(F.data == "ignore")
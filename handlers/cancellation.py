@@ -6,34 +6,31 @@ handlers/cancellation.py
 """
 
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 import logging
-from FSMstates import CancellationStates
 from database import (
     get_active_records_for_provider,
     cancel_service_record,
-    get_user_name,
-    get_client_from_record,
     create_notification
 )
-from keyboards import cancel_menu_keyboard
+from keyboards import cancellation_records_inline
+from background import run_in_background
 from handlers.logout import return_to_role_menu
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки отмены записей
 router = Router()
 
 
-@router.message(F.text == "Отменить запись")
 async def start_cancellation(message: Message, state: FSMContext):
     """
     Начало процесса отмены записи
     
-    Показывает список активных записей для выбора
+    Показывает список активных записей с inline-кнопками для выбора
+    (ID записи передаётся в callback_data, список в состоянии не хранится)
     
     Args:
         message (Message): Входящее сообщение
@@ -48,103 +45,106 @@ async def start_cancellation(message: Message, state: FSMContext):
         return
     
     # Формируем сообщение со списком записей
-    response = "Выберите запись для отмены:\n\n"
+    parts = ["Выберите запись для отмены:\n\n"]
     for i, record in enumerate(records, 1):
-        # Получаем имя клиента для отображения
-        client_info = await get_user_name(record['client_telegram_id'])
+        # Имя клиента получено вместе с записью (JOIN users)
         client_name = (
-            f"{client_info['first_name'] or ''} {client_info['last_name'] or ''}".strip() 
+            f"{record['client_first_name'] or ''} {record['client_last_name'] or ''}".strip() 
             or "Клиент"
         )
-        response += (
+        parts.append(
             f"{i}. {record['service_name']} — "
             f"{record['service_date']} {record['service_time']}\n"
             f"   Клиент: {client_name}\n\n"
         )
     
-    # Сохраняем список записей в состоянии
-    await state.update_data(records=records)
-    
-    # Запрашиваем номер записи
+    # Показываем список с кнопками выбора записи
     await message.answer(
-        response + "Введите номер записи:", 
-        reply_markup=cancel_menu_keyboard()
+        "".join(parts).strip(), 
+        reply_markup=cancellation_records_inline(records)
     )
+
+
+async def _notify_client_about_cancellation(record):
+    """
+    Создаёт клиенту уведомление об отмене записи
     
-    # Устанавливаем состояние выбора записи
-    await state.set_state(CancellationStates.waiting_for_record_id)
+    Args:
+        record (asyncpg.Record): Отменённая запись (client_telegram_id,
+            service_name, service_date, service_time)
+    """
+    await create_notification(
+        telegram_id=record['client_telegram_id'],
+        role="client",
+        message_text=(
+            f"❌ Мастер отменил запись '{record['service_name']}' "
+            f"на {record['service_date']} {record['service_time']}."
+        )
+    )
 
 
-@router.message(CancellationStates.waiting_for_record_id)
-async def process_cancellation(message: Message, state: FSMContext):
+@router.callback_query(F.data == "cxl_menu")
+async def cancel_cancellation(callback: CallbackQuery, state: FSMContext):
+    """
+    Выход из отмены записи без изменений
+    
+    Args:
+        callback (CallbackQuery): Нажатие кнопки «В меню»
+        state (FSMContext): Контекст состояния
+    """
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.answer()
+    await return_to_role_menu(callback.message, state, role="provider")
+
+
+@router.callback_query(F.data.startswith("cxl_"))
+async def process_cancellation(callback: CallbackQuery, state: FSMContext):
     """
     Обработка выбора записи для отмены
     
     Отменяет запись в БД и уведомляет клиента
     
     Args:
-        message (Message): Сообщение с номером записи
+        callback (CallbackQuery): Нажатие кнопки с ID записи
         state (FSMContext): Контекст состояния
     """
-    # Проверка отмены действия (нажатие "В меню")
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="provider")
+    # Получаем ID записи из callback_data
+    try:
+        record_id = int(callback.data.removeprefix("cxl_"))
+    except ValueError:
+        await callback.answer()
         return
     
+    # Отменяем запись в БД (проверяем, что запись принадлежит мастеру)
+    # (заодно получаем данные записи для уведомления клиента)
     try:
-        # Преобразуем ввод в индекс (нумерация с 1)
-        record_num = int(message.text.strip()) - 1
-        
-        # Получаем данные из состояния
-        data = await state.get_data()
-        records = data['records']
-        
-        # Проверяем корректность индекса
-        if record_num < 0 or record_num >= len(records):
-            raise ValueError
-        
-        # Получаем ID записи для отмены
-        record_id = records[record_num]['id']
-        
-        # Отменяем запись в БД (проверяем, что запись принадлежит мастеру)
-        success = await cancel_service_record(record_id, message.from_user.id)
-        
-        if success:
-            # Уведомляем клиента об отмене записи
-            client_id = await get_client_from_record(record_id)
-            if client_id:
-                service_name = records[record_num]['service_name']
-                service_date = records[record_num]['service_date']
-                service_time = records[record_num]['service_time']
-                try:
-                    await create_notification(
-                        telegram_id=client_id,
-                        role="client",
-                        message_text=(
-                            f"❌ Мастер отменил запись '{service_name}' "
-                            f"на {service_date} {service_time}."
-                        )
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка создания уведомления клиенту: {e}")
-            
-            # Подтверждаем отмену мастеру
-            await message.answer(f"✅ Запись отменена!")
-        else:
-            # Ошибка отмены (запись уже отменена или завершена)
-            await message.answer(
-                "❌ Не удалось отменить запись. "
-                "Возможно, она уже завершена или отменена."
-            )
+        success, record = await cancel_service_record(record_id, callback.from_user.id)
     except Exception as e:
-        # Обработка ошибок (некорректный ввод, ошибка БД и т.д.)
-        logger.error(f"Ошибка отмены записи: {e}")
-        await message.answer(
-            f"Неверный номер. Введите число от 1 до {len(records)}:", 
-            reply_markup=cancel_menu_keyboard()
+        logger.error(f"Ошибка отмены записи {record_id}: {e}", exc_info=e)
+        await callback.message.edit_text(
+            "❌ Произошла ошибка при отмене записи. Попробуйте позже."
+        )
+        await callback.answer()
+        return
+    
+    if success:
+        # Уведомляем клиента об отмене записи в фоне,
+        # не задерживая ответ мастеру
+        run_in_background(
+            _notify_client_about_cancellation(record),
+            name=f"cancel_notify_{record_id}"
+        )
+        
+        # Подтверждаем отмену мастеру
+        await callback.message.edit_text("✅ Запись отменена!")
+    else:
+        # Ошибка отмены (запись уже отменена или завершена)
+        await callback.message.edit_text(
+            "❌ Не удалось отменить запись. "
+            "Возможно, она уже завершена или отменена."
         )
     
-    # Очищаем состояние и возвращаемся в меню
-    await state.clear()
-    await return_to_role_menu(message, state, role="provider")
\ No newline at end of file
+    # Подтверждаем нажатие кнопки и возвращаемся в меню
+    await callback.answer()
+    await return_to_role_menu(callback.message, state, role="provider")
+
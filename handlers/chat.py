@@ -5,20 +5,22 @@ handlers/chat.py
 Поддерживает создание чата, пересылку сообщений и завершение чата.
 """
 
+import asyncio
+import re
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramForbiddenError
 import logging
-from FSMstates import ClientChatStates, ProviderChatStates
+from FSMstates import ClientChatStates, ProviderChatStates, ServiceRecordStates
 from database import (
     get_user_telegram_id_by_code,
     create_chat,
     get_active_chat_by_client,
-    get_active_chat_by_provider,
+    get_chat_by_id,
     close_chat,
-    get_user_name,
-    get_db_connection
+    get_user_name_cached,
+    get_client_id_by_chat
 )
 from keyboards import (
     client_menu_keyboard,
@@ -29,14 +31,73 @@ from keyboards import (
     create_record_after_chat_inline
 )
 from handlers.logout import return_to_role_menu  # ← ПРАВИЛЬНЫЙ ИМПОРТ ФУНКЦИИ
+from telegram_utils import safe_send, safe_copy
+from background import run_in_background
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки чата
 router = Router()
 
+# Единый шаблон callback_data inline-кнопок чата: <действие>_<ID чата>
+CHAT_CB_RE = re.compile(r"^(accept_chat|reject_chat|create_record_yes|create_record_no)_(\d+)$")
+
+# ID мастера: ровно 6 цифр, допускаются пробелы по краям
+_ID_RE = re.compile(r"^\s*(\d{6})\s*$", re.ASCII)
+
+# Префиксы пересылаемых сообщений (собираются один раз при загрузке модуля)
+CLIENT_PREFIX = "Сообщение от клиента:\n\n"
+PROVIDER_PREFIX = "Сообщение от мастера:\n\n"
+
+# Собеседники в активных чатах: telegram_id → (ID чата, ID собеседника).
+# Позволяет пересылать сообщения без чтения FSM-хранилища на каждое сообщение;
+# после перезапуска бота кэш пуст и данные берутся из состояния.
+_active_partners: dict[int, tuple[int, int]] = {}
+
+
+def _remember_partner(user_id: int, chat_id: int, partner_id: int):
+    """Запоминает собеседника пользователя в активном чате"""
+    _active_partners[user_id] = (chat_id, partner_id)
+
+
+def _forget_chat(chat_id: int, *user_ids: int):
+    """Удаляет участников завершённого чата из кэша (только для этого чата)"""
+    for user_id in user_ids:
+        entry = _active_partners.get(user_id)
+        if entry and entry[0] == chat_id:
+            del _active_partners[user_id]
+
+
+async def _get_partner(message: Message, state: FSMContext):
+    """
+    Возвращает (ID чата, ID собеседника) для отправителя сообщения.
+    
+    Сначала проверяет кэш, при промахе читает состояние FSM.
+    """
+    entry = _active_partners.get(message.from_user.id)
+    if entry:
+        return entry
+    data = await state.get_data()
+    chat_id, partner_id = data.get("chat_id"), data.get("partner_id")
+    if chat_id and partner_id:
+        _remember_partner(message.from_user.id, chat_id, partner_id)
+    return chat_id, partner_id
+
+
+async def _relay_message(bot, partner_id: int, message: Message, prefix: str):
+    """
+    Передаёт сообщение собеседнику с подписью отправителя.
+    
+    Текст отправляется одним сообщением с префиксом; медиа (фото, голосовые,
+    стикеры и т.д.) копируются через copy_message после строки-заголовка.
+    """
+    if message.text is not None:
+        await safe_send(bot, partner_id, prefix + message.text)
+    else:
+        await safe_send(bot, partner_id, prefix.rstrip())
+        await safe_copy(bot, partner_id, message)
+
 
 async def close_chat_and_offer_record(chat_id: int, provider_id: int, client_id: int, bot):
     """
@@ -44,40 +105,53 @@ async def close_chat_and_offer_record(chat_id: int, provider_id: int, client_id:
     
     УВЕДОМЛЕНИЯ: клиент получает уведомление ТОЛЬКО при создании записи (не здесь)
     """
-    # Завершаем чат в БД
-    await close_chat(chat_id)
+    async def _notify_provider():
+        try:
+            # Получаем имя клиента для персонализации сообщения
+            client_info = await get_user_name_cached(client_id)
+            client_display = (
+                f"{client_info['first_name'] or ''} {client_info['last_name'] or ''}".strip() 
+                if client_info else ""
+            ) or "Клиент"
+            
+            # Отправляем мастеру предложение создать запись (реальное время, без сохранения)
+            await safe_send(
+                bot, 
+                provider_id,
+                f"Чат с {client_display} завершён.\n"
+                "Хотите создать запись на услугу для этого клиента?",
+                reply_markup=create_record_after_chat_inline(chat_id)
+            )
+        except TelegramForbiddenError:
+            pass
+        except Exception as e:
+            logger.error("Ошибка отправки предложения о записи: %s", e)
     
-    try:
-        # Получаем имя клиента для персонализации сообщения
-        client_info = await get_user_name(client_id)
-        client_display = (
-            f"{client_info['first_name'] or ''} {client_info['last_name'] or ''}".strip() 
-            or "Клиент"
-        )
-        
-        # Отправляем мастеру предложение создать запись (реальное время, без сохранения)
-        await bot.send_message(
-            provider_id,
-            f"Чат с {client_display} завершён.\n"
-            "Хотите создать запись на услугу для этого клиента?",
-            reply_markup=create_record_after_chat_inline(chat_id)
-        )
-    except TelegramForbiddenError:
-        pass
-    except Exception as e:
-        logger.error(f"Ошибка отправки предложения о записи: {e}")
+    async def _notify_client():
+        # Клиенту отправляем уведомление о завершении чата (реальное время)
+        try:
+            await safe_send(
+                bot, 
+                client_id, 
+                "Чат с мастером завершён.", 
+                reply_markup=client_menu_keyboard()
+            )
+        except TelegramForbiddenError:
+            pass
+        except Exception as e:
+            logger.error("Ошибка отправки клиенту: %s", e)
     
-    # Клиенту отправляем уведомление о завершении чата (реальное время)
-    try:
-        await bot.send_message(
-            client_id, 
-            "Чат с мастером завершён.", 
-            reply_markup=client_menu_keyboard()
-        )
-    except TelegramForbiddenError:
-        pass
-    except Exception as e:
-        logger.error(f"Ошибка отправки клиенту: {e}")
+    _forget_chat(chat_id, provider_id, client_id)
+    
+    # Завершаем чат в БД фоновой задачей — уведомления не ждут записи
+    # в таблицу chats (ошибки задачи логируются в background)
+    run_in_background(close_chat(chat_id), name=f"close_chat_{chat_id}")
+    
+    # Уведомляем обе стороны параллельно
+    await asyncio.gather(
+        _notify_provider(),
+        _notify_client()
+    )
 
 
 @router.message(F.text == "Связаться с мастером")
@@ -107,10 +181,11 @@ async def process_provider_id(message: Message, state: FSMContext, bot):
     Проверяет формат, существование мастера и создаёт запрос на чат.
     """
     # Получаем и проверяем формат ID
-    user_code = message.text.strip()
-    if not user_code.isdigit() or len(user_code) != 6:
+    match = _ID_RE.match(message.text or "")
+    if not match:
         await message.answer("Неверный формат ID. Введите 6 цифр:")
         return
+    user_code = match.group(1)
     
     # Получаем telegram_id мастера по коду
     provider_telegram_id = await get_user_telegram_id_by_code(user_code)
@@ -128,7 +203,8 @@ async def process_provider_id(message: Message, state: FSMContext, bot):
     
     try:
         # Отправляем мастеру запрос на чат
-        await bot.send_message(
+        await safe_send(
+            bot, 
             provider_telegram_id,
             f"🔔 Запрос от клиента (ID: {user_code})\nПринять?",
             reply_markup=chat_request_inline(chat_id)
@@ -147,6 +223,7 @@ async def process_provider_id(message: Message, state: FSMContext, bot):
         partner_id=provider_telegram_id,
         user_role="client"
     )
+    _remember_partner(message.from_user.id, chat_id, provider_telegram_id)
     
     # Показываем клавиатуру активного чата
     await message.answer(
@@ -155,19 +232,19 @@ async def process_provider_id(message: Message, state: FSMContext, bot):
     )
 
 
-@router.callback_query(F.data.startswith("accept_chat_"))
-async def accept_chat(callback: CallbackQuery, state: FSMContext, bot):
+async def accept_chat(callback: CallbackQuery, state: FSMContext, bot, chat_id: int):
     """
     Обработчик принятия запроса на чат (мастером).
     
     Активирует чат и уведомляет клиента.
     """
-    # Извлекаем ID чата из callback_data
-    chat_id = int(callback.data.split("_")[-1])
-    
     # Проверяем, что чат активен и принадлежит мастеру
-    active_chat = await get_active_chat_by_provider(callback.from_user.id)
-    if not active_chat or active_chat["id"] != chat_id:
+    active_chat = await get_chat_by_id(chat_id)
+    if (
+        not active_chat 
+        or not active_chat["is_active"] 
+        or active_chat["provider_telegram_id"] != callback.from_user.id
+    ):
         await callback.answer("Чат уже закрыт или не найден.", show_alert=True)
         return
     
@@ -176,24 +253,26 @@ async def accept_chat(callback: CallbackQuery, state: FSMContext, bot):
     
     try:
         # Уведомляем клиента о принятии запроса
-        await bot.send_message(
+        await safe_send(
+            bot, 
             client_id,
             "✅ Мастер принял ваш запрос! Теперь вы можете писать друг другу."
         )
-        
-        # Уведомляем мастера об активации чата
-        await bot.send_message(
-            callback.from_user.id,
-            "✅ Вы приняли запрос! Теперь вы можете писать клиенту.\n"
-            "Нажмите «Завершить чат», чтобы остановить общение.",
-            reply_markup=provider_chat_active_keyboard()
-        )
     except TelegramForbiddenError:
         # Клиент заблокировал бота
         await callback.answer("Клиент заблокировал бота.", show_alert=True)
         await close_chat(chat_id)
         return
     
+    # Мастера переводим в чат только после того, как клиент получил уведомление
+    await safe_send(
+        bot, 
+        callback.from_user.id,
+        "✅ Вы приняли запрос! Теперь вы можете писать клиенту.\n"
+        "Нажмите «Завершить чат», чтобы остановить общение.",
+        reply_markup=provider_chat_active_keyboard()
+    )
+    
     # Сохраняем данные чата в состоянии мастера
     await state.set_state(ProviderChatStates.in_chat)
     await state.update_data(
@@ -201,29 +280,31 @@ async def accept_chat(callback: CallbackQuery, state: FSMContext, bot):
         partner_id=client_id,
         user_role="provider"
     )
+    _remember_partner(callback.from_user.id, chat_id, client_id)
     
     # Подтверждаем нажатие кнопки
     await callback.answer()
     await callback.message.edit_text("Чат активен.")
 
 
-@router.callback_query(F.data.startswith("reject_chat_"))
-async def reject_chat(callback: CallbackQuery, bot):
+async def reject_chat(callback: CallbackQuery, state: FSMContext, bot, chat_id: int):
     """
     Обработчик отклонения запроса на чат (мастером).
     
     Завершает чат и уведомляет клиента.
     """
-    # Извлекаем ID чата
-    chat_id = int(callback.data.split("_")[-1])
-    
-    # Получаем данные чата
-    active_chat = await get_active_chat_by_provider(callback.from_user.id)
-    if active_chat and active_chat["id"] == chat_id:
+    # Получаем данные чата (активный чат этого мастера)
+    active_chat = await get_chat_by_id(chat_id)
+    if (
+        active_chat 
+        and active_chat["is_active"] 
+        and active_chat["provider_telegram_id"] == callback.from_user.id
+    ):
         client_id = active_chat["client_telegram_id"]
         try:
             # Уведомляем клиента об отклонении
-            await bot.send_message(
+            await safe_send(
+                bot, 
                 client_id, 
                 "❌ Мастер отклонил ваш запрос.", 
                 reply_markup=client_menu_keyboard()
@@ -231,6 +312,7 @@ async def reject_chat(callback: CallbackQuery, bot):
         except TelegramForbiddenError:
             pass
         # Завершаем чат в БД
+        _forget_chat(chat_id, client_id)
         await close_chat(chat_id)
     
     # Подтверждаем нажатие кнопки
@@ -238,8 +320,7 @@ async def reject_chat(callback: CallbackQuery, bot):
     await callback.message.edit_text("Запрос отклонён.")
 
 
-@router.callback_query(F.data.startswith("create_record_no_"))
-async def handle_create_record_no(callback: CallbackQuery, state: FSMContext):
+async def handle_create_record_no(callback: CallbackQuery, state: FSMContext, bot, chat_id: int):
     """
     Обработчик отказа от создания записи после чата.
     
@@ -253,29 +334,17 @@ async def handle_create_record_no(callback: CallbackQuery, state: FSMContext):
     await state.update_data(user_role="provider")
 
 
-@router.callback_query(F.data.startswith("create_record_yes_"))
-async def handle_create_record_yes(callback: CallbackQuery, state: FSMContext):
+async def handle_create_record_yes(callback: CallbackQuery, state: FSMContext, bot, chat_id: int):
     """
     Обработчик согласия на создание записи после чата.
     
     Получает данные клиента из БД и начинает процесс создания записи.
     """
-    # Извлекаем ID чата
-    chat_id = int(callback.data.split("_")[-1])
-    
     # Получаем ID клиента из БД по ID чата
-    conn = await get_db_connection()
-    try:
-        row = await conn.fetchrow(
-            "SELECT client_telegram_id FROM chats WHERE id = $1", 
-            chat_id
-        )
-        if not row:
-            await callback.answer("Чат не найден.", show_alert=True)
-            return
-        client_id = row["client_telegram_id"]
-    finally:
-        await conn.close()
+    client_id = await get_client_id_by_chat(chat_id)
+    if not client_id:
+        await callback.answer("Чат не найден.", show_alert=True)
+        return
     
     # Подтверждаем нажатие кнопки
     await callback.answer()
@@ -289,10 +358,30 @@ async def handle_create_record_yes(callback: CallbackQuery, state: FSMContext):
         from_chat=True,
         user_role="provider"
     )
-    from FSMstates import ServiceRecordStates
     await state.set_state(ServiceRecordStates.waiting_for_service_name)
 
 
+# Обработчики inline-кнопок чата: действие → функция
+_CHAT_HANDLERS = {
+    "accept_chat": accept_chat,
+    "reject_chat": reject_chat,
+    "create_record_yes": handle_create_record_yes,
+    "create_record_no": handle_create_record_no,
+}
+
+
+@router.callback_query(F.data.regexp(CHAT_CB_RE).as_("match"))
+async def chat_callback(callback: CallbackQuery, state: FSMContext, bot, match: re.Match):
+    """
+    Единая точка входа для inline-кнопок чата.
+    
+    Разбирает callback_data (<действие>_<ID чата>) одним регулярным
+    выражением и передаёт управление нужному обработчику.
+    """
+    action, chat_id = match.group(1), int(match.group(2))
+    await _CHAT_HANDLERS[action](callback, state, bot, chat_id)
+
+
 @router.message(ClientChatStates.in_chat, F.text == "Завершить чат")
 async def client_end_chat(message: Message, state: FSMContext, bot):
     """
@@ -311,7 +400,11 @@ async def client_end_chat(message: Message, state: FSMContext, bot):
     
     # Возвращаем клиента в меню
     await message.answer("Вы вышли из чата.", reply_markup=client_menu_keyboard())
-    await state.clear()
+    
+    # Сбрасываем данные чата, сохраняя роль из уже прочитанных данных
+    # (без повторного чтения состояния)
+    await state.set_state(None)
+    await state.set_data({"user_role": data.get("user_role", "client")})
 
 
 @router.message(ProviderChatStates.in_chat, F.text == "Завершить чат")
@@ -332,7 +425,11 @@ async def provider_end_chat(message: Message, state: FSMContext, bot):
     
     # Возвращаем мастера в меню
     await message.answer("Вы вышли из чата.", reply_markup=provider_menu_keyboard())
-    await state.clear()
+    
+    # Сбрасываем данные чата, сохраняя роль из уже прочитанных данных
+    # (без повторного чтения состояния)
+    await state.set_state(None)
+    await state.set_data({"user_role": data.get("user_role", "provider")})
 
 
 @router.message(ClientChatStates.in_chat)
@@ -342,9 +439,8 @@ async def forward_from_client(message: Message, state: FSMContext, bot):
     
     Добавляет префикс "Сообщение от клиента:" для идентификации.
     """
-    # Получаем данные чата
-    data = await state.get_data()
-    partner_id = data.get("partner_id")
+    # Получаем собеседника (из кэша, без обращения к хранилищу состояний)
+    chat_id, partner_id = await _get_partner(message, state)
     
     # Проверяем корректность состояния
     if not partner_id:
@@ -354,13 +450,9 @@ async def forward_from_client(message: Message, state: FSMContext, bot):
     
     try:
         # Пересылаем сообщение мастеру с префиксом
-        await bot.send_message(
-            partner_id, 
-            f"Сообщение от клиента:\n\n{message.text}"
-        )
+        await _relay_message(bot, partner_id, message, CLIENT_PREFIX)
     except TelegramForbiddenError:
         # Мастер заблокировал бота — завершаем чат
-        chat_id = data.get("chat_id")
         if chat_id:
             await close_chat_and_offer_record(
                 chat_id, 
@@ -382,9 +474,8 @@ async def forward_from_provider(message: Message, state: FSMContext, bot):
     
     Добавляет префикс "Сообщение от мастера:" для идентификации.
     """
-    # Получаем данные чата
-    data = await state.get_data()
-    partner_id = data.get("partner_id")
+    # Получаем собеседника (из кэша, без обращения к хранилищу состояний)
+    chat_id, partner_id = await _get_partner(message, state)
     
     # Проверяем корректность состояния
     if not partner_id:
@@ -394,13 +485,9 @@ async def forward_from_provider(message: Message, state: FSMContext, bot):
     
     try:
         # Пересылаем сообщение клиенту с префиксом
-        await bot.send_message(
-            partner_id, 
-            f"Сообщение от мастера:\n\n{message.text}"
-        )
+        await _relay_message(bot, partner_id, message, PROVIDER_PREFIX)
     except TelegramForbiddenError:
         # Клиент заблокировал бота — завершаем чат
-        chat_id = data.get("chat_id")
         if chat_id:
             await close_chat_and_offer_record(
                 chat_id, 
@@ -10,7 +10,6 @@ from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from database import get_client_history_for_month  # ← Теперь работает!
 from keyboards import client_menu_keyboard, cancel_menu_keyboard
-from handlers.logout import return_to_role_menu
 
 router = Router()
 
@@ -57,9 +56,3 @@ async def show_client_history(message: Message, state: FSMContext):
         response.strip(),
         reply_markup=cancel_menu_keyboard()
     )
-
-
-@router.message(F.text == "В меню")
-async def back_to_menu(message: Message, state: FSMContext):
-    """Возврат в меню клиента"""
-    await return_to_role_menu(message, state, role="client")
\ No newline at end of file
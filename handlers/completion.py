@@ -5,6 +5,7 @@ handlers/completion.py
 Позволяет мастеру указать длительность, оценку, комментарии и добавить фотографии
 """
 
+import asyncio
 from aiogram import Router, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
@@ -14,10 +15,8 @@ from FSMstates import CompletionStates, PhotoStates
 from database import (
     get_active_records_for_provider,
     complete_service,
-    get_user_name,
-    get_client_from_record,
     create_notification,
-    add_service_photo
+    add_service_photos_bulk
 )
 from keyboards import (
     yes_no_keyboard,
@@ -25,16 +24,103 @@ from keyboards import (
     provider_menu_keyboard
 )
 from handlers.logout import return_to_role_menu
+from background import run_in_background
+from telegram_utils import safe_send
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки завершения услуг
 router = Router()
 
+# Клавиатура добавления фотографий (собирается один раз при загрузке модуля)
+PHOTO_DONE_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="✅ Готово")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
+
+# Буфер присланных фотографий: telegram_id мастера → {"record_id", "items"}.
+# Альбом приходит пачкой сообщений подряд — фото копятся в буфере и
+# сохраняются одним INSERT через PHOTO_FLUSH_DELAY секунд после первого
+# (или сразу по кнопке «✅ Готово»); подтверждение отправляется одно на пачку.
+# Буфер и задачи живут в памяти процесса: фото и «✅ Готово» одного мастера
+# должны обрабатываться одним процессом бота (общий RedisStorage этого
+# не обеспечивает). Буфер очищается сам через PHOTO_FLUSH_DELAY, в том числе
+# при выходе из PhotoStates без «✅ Готово»
+PHOTO_FLUSH_DELAY = 0.5
+_pending_photos: dict[int, dict] = {}
+
+# Отложенные сохранения пачек: telegram_id мастера → задачи _flush_photos_later.
+# Новый альбом может прийти, пока предыдущая пачка ещё пишется в БД.
+# Кнопка «✅ Готово» забирает все задачи мастера и дожидается их;
+# задача, оставшаяся в словаре, подтверждает свою пачку сама
+_photo_flush_tasks: dict[int, set[asyncio.Task]] = {}
+
+
+async def _adding_photos(state: FSMContext) -> bool:
+    """Мастер всё ещё добавляет фото (не нажал «✅ Готово» и не вышел в меню)"""
+    return await state.get_state() == PhotoStates.waiting_for_caption.state
+
+
+async def _flush_photos(message: Message, state: FSMContext) -> int:
+    """
+    Сохраняет накопленные фото мастера в БД, возвращает их количество
+    
+    Счётчик сохранённых за сеанс фото хранится в данных FSM (saved_photos).
+    При ошибке БД сообщает мастеру, что фото нужно отправить заново.
+    """
+    user_id = message.from_user.id
+    batch = _pending_photos.pop(user_id, None)
+    if not batch:
+        return 0
+    try:
+        await add_service_photos_bulk(batch["record_id"], batch["items"])
+    except Exception as e:
+        logger.error(f"Ошибка сохранения фото мастера {user_id}: {e}", exc_info=e)
+        await safe_send(
+            message.bot, 
+            message.chat.id, 
+            f"❌ Не удалось сохранить фото: {len(batch['items'])}. Отправьте их ещё раз."
+        )
+        return 0
+    saved = len(batch["items"])
+    if await _adding_photos(state):
+        data = await state.get_data()
+        await state.update_data(saved_photos=data.get("saved_photos", 0) + saved)
+    return saved
+
+
+async def _flush_photos_later(message: Message, state: FSMContext):
+    """
+    Сохраняет буфер фото после короткой паузы (пока доходит альбом)
+    и отправляет одно подтверждение на всю пачку
+    """
+    user_id = message.from_user.id
+    current = asyncio.current_task()
+    try:
+        await asyncio.sleep(PHOTO_FLUSH_DELAY)
+        saved = await _flush_photos(message, state)
+    finally:
+        # Задачи нет в словаре — её забрала кнопка «✅ Готово»
+        tasks = _photo_flush_tasks.get(user_id, set())
+        claimed = current not in tasks
+        tasks.discard(current)
+        if not tasks:
+            _photo_flush_tasks.pop(user_id, None)
+    
+    # Подтверждаем, только если пачку не забрала «✅ Готово»
+    # и мастер не вышел из добавления фото
+    if saved and not claimed and await _adding_photos(state):
+        await safe_send(
+            message.bot, 
+            message.chat.id, 
+            f"✅ Сохранено фото: {saved}. Отправьте ещё или нажмите «✅ Готово»."
+        )
+
 
-@router.message(F.text == "Завершить услугу")
 async def start_completion(message: Message, state: FSMContext):
     """
     Начало процесса завершения услуги
@@ -54,26 +140,26 @@ async def start_completion(message: Message, state: FSMContext):
         return
     
     # Формируем сообщение со списком записей
-    response = "Выберите запись для завершения:\n\n"
+    # (имена клиентов уже получены вместе с записями)
+    parts = ["Выберите запись для завершения:\n\n"]
     for i, record in enumerate(records, 1):
-        # Получаем имя клиента для отображения
-        client_info = await get_user_name(record['client_telegram_id'])
         client_name = (
-            f"{client_info['first_name'] or ''} {client_info['last_name'] or ''}".strip() 
+            f"{record['client_first_name'] or ''} {record['client_last_name'] or ''}".strip() 
             or "Клиент"
         )
-        response += (
+        parts.append(
             f"{i}. {record['service_name']} — "
             f"{record['service_date']} {record['service_time']}\n"
             f"   Клиент: {client_name}\n\n"
         )
+    parts.append("Введите номер записи:")
     
-    # Сохраняем список записей в состоянии
-    await state.update_data(records=records)
+    # Сохраняем в состоянии только ID записей (по номеру выбирается ID)
+    await state.update_data(record_ids=[record['id'] for record in records])
     
     # Запрашиваем номер записи
     await message.answer(
-        response + "Введите номер записи:", 
+        "".join(parts), 
         reply_markup=cancel_menu_keyboard()
     )
     
@@ -98,40 +184,33 @@ async def process_record_id(message: Message, state: FSMContext):
         await return_to_role_menu(message, state, role="provider")
         return
     
-    try:
-        # Преобразуем ввод в индекс (нумерация с 1)
-        record_num = int(message.text.strip()) - 1
-        
-        # Получаем данные из состояния
-        data = await state.get_data()
-        records = data['records']
-        
-        # Проверяем корректность индекса
-        if record_num < 0 or record_num >= len(records):
-            raise ValueError
-        
-        # Сохраняем выбранный ID записи и индекс
-        record_id = records[record_num]['id']
-        await state.update_data(
-            record_id=record_id, 
-            record_index=record_num
-        )
-        
-        # Запрашиваем длительность услуги
-        await message.answer(
-            "Сколько минут длилась услуга?", 
-            reply_markup=cancel_menu_keyboard()
-        )
-        
-        # Устанавливаем состояние ввода длительности
-        await state.set_state(CompletionStates.waiting_for_duration)
+    # Получаем данные из состояния
+    data = await state.get_data()
+    record_ids = data.get('record_ids', [])
     
-    except Exception as e:
-        logger.error(f"Ошибка выбора записи: {e}")
+    # Преобразуем ввод в индекс (нумерация с 1; только цифры, без исключений)
+    text = (message.text or "").strip()
+    record_num = int(text) - 1 if text.isdecimal() else -1
+    
+    # Проверяем корректность индекса
+    if record_num < 0 or record_num >= len(record_ids):
         await message.answer(
-            f"Неверный номер. Введите число от 1 до {len(records)}:", 
+            f"Неверный номер. Введите число от 1 до {len(record_ids)}:", 
             reply_markup=cancel_menu_keyboard()
         )
+        return
+    
+    # Сохраняем выбранный ID записи
+    await state.update_data(record_id=record_ids[record_num])
+    
+    # Запрашиваем длительность услуги
+    await message.answer(
+        "Сколько минут длилась услуга?", 
+        reply_markup=cancel_menu_keyboard()
+    )
+    
+    # Устанавливаем состояние ввода длительности
+    await state.set_state(CompletionStates.waiting_for_duration)
 
 
 @router.message(CompletionStates.waiting_for_duration)
@@ -151,28 +230,26 @@ async def process_duration(message: Message, state: FSMContext):
         await return_to_role_menu(message, state, role="provider")
         return
     
-    try:
-        # Преобразуем ввод в число
-        duration = int(message.text.strip())
-        
-        # Проверяем положительность
-        if duration <= 0:
-            raise ValueError
-        
-        # Сохраняем длительность
-        await state.update_data(duration=duration)
-        
-        # Запрашиваем оценку качества
-        await message.answer(
-            "Хорошо ли прошла услуга?", 
-            reply_markup=yes_no_keyboard()
-        )
-        
-        # Устанавливаем состояние ввода оценки
-        await state.set_state(CompletionStates.waiting_for_rating)
+    # Преобразуем ввод в число (только цифры, без исключений)
+    text = (message.text or "").strip()
+    duration = int(text) if text.isdecimal() else 0
     
-    except:
+    # Проверяем положительность
+    if duration <= 0:
         await message.answer("Введите положительное число минут:")
+        return
+    
+    # Сохраняем длительность
+    await state.update_data(duration=duration)
+    
+    # Запрашиваем оценку качества
+    await message.answer(
+        "Хорошо ли прошла услуга?", 
+        reply_markup=yes_no_keyboard()
+    )
+    
+    # Устанавливаем состояние ввода оценки
+    await state.set_state(CompletionStates.waiting_for_rating)
 
 
 @router.message(CompletionStates.waiting_for_rating)
@@ -233,8 +310,8 @@ async def process_notes_and_complete(message: Message, state: FSMContext, bot):
     # Получаем данные из состояния
     data = await state.get_data()
     
-    # Завершаем услугу в БД
-    success = await complete_service(
+    # Завершаем услугу в БД (возвращается завершённая запись)
+    record = await complete_service(
         record_id=data['record_id'],
         provider_id=message.from_user.id,
         duration_minutes=data['duration'],
@@ -242,27 +319,22 @@ async def process_notes_and_complete(message: Message, state: FSMContext, bot):
         notes=notes
     )
     
-    if success:
+    if record:
         # Уведомляем клиента о завершении услуги
-        client_id = await get_client_from_record(data['record_id'])
-        if client_id:
-            records = data.get('records', [])
-            record_index = data.get('record_index', 0)
-            if record_index < len(records):
-                service_name = records[record_index]['service_name']
-                status_text = "успешно завершена ✅" if data['rating'] else "завершена ⚠️"
-                try:
-                    await create_notification(
-                        telegram_id=client_id,
-                        role="client",
-                        message_text=(
-                            f"🔔 Ваша запись '{service_name}' {status_text}.\n"
-                            f"Длительность: {data['duration']} мин\n"
-                            f"Комментарии: {notes}"
-                        )
+        if record['client_telegram_id']:
+            status_text = "успешно завершена ✅" if data['rating'] else "завершена ⚠️"
+            try:
+                await create_notification(
+                    telegram_id=record['client_telegram_id'],
+                    role="client",
+                    message_text=(
+                        f"🔔 Ваша запись '{record['service_name']}' {status_text}.\n"
+                        f"Длительность: {data['duration']} мин\n"
+                        f"Комментарии: {notes}"
                     )
-                except Exception as e:
-                    logger.error(f"Ошибка создания уведомления клиенту: {e}")
+                )
+            except Exception as e:
+                logger.error(f"Ошибка создания уведомления клиенту: {e}")
         
         # Формируем статус для мастера
         status = "успешно завершена" if data['rating'] else "завершена с замечаниями"
@@ -276,8 +348,7 @@ async def process_notes_and_complete(message: Message, state: FSMContext, bot):
             reply_markup=yes_no_keyboard()
         )
         
-        # Сохраняем ID записи для последующего добавления фото
-        await state.update_data(record_id=data['record_id'])
+        # ID записи для добавления фото уже сохранён в состоянии
         await state.set_state(PhotoStates.waiting_for_photos)
         
     else:
@@ -307,18 +378,14 @@ async def ask_for_photos(message: Message, state: FSMContext):
         return
     
     if message.text == "✅ Да":
+        # Начинаем новый сеанс добавления фото
+        await state.update_data(saved_photos=0)
+        
         # Предлагаем отправить фото
-        keyboard = ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="✅ Готово")],
-                [KeyboardButton(text="В меню")]
-            ],
-            resize_keyboard=True
-        )
         await message.answer(
             "Отправьте фотографии результата (можно несколько).\n"
             "Когда закончите — нажмите «✅ Готово»:",
-            reply_markup=keyboard
+            reply_markup=PHOTO_DONE_KB
         )
         await state.set_state(PhotoStates.waiting_for_caption)
     else:  # "❌ Нет"
@@ -350,14 +417,18 @@ async def save_photo(message: Message, state: FSMContext):
         await return_to_role_menu(message, state, role="provider")
         return
     
-    # Сохраняем фото в БД
-    await add_service_photo(
-        record_id=record_id,
-        photo_file_id=photo.file_id,
-        caption=message.caption or "Результат работы"
-    )
-    
-    await message.answer("✅ Фото сохранено! Отправьте ещё или нажмите «✅ Готово».")
+    # Добавляем фото в буфер; первое фото пачки запускает отложенное сохранение
+    user_id = message.from_user.id
+    batch = _pending_photos.get(user_id)
+    if batch is None or batch["record_id"] != record_id:
+        if batch is not None:
+            await _flush_photos(message, state)
+        batch = _pending_photos[user_id] = {"record_id": record_id, "items": []}
+        _photo_flush_tasks.setdefault(user_id, set()).add(run_in_background(
+            _flush_photos_later(message, state), 
+            name=f"photo_flush_{user_id}"
+        ))
+    batch["items"].append((photo.file_id, message.caption or "Результат работы"))
 
 
 @router.message(PhotoStates.waiting_for_caption, F.text == "✅ Готово")
@@ -369,6 +440,16 @@ async def finish_photos(message: Message, state: FSMContext):
         message (Message): Сообщение с кнопкой "Готово"
         state (FSMContext): Контекст состояния
     """
-    await message.answer("📸 Все фотографии сохранены!")
+    # Дожидаемся сохранения всех начатых пачек (подтверждения по ним уже не нужны)
+    # и сохраняем фото, ещё не записанные в БД
+    user_id = message.from_user.id
+    flush_tasks = _photo_flush_tasks.pop(user_id, set())
+    if flush_tasks:
+        await asyncio.gather(*flush_tasks)
+    await _flush_photos(message, state)
+    data = await state.get_data()
+    total = data.get("saved_photos", 0)
+    
+    await message.answer(f"📸 Все фотографии сохранены! Всего: {total}")
     await state.clear()
     await return_to_role_menu(message, state, role="provider")
\ No newline at end of file
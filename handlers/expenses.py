@@ -5,7 +5,7 @@ handlers/expenses.py
 Позволяет добавлять расходы на материалы, транспорт и т.д.
 """
 
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 import logging
@@ -14,15 +14,13 @@ from database import add_expense
 from keyboards import cancel_menu_keyboard
 from handlers.logout import return_to_role_menu
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки трат
 router = Router()
 
 
-@router.message(F.text == "Добавить трату")
 async def start_expense(message: Message, state: FSMContext):
     """
     Начало процесса добавления траты
@@ -60,29 +58,27 @@ async def process_amount(message: Message, state: FSMContext):
         await return_to_role_menu(message, state, role="provider")
         return
     
-    try:
-        # Преобразуем ввод в целое число
-        amount = int(message.text.strip())
-        
-        # Проверяем положительность суммы
-        if amount <= 0:
-            raise ValueError
-        
-        # Сохраняем сумму в состоянии
-        await state.update_data(amount=amount)
-        
-        # Запрашиваем описание траты
-        await message.answer(
-            "Опишите трату (материалы, транспорт и т.д.):", 
-            reply_markup=cancel_menu_keyboard()
-        )
-        
-        # Устанавливаем состояние ожидания описания
-        await state.set_state(ExpenseStates.waiting_for_description)
-    
-    except:
+    # Преобразуем ввод в целое число (только цифры, без исключений)
+    text = (message.text or "").strip()
+    amount = int(text) if text.isdecimal() else 0
+    
+    # Проверяем положительность суммы
+    if amount <= 0:
         # Некорректный ввод - просим ввести снова
         await message.answer("Введите положительное число:")
+        return
+    
+    # Сохраняем сумму в состоянии
+    await state.update_data(amount=amount)
+    
+    # Запрашиваем описание траты
+    await message.answer(
+        "Опишите трату (материалы, транспорт и т.д.):", 
+        reply_markup=cancel_menu_keyboard()
+    )
+    
+    # Устанавливаем состояние ожидания описания
+    await state.set_state(ExpenseStates.waiting_for_description)
 
 
 @router.message(ExpenseStates.waiting_for_description)
@@ -5,23 +5,34 @@ handlers/login.py
 Проверяет пароль и показывает уведомления ПОСЛЕ успешного входа.
 """
 
+import asyncio
 import bcrypt
+import hashlib
 import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from aiogram import Router, F
 from aiogram.types import Message
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from FSMstates import LoginStates, AuthStates
 from database import (
     get_password_hash, 
     is_user_registered, 
     get_unread_notifications, 
-    mark_notifications_as_read
+    mark_notifications_as_read,
+    update_password
 )
+from background import run_in_background
 from keyboards import client_menu_keyboard, provider_menu_keyboard, password_reset_inline
 from handlers.logout import return_to_role_menu  # ← ПРАВИЛЬНЫЙ ИМПОРТ ФУНКЦИИ
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки входа
@@ -30,6 +41,194 @@ router = Router()
 # Максимальное количество попыток ввода пароля
 MAX_LOGIN_ATTEMPTS = 3
 
+# Максимальная длина сообщения с уведомлениями (лимит Telegram — 4096 символов)
+NOTIFICATION_MAX_LENGTH = 4000
+
+# Удаление угловых скобок при отправке уведомления простым текстом
+_STRIP_TAGS = str.maketrans("", "", "<>")
+
+# Теги, которые Telegram поддерживает в режиме HTML
+_HTML_TAG_RE = re.compile(
+    r"</?(?:b|strong|i|em|u|ins|s|strike|del|a|code|pre|span|tg-spoiler|tg-emoji|blockquote)"
+    r"(?:\s[^<>]*)?>"
+)
+
+# Кэш недавно отклонённых паролей: повторный ввод того же неверного пароля
+# (опечатки, перебор) отклоняется сразу, без запроса к БД и проверки bcrypt.
+# telegram_id → {sha256(пароль)[:16]: время записи}; сами пароли не хранятся,
+# только отрицательные результаты. Кэш пользователя очищается при успешном
+# входе и при смене пароля (forget_wrong_passwords).
+FAILED_PASSWORD_TTL = 60
+FAILED_PASSWORDS_PER_USER = 32
+FAILED_PASSWORD_USERS = 1024
+_failed_passwords = OrderedDict()
+
+
+# Отдельный пул потоков для паролей: проверка и хэширование (десятки мс CPU)
+# не блокируют цикл событий, а argon2/bcrypt отпускают GIL — проверки разных
+# пользователей идут параллельно на всех ядрах, не занимая общий пул asyncio
+_password_executor = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 1, 
+    thread_name_prefix="password"
+)
+
+# Новые пароли хэшируются argon2id; старые хэши bcrypt ($2b$...) ещё
+# проверяются и заменяются на argon2id при следующем успешном входе
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+_ARGON2_PREFIX = b"$argon2"
+
+
+def _check_password(password: bytes, password_hash: bytes) -> bool:
+    """Сравнивает пароль с хэшем argon2id или (устаревшим) bcrypt"""
+    if password_hash.startswith(_ARGON2_PREFIX):
+        try:
+            return _password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return bcrypt.checkpw(password, password_hash)
+
+
+def _needs_rehash(password_hash: bytes) -> bool:
+    """Нужно ли перехэшировать пароль (bcrypt или устаревшие параметры argon2)"""
+    if not password_hash.startswith(_ARGON2_PREFIX):
+        return True
+    return _password_hasher.check_needs_rehash(password_hash.decode())
+
+
+async def _verify_password(password: bytes, password_hash: bytes) -> bool:
+    """Проверяет пароль в отдельном потоке"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, _check_password, password, password_hash
+    )
+
+
+async def hash_password(password: str) -> str:
+    """
+    Хэширует пароль argon2id в отдельном потоке, не блокируя цикл событий
+    
+    Args:
+        password (str): Пароль в открытом виде
+    
+    Returns:
+        str: Хэш пароля для сохранения в БД
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, _password_hasher.hash, password
+    )
+
+
+async def _upgrade_password_hash(telegram_id: int, password: bytes):
+    """Заменяет устаревший хэш пароля на argon2id (после успешного входа)"""
+    await update_password(telegram_id, await hash_password(password.decode()))
+
+
+def _password_digest(password: bytes) -> bytes:
+    """Отпечаток пароля для кэша отклонённых паролей"""
+    return hashlib.sha256(password).digest()[:16]
+
+
+def _is_known_wrong_password(telegram_id: int, digest: bytes) -> bool:
+    """Проверяет, отклонялся ли этот пароль пользователя недавно"""
+    user_failed = _failed_passwords.get(telegram_id)
+    if not user_failed:
+        return False
+    stored_at = user_failed.get(digest)
+    if stored_at is None:
+        return False
+    if time.monotonic() - stored_at > FAILED_PASSWORD_TTL:
+        del user_failed[digest]
+        return False
+    return True
+
+
+def _remember_wrong_password(telegram_id: int, digest: bytes):
+    """Запоминает отклонённый пароль (старые записи и пользователи вытесняются)"""
+    user_failed = _failed_passwords.get(telegram_id)
+    if user_failed is None:
+        user_failed = _failed_passwords[telegram_id] = OrderedDict()
+        if len(_failed_passwords) > FAILED_PASSWORD_USERS:
+            _failed_passwords.popitem(last=False)
+    else:
+        _failed_passwords.move_to_end(telegram_id)
+    user_failed[digest] = time.monotonic()
+    user_failed.move_to_end(digest)
+    if len(user_failed) > FAILED_PASSWORDS_PER_USER:
+        user_failed.popitem(last=False)
+
+
+def forget_wrong_passwords(telegram_id: int):
+    """Очищает кэш отклонённых паролей пользователя (вход или смена пароля)"""
+    _failed_passwords.pop(telegram_id, None)
+
+
+def _pack_notifications(unread_msgs) -> list[list[str]]:
+    """
+    Собирает уведомления в минимальное число сообщений.
+    
+    Уведомления идут в исходном порядке; новая группа (сообщение)
+    начинается, когда следующее уведомление не помещается в лимит длины.
+    """
+    groups = []
+    current = ["У вас есть непрочитанные уведомления:"]
+    size = len(current[0])
+    for msg in unread_msgs:
+        # Текст уже обрезан до NOTIFICATION_MAX_LENGTH на стороне БД
+        text = msg["message_text"]
+        if current and size + 2 + len(text) > NOTIFICATION_MAX_LENGTH:
+            groups.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += len(text) + 2
+    groups.append(current)
+    return groups
+
+
+def _looks_like_html(text: str) -> bool:
+    """
+    Быстрая проверка, что угловые скобки в тексте — только поддерживаемые теги.
+    
+    Если это не так, Telegram гарантированно отклонит HTML, и запрос
+    с parse_mode="HTML" можно не отправлять.
+    """
+    if "<" not in text and ">" not in text:
+        return True
+    stripped = _HTML_TAG_RE.sub("", text)
+    return "<" not in stripped and ">" not in stripped
+
+
+async def _send_notification(message: Message, text: str):
+    """Отправляет одно уведомление (HTML, при ошибке разметки — текстом)"""
+    if _looks_like_html(text):
+        try:
+            # Пытаемся отправить с HTML-разметкой
+            await message.answer(text, parse_mode="HTML")
+            return
+        except TelegramBadRequest as e:
+            # Если ошибка с HTML - отправляем как простой текст
+            logger.error(f"Ошибка отправки уведомления: {e}")
+    await message.answer(text.translate(_STRIP_TAGS), parse_mode=None)
+
+
+async def _send_notifications(message: Message, groups: list[list[str]]):
+    """
+    Отправляет собранные уведомления по порядку.
+    
+    Группа уходит одним HTML-сообщением. Если разметка в группе некорректна,
+    её уведомления отправляются по одному, и простым текстом — только те,
+    что не прошли как HTML. Остальные ошибки Telegram пробрасываются.
+    """
+    for group in groups:
+        if all(map(_looks_like_html, group)):
+            try:
+                await message.answer("\n\n".join(group), parse_mode="HTML")
+                continue
+            except TelegramBadRequest as e:
+                logger.error(f"Ошибка отправки уведомлений: {e}")
+        for text in group:
+            await _send_notification(message, text)
+
 
 @router.message(F.text.startswith(("Войти как клиент", "Войти как предоставитель услуги")))
 async def login_start(message: Message, state: FSMContext):
@@ -83,18 +282,34 @@ async def login_check_password(message: Message, state: FSMContext):
     # Получаем ID пользователя
     telegram_id = message.from_user.id
     
-    # Получаем хэш пароля из БД
-    stored_hash = await get_password_hash(telegram_id)
-    
     # Получаем данные из состояния (роль, счётчик попыток)
     data = await state.get_data()
     attempts = data.get("login_attempts", 0)
     
-    # Проверяем пароль (сравниваем хэши с помощью bcrypt)
-    if not stored_hash or not bcrypt.checkpw(
-        message.text.encode(),      # Введённый пароль в bytes
-        stored_hash.encode()        # Сохранённый хэш в bytes
-    ):
+    # Проверяем пароль: недавно отклонённый отклоняем сразу,
+    # иначе берём хэш из БД и сравниваем (argon2id или bcrypt)
+    password = (message.text or "").encode()    # Введённый пароль в bytes (один раз)
+    digest = _password_digest(password)
+    password_ok = False
+    if not _is_known_wrong_password(telegram_id, digest):
+        # Непрочитанные уведомления загружаем параллельно с проверкой пароля
+        # (при неверном пароле запрос отменяется, результат не используется)
+        notifications_task = asyncio.create_task(
+            get_unread_notifications(
+                telegram_id, data.get("role"), max_length=NOTIFICATION_MAX_LENGTH
+            )
+        )
+        try:
+            stored_hash = await get_password_hash(telegram_id)
+            if stored_hash:
+                password_ok = await _verify_password(password, stored_hash)
+        finally:
+            if not password_ok:
+                notifications_task.cancel()
+        if not password_ok:
+            _remember_wrong_password(telegram_id, digest)
+    
+    if not password_ok:
         # Пароль неверный - увеличиваем счётчик попыток
         attempts += 1
         await state.update_data(login_attempts=attempts)
@@ -102,7 +317,6 @@ async def login_check_password(message: Message, state: FSMContext):
         # Проверяем лимит попыток
         if attempts >= MAX_LOGIN_ATTEMPTS:
             # Превышен лимит - показываем кнопку сброса пароля
-            from keyboards import password_reset_inline
             await message.answer(
                 f"❌ Неверный пароль. Достигнуто {attempts} неудачных попыток.\n"
                 "Хотите сбросить пароль?",
@@ -117,6 +331,14 @@ async def login_check_password(message: Message, state: FSMContext):
         return
     
     # Пароль верный - успешный вход
+    forget_wrong_passwords(telegram_id)
+    
+    # Старый хэш bcrypt заменяем на argon2id (в фоне, вход не задерживается)
+    if _needs_rehash(stored_hash):
+        run_in_background(
+            _upgrade_password_hash(telegram_id, password), 
+            name=f"password_rehash_{telegram_id}"
+        )
     
     # Получаем роль из состояния
     role = data["role"]
@@ -129,33 +351,13 @@ async def login_check_password(message: Message, state: FSMContext):
     # ПОКАЗ УВЕДОМЛЕНИЙ ТОЛЬКО ПОСЛЕ УСПЕШНОГО ВХОДА
     # ============================================================================
     
-    # Получаем непрочитанные уведомления ТОЛЬКО для текущей роли
-    unread_msgs = await get_unread_notifications(telegram_id, role)
+    # Непрочитанные уведомления ТОЛЬКО для текущей роли (запрос уже запущен)
+    unread_msgs = await notifications_task
     
     if unread_msgs:
-        # Показываем заголовок
-        await message.answer("У вас есть непрочитанные уведомления:")
-        
-        # Показываем каждое уведомление
-        for msg in unread_msgs:
-            text = msg["message_text"]
-            
-            # Ограничиваем длину сообщения (макс. 4000 символов для Telegram)
-            if len(text) > 4000:
-                text = text[:3997] + "..."
-            
-            try:
-                # Пытаемся отправить с HTML-разметкой
-                await message.answer(text, parse_mode="HTML")
-            except Exception as e:
-                # Если ошибка с HTML - отправляем как простой текст
-                logger.error(f"Ошибка отправки уведомления: {e}")
-                await message.answer(
-                    text.replace("<", "").replace(">", ""), 
-                    parse_mode=None
-                )
-        
-        # Помечаем уведомления как прочитанные
+        # Показываем уведомления (обычно одним сообщением вместе с заголовком);
+        # прочитанными помечаем только после успешной отправки всех
+        await _send_notifications(message, _pack_notifications(unread_msgs))
         await mark_notifications_as_read(telegram_id, role)
     
     # ============================================================================
@@ -9,7 +9,7 @@ from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from keyboards import main_menu_keyboard, client_menu_keyboard, provider_menu_keyboard
-from database import is_user_registered, get_unread_count
+from database import get_menu_state
 
 router = Router()
 
@@ -32,8 +32,7 @@ async def return_to_role_menu(message: Message, state: FSMContext, role: str = N
     # Если роль всё ещё неизвестна — определяем по наличию уведомлений
     if not role:
         telegram_id = message.from_user.id
-        client_count = await get_unread_count(telegram_id, "client")
-        provider_count = await get_unread_count(telegram_id, "provider")
+        registered, client_count, provider_count = await get_menu_state(telegram_id)
         
         # Определяем роль по количеству уведомлений (эвристика)
         if provider_count > 0 and client_count == 0:
@@ -42,7 +41,6 @@ async def return_to_role_menu(message: Message, state: FSMContext, role: str = N
             role = "client"
         # Если оба нули или оба есть — возвращаем в главное меню
         else:
-            registered = await is_user_registered(telegram_id)
             if registered:
                 await message.answer(
                     "Выберите роль для входа:",
@@ -70,17 +68,14 @@ async def return_to_role_menu(message: Message, state: FSMContext, role: str = N
     await state.update_data(user_role=role)
 
 
-@router.message(F.text == "Выйти из аккаунта")
 async def logout_account(message: Message, state: FSMContext):
     """
     Полный выход из аккаунта — в главное меню
     """
     telegram_id = message.from_user.id
-    registered = await is_user_registered(telegram_id)
+    registered, client_count, provider_count = await get_menu_state(telegram_id)
     
     if registered:
-        client_count = await get_unread_count(telegram_id, "client")
-        provider_count = await get_unread_count(telegram_id, "provider")
         await message.answer(
             "Вы вышли из аккаунта.",
             reply_markup=main_menu_keyboard(
@@ -98,9 +93,28 @@ async def logout_account(message: Message, state: FSMContext):
     await state.clear()
 
 
-@router.message(F.text == "В меню")
 async def back_to_menu(message: Message, state: FSMContext):
     """
     Возврат в меню текущей роли (не полный выход!)
     """
-    await return_to_role_menu(message, state)
\ No newline at end of file
+    await return_to_role_menu(message, state)
+
+
+# Кнопки выхода работают из любого состояния, поэтому обрабатываются здесь,
+# в самом первом роутере (текст кнопки → обработчик)
+ACCOUNT_HANDLERS = {
+    "Выйти из аккаунта": logout_account,
+    "В меню": back_to_menu,
+}
+
+
+@router.message(F.text.in_(ACCOUNT_HANDLERS))
+async def account_button(message: Message, state: FSMContext):
+    """
+    Обработка кнопок выхода одним поиском в словаре
+    
+    Args:
+        message (Message): Сообщение с текстом кнопки
+        state (FSMContext): Контекст состояния
+    """
+    await ACCOUNT_HANDLERS[message.text](message, state)
\ No newline at end of file
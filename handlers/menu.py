@@ -0,0 +1,44 @@
+"""
+handlers/menu.py
+================
+Единая точка входа для кнопок меню мастера
+Выбирает обработчик по тексту кнопки одним поиском в словаре
+вместо цепочки отдельных фильтров F.text == "..."
+"""
+
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from FSMstates import CompletionStates, PhotoStates
+from handlers.completion import start_completion
+from handlers.cancellation import start_cancellation
+from handlers.expenses import start_expense
+
+# Создаём роутер для кнопок меню
+router = Router()
+
+# Текст кнопки → обработчик (собирается один раз при загрузке модуля)
+MENU_HANDLERS = {
+    "Завершить услугу": start_completion,
+    "Отменить запись": start_cancellation,
+    "Добавить трату": start_expense,
+}
+
+# Шаги завершения услуги принимают любой текст: «Отменить запись»
+# и «Добавить трату» во время них достаются самим шагам (роутер completion
+# стоял перед роутерами этих кнопок). «Завершить услугу» работает в любом состоянии
+COMPLETION_STEPS = StateFilter(CompletionStates, PhotoStates.waiting_for_photos)
+
+
+@router.message(F.text == "Завершить услугу")
+@router.message(F.text.in_(MENU_HANDLERS), ~COMPLETION_STEPS)
+async def menu_button(message: Message, state: FSMContext):
+    """
+    Обработка нажатия кнопки меню
+    
+    Args:
+        message (Message): Сообщение с текстом кнопки
+        state (FSMContext): Контекст состояния
+    """
+    await MENU_HANDLERS[message.text](message, state)
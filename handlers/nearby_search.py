@@ -5,20 +5,69 @@ handlers/nearby_search.py
 """
 
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 import logging
+import re
 from FSMstates import NearbySearchStates
 from database import search_nearby_providers, geocode_address
-from keyboards import client_menu_keyboard, cancel_menu_keyboard
-from handlers.logout import return_to_role_menu
+from keyboards import client_menu_keyboard, cancel_menu_keyboard, search_pages_inline
+from telegram_utils import safe_edit
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Сколько мастеров показывать на одной странице результатов
+SEARCH_PAGE_SIZE = 3
+
+# Callback перелистывания результатов: search_page_<номер страницы>
+SEARCH_PAGE_RE = re.compile(r"^search_page_(\d+)$")
+
+SEARCH_HINT = (
+    "💡 Чтобы записаться к мастеру:\n"
+    "1. Запомните его ID (например, 000123)\n"
+    "2. Нажмите «Связаться с мастером»\n"
+    "3. Введите этот ID"
+)
+
+# Шаблоны строк результата (поля подставляются из словаря мастера)
+_SEARCH_ROW = (
+    "{i}. {full_name} (ID: {user_code})\n"
+    "   📍 {address}\n"
+    "   📏 {distance_km} км от вас\n"
+    "   🔧 {service_name}\n"
+).format
+_SEARCH_DESCRIPTION = "   ℹ️ {}...\n".format
+
+
+def _render_search_page(providers: list[dict], page: int) -> str:
+    """
+    Формирует текст одной страницы результатов поиска
+    
+    Args:
+        providers (list[dict]): Все найденные мастера (по возрастанию расстояния)
+        page (int): Номер страницы (с нуля)
+    
+    Returns:
+        str: Текст страницы
+    """
+    start = page * SEARCH_PAGE_SIZE
+    pages = -(-len(providers) // SEARCH_PAGE_SIZE)
+    header = f"✅ Найдено {len(providers)} мастеров поблизости"
+    if pages > 1:
+        header += f" (стр. {page + 1} из {pages})"
+    
+    # Части собираются одним join
+    parts = [header, ":\n\n"]
+    for i, provider in enumerate(providers[start:start + SEARCH_PAGE_SIZE], start + 1):
+        parts.append(_SEARCH_ROW(i=i, **provider))
+        if provider['description']:
+            parts.append(_SEARCH_DESCRIPTION(provider['description']))
+        parts.append("\n")
+    return "".join(parts)
+
 
 @router.message(F.text == "🔍 Найти мастера рядом")
 async def start_nearby_search(message: Message, state: FSMContext):
@@ -42,11 +91,6 @@ async def process_address(message: Message, state: FSMContext):
     
     Проверяет валидность адреса через геокодирование
     """
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="client")
-        return
-    
     address = message.text.strip()
     
     # Проверяем адрес через геокодирование
@@ -74,18 +118,19 @@ async def process_service_and_search(message: Message, state: FSMContext):
     """
     Обработка названия услуги и выполнение поиска
     """
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="client")
-        return
-    
     service_query = message.text.strip()
     data = await state.get_data()
     client_address = data['client_address']
+    client_coords = data.get('client_coords')
     
     try:
-        # Выполняем поиск мастеров
-        providers = await search_nearby_providers(client_address, service_query, limit=10)
+        # Выполняем поиск мастеров (координаты уже получены на шаге адреса)
+        providers = await search_nearby_providers(
+            client_address, 
+            service_query, 
+            limit=10, 
+            coords=tuple(client_coords) if client_coords else None
+        )
         
         if not providers:
             await message.answer(
@@ -96,29 +141,43 @@ async def process_service_and_search(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        # Формируем результат поиска
-        response = f"✅ Найдено {len(providers)} мастеров поблизости:\n\n"
-        for i, provider in enumerate(providers, 1):
-            distance = provider['distance_km']
-            response += (
-                f"{i}. {provider['full_name']} (ID: {provider['user_code']})\n"
-                f"   📍 {provider['address']}\n"
-                f"   📏 {distance} км от вас\n"
-                f"   🔧 {provider['service_name']}\n"
+        # Оставляем только то, что выводится (описание сразу обрезаем)
+        providers = [
+            {
+                'full_name': provider['full_name'],
+                'user_code': provider['user_code'],
+                'address': provider['address'],
+                'distance_km': provider['distance_km'],
+                'service_name': provider['service_name'],
+                'description': (provider['description'] or '')[:50]
+            }
+            for provider in providers
+        ]
+        await state.clear()
+        
+        # Все результаты помещаются на одну страницу — одно сообщение
+        if len(providers) <= SEARCH_PAGE_SIZE:
+            await message.answer(
+                _render_search_page(providers, 0) + SEARCH_HINT, 
+                reply_markup=client_menu_keyboard()
             )
-            if provider.get('description'):
-                response += f"   ℹ️ {provider['description'][:50]}...\n"
-            response += "\n"
+            return
         
-        response += (
-            "💡 Чтобы записаться к мастеру:\n"
-            "1. Запомните его ID (например, 000123)\n"
-            "2. Нажмите «Связаться с мастером»\n"
-            "3. Введите этот ID"
+        # Иначе первая страница с кнопками перелистывания; остальные
+        # страницы формируются по нажатию из сохранённых результатов.
+        # Результаты привязаны к сообщению: кнопки более старого поиска
+        # не листают результаты нового
+        pages = -(-len(providers) // SEARCH_PAGE_SIZE)
+        sent = await message.answer(
+            _render_search_page(providers, 0), 
+            reply_markup=search_pages_inline(0, pages)
         )
-        
-        await message.answer(response, reply_markup=client_menu_keyboard())
-        await state.clear()
+        await state.update_data(
+            search_results=providers, 
+            search_message_id=sent.message_id, 
+            search_page=0
+        )
+        await message.answer(SEARCH_HINT, reply_markup=client_menu_keyboard())
     
     except Exception as e:
         logger.error(f"Ошибка поиска мастеров: {e}")
@@ -126,4 +185,30 @@ async def process_service_and_search(message: Message, state: FSMContext):
             "❌ Произошла ошибка при поиске. Попробуйте позже.",
             reply_markup=client_menu_keyboard()
         )
-        await state.clear()
\ No newline at end of file
+        await state.clear()
+
+
+@router.callback_query(F.data.regexp(SEARCH_PAGE_RE).as_("match"))
+async def search_page_callback(callback: CallbackQuery, state: FSMContext, match: re.Match):
+    """
+    Перелистывание страниц результатов поиска (редактирует то же сообщение)
+    """
+    data = await state.get_data()
+    providers = data.get("search_results")
+    if not providers or data.get("search_message_id") != callback.message.message_id:
+        await callback.answer("Результаты поиска устарели. Выполните поиск заново.")
+        return
+    
+    pages = -(-len(providers) // SEARCH_PAGE_SIZE)
+    page = min(int(match.group(1)), pages - 1)
+    
+    # Повторное нажатие на ту же страницу не редактирует сообщение
+    # (Telegram ответил бы «message is not modified»)
+    if page != data.get("search_page"):
+        await safe_edit(
+            callback.message, 
+            _render_search_page(providers, page), 
+            reply_markup=search_pages_inline(page, pages)
+        )
+        await state.update_data(search_page=page)
+    await callback.answer()
@@ -4,32 +4,51 @@ handlers/password_reset.py
 Обработчик сброса пароля через email с 6-значным кодом подтверждения
 """
 
-import bcrypt
+import asyncio
 import logging
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from FSMstates import PasswordResetStates
 from database import (
-    is_user_registered,
-    get_user_email,
+    get_user_profile,
     generate_reset_code,
     verify_reset_code,
-    clear_reset_code,
     update_password
 )
-from email_utils import send_reset_code_email
+from email_utils import queue_reset_code_email
 from keyboards import cancel_menu_keyboard, main_menu_keyboard
-from handlers.logout import return_to_role_menu
+from handlers.login import forget_wrong_passwords, hash_password
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки сброса пароля
 router = Router()
 
 
+async def get_user_profile_cached(state: FSMContext, telegram_id: int) -> tuple[bool, str | None]:
+    """
+    Возвращает (зарегистрирован, email) пользователя, кэшируя их в данных FSM
+    
+    Повторные шаги сценария (например, повторный ввод email) не обращаются к БД.
+    Кэш живёт до state.clear() — выхода в меню или из аккаунта.
+    
+    Args:
+        state (FSMContext): Контекст состояния
+        telegram_id (int): ID пользователя в Telegram
+    
+    Returns:
+        tuple[bool, str | None]: (зарегистрирован, email или None)
+    """
+    data = await state.get_data()
+    profile = data.get("_profile")
+    if profile is None:
+        profile = await get_user_profile(telegram_id)
+        await state.update_data(_profile=profile)
+    return profile[0], profile[1]
+
+
 @router.message(F.text == "Сбросить пароль")
 async def start_password_reset(message: Message, state: FSMContext):
     """
@@ -45,8 +64,9 @@ async def start_password_reset(message: Message, state: FSMContext):
     # Получаем ID пользователя
     telegram_id = message.from_user.id
     
-    # Проверяем регистрацию
-    if not await is_user_registered(telegram_id):
+    # Проверяем регистрацию (профиль кэшируется в состоянии для следующих шагов)
+    registered, _ = await get_user_profile_cached(state, telegram_id)
+    if not registered:
         await message.answer("Вы не зарегистрированы. Сначала зарегистрируйтесь.")
         return
     
@@ -72,17 +92,11 @@ async def process_reset_email(message: Message, state: FSMContext):
         message (Message): Сообщение с email
         state (FSMContext): Контекст состояния
     """
-    # Проверка отмены действия
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="client")
-        return
-    
     # Получаем ID пользователя
     telegram_id = message.from_user.id
     
-    # Получаем зарегистрированный email из БД
-    saved_email = await get_user_email(telegram_id)
+    # Получаем зарегистрированный email (из кэша состояния или БД)
+    _, saved_email = await get_user_profile_cached(state, telegram_id)
     
     # Проверяем совпадение email (регистронезависимо)
     if not saved_email or saved_email.lower() != message.text.strip().lower():
@@ -92,15 +106,21 @@ async def process_reset_email(message: Message, state: FSMContext):
         )
         return
     
-    # Генерируем и отправляем код подтверждения
+    # Генерируем код и ставим письмо в очередь (отправит фоновый обработчик)
     try:
         code = await generate_reset_code(telegram_id)
-        await send_reset_code_email(saved_email, code)
-        await message.answer("Код отправлен на ваш email. Введите его:")
-        await state.set_state(PasswordResetStates.waiting_for_code)
+        queue_reset_code_email(telegram_id, saved_email, code)
+    except asyncio.QueueFull:
+        logger.warning("Очередь писем переполнена")
+        await message.answer("Не удалось отправить код. Попробуйте позже.")
+        return
     except Exception as e:
-        logger.error(f"Ошибка отправки email: {e}")
+        logger.error(f"Ошибка генерации кода сброса: {e}")
         await message.answer("Не удалось отправить код. Попробуйте позже.")
+        return
+    
+    await message.answer("Код отправлен на ваш email. Введите его:")
+    await state.set_state(PasswordResetStates.waiting_for_code)
 
 
 @router.message(PasswordResetStates.waiting_for_code)
@@ -115,19 +135,12 @@ async def process_reset_code(message: Message, state: FSMContext):
         message (Message): Сообщение с кодом
         state (FSMContext): Контекст состояния
     """
-    # Проверка отмены действия
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="client")
-        return
-    
     # Получаем ID пользователя
     telegram_id = message.from_user.id
     
-    # Проверяем код
+    # Проверяем код (при успехе он сразу погашается в БД)
     if await verify_reset_code(telegram_id, message.text.strip()):
-        # Код верный - очищаем его и запрашиваем новый пароль
-        await clear_reset_code(telegram_id)
+        # Код верный - запрашиваем новый пароль
         await message.answer("Код подтверждён. Введите новый пароль (минимум 4 символа):")
         await state.set_state(PasswordResetStates.waiting_for_new_password)
     else:
@@ -149,12 +162,6 @@ async def enter_new_password(message: Message, state: FSMContext):
         message (Message): Сообщение с новым паролем
         state (FSMContext): Контекст состояния
     """
-    # Проверка отмены действия
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="client")
-        return
-    
     # Проверяем длину пароля
     if len(message.text) < 4:
         await message.answer(
@@ -182,12 +189,6 @@ async def confirm_new_password(message: Message, state: FSMContext):
         message (Message): Сообщение с подтверждением пароля
         state (FSMContext): Контекст состояния
     """
-    # Проверка отмены действия
-    if message.text == "В меню":
-        await state.clear()
-        await return_to_role_menu(message, state, role="client")
-        return
-    
     # Получаем данные из состояния
     data = await state.get_data()
     
@@ -200,14 +201,14 @@ async def confirm_new_password(message: Message, state: FSMContext):
         await state.set_state(PasswordResetStates.waiting_for_new_password)
         return
     
-    # Пароли совпадают - хэшируем и сохраняем в БД
-    password_hash = bcrypt.hashpw(
-        data["new_password"].encode(), 
-        bcrypt.gensalt()
-    ).decode()
+    # Пароли совпадают - хэшируем (argon2id, в пуле потоков) и сохраняем в БД
+    password_hash = await hash_password(data["new_password"])
     
     await update_password(message.from_user.id, password_hash)
     
+    # Новый пароль мог недавно вводиться как неверный — сбрасываем кэш входа
+    forget_wrong_passwords(message.from_user.id)
+    
     # Показываем завершающее сообщение
     await message.answer(
         "✅ Пароль успешно изменён!", 
@@ -29,8 +29,7 @@ from keyboards import (
 )
 from handlers.logout import return_to_role_menu  # ← ИСПРАВЛЕНО: правильный импорт
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -143,7 +142,7 @@ async def address_action_menu(callback: CallbackQuery, state: FSMContext):
     """Меню действий с адресом (сделать основным, удалить)"""
     await callback.answer()
     
-    address_id = int(callback.data.split("_")[-1])
+    address_id = int(callback.data.removeprefix("addr_action_"))
     
     # Сохраняем ID адреса в состоянии
     await state.update_data(current_address_id=address_id)
@@ -163,7 +162,7 @@ async def set_primary_address(callback: CallbackQuery, state: FSMContext):
     """Назначает адрес основным"""
     await callback.answer()
     
-    address_id = int(callback.data.split("_")[-1])
+    address_id = int(callback.data.removeprefix("addr_set_primary_"))
     
     # Получаем текущие адреса для проверки
     addresses = await get_provider_addresses(callback.from_user.id)
@@ -200,7 +199,7 @@ async def delete_address_confirm(callback: CallbackQuery, state: FSMContext):
     """Подтверждение удаления адреса"""
     await callback.answer()
     
-    address_id = int(callback.data.split("_")[-1])
+    address_id = int(callback.data.removeprefix("addr_delete_"))
     await state.update_data(address_to_delete=address_id)
     
     await callback.message.edit_text(
@@ -10,7 +10,6 @@ from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from database import get_expenses_for_month  # ← Теперь работает!
 from keyboards import provider_menu_keyboard, cancel_menu_keyboard
-from handlers.logout import return_to_role_menu
 
 router = Router()
 
@@ -67,9 +66,3 @@ async def show_provider_expenses(message: Message, state: FSMContext):
         response,
         reply_markup=cancel_menu_keyboard()
     )
-
-
-@router.message(F.text == "В меню")
-async def back_to_menu(message: Message, state: FSMContext):
-    """Возврат в меню мастера"""
-    await return_to_role_menu(message, state, role="provider")
\ No newline at end of file
@@ -22,8 +22,7 @@ from keyboards import (
 )
 from handlers.logout import return_to_role_menu  # ← ПРАВИЛЬНЫЙ ИМПОРТ ФУНКЦИИ
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -269,7 +268,7 @@ async def show_provider_reviews(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     
     # Извлекаем ID мастера
-    provider_id = int(callback.data.split("_")[-1])
+    provider_id = int(callback.data.removeprefix("profile_reviews_"))
     
     # Получаем полный профиль (включая все отзывы)
     profile = await get_provider_profile(provider_id)
@@ -346,7 +345,7 @@ async def back_to_profile(callback: CallbackQuery, state: FSMContext):
     """Возврат к просмотру профиля после отзывов (с поддержкой фото-сообщений)"""
     await callback.answer()
     
-    provider_id = int(callback.data.split("_")[-1])
+    provider_id = int(callback.data.removeprefix("profile_back_"))
     profile = await get_provider_profile(provider_id)
     
     if not profile:
@@ -25,8 +25,7 @@ from keyboards import (
 )
 from handlers.logout import return_to_role_menu
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -73,8 +72,12 @@ async def show_pending_requests(message: Message, state: FSMContext):
     
     response += "Введите номер запроса для просмотра:"
     
-    # Сохраняем список запросов
-    await state.update_data(provider_requests=requests)
+    # Сохраняем только то, что нужно для выбора запроса по номеру:
+    # (ID запроса, ID клиента, имя клиента)
+    await state.update_data(provider_requests=[
+        (req['request_id'], req['client_id'], req['client_name']) 
+        for req in requests
+    ])
     await message.answer(response, reply_markup=cancel_menu_keyboard())
     await state.set_state(RepeatRequestStates.chatting)
 
@@ -107,21 +110,20 @@ async def view_provider_request_dialog(message: Message, state: FSMContext, bot)
             raise ValueError
         
         # Получаем выбранный запрос
-        selected_request = requests[req_num]
-        request_id = selected_request['request_id']
+        request_id, client_id, client_name = requests[req_num]
         
         # Сохраняем данные запроса
         await state.update_data(
             current_request_id=request_id,
-            current_client_id=selected_request['client_id'],
-            current_client_name=selected_request['client_name']
+            current_client_id=client_id,
+            current_client_name=client_name
         )
         
         # Получаем все сообщения в диалоге
         messages = await get_request_messages(request_id)
         
         # Формируем историю диалога
-        dialog_text = f"💬 Запрос от {selected_request['client_name']}:\n\n"
+        dialog_text = f"💬 Запрос от {client_name}:\n\n"
         for msg in messages:
             sender_prefix = f"👤 {msg['sender_name']}:" if msg['sender_role'] == 'client' else "👑 Вы:"
             time_str = msg['sent_at'].strftime('%H:%M')
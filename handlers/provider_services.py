@@ -22,8 +22,7 @@ from keyboards import (
 )
 from handlers.logout import return_to_role_menu  # ← ПРАВИЛЬНЫЙ ИМПОРТ ФУНКЦИИ
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -160,7 +159,7 @@ async def service_action_menu(callback: CallbackQuery, state: FSMContext):
     """Меню действий с услугой (удалить)"""
     await callback.answer()
     
-    service_id = int(callback.data.split("_")[-1])
+    service_id = int(callback.data.removeprefix("srv_action_"))
     await state.update_data(current_service_id=service_id)
     
     await callback.message.edit_text(
@@ -177,7 +176,7 @@ async def delete_service_confirm(callback: CallbackQuery, state: FSMContext):
     """Подтверждение удаления услуги"""
     await callback.answer()
     
-    service_id = int(callback.data.split("_")[-1])
+    service_id = int(callback.data.removeprefix("srv_delete_"))
     await state.update_data(service_to_delete=service_id)
     
     await callback.message.edit_text(
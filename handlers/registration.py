@@ -5,19 +5,14 @@ handlers/registration.py
 Последовательность: пароль → подтверждение → имя → фамилия → email
 """
 
-import bcrypt
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from FSMstates import RegistrationStates
-from database import (
-    is_user_registered, 
-    create_user, 
-    update_user_name, 
-    update_user_email
-)
+from database import is_user_registered, create_user
 from keyboards import main_menu_keyboard, cancel_menu_keyboard
 from handlers.logout import return_to_role_menu
+from handlers.login import hash_password
 
 # Создаём роутер для обработки регистрации
 router = Router()
@@ -212,25 +207,19 @@ async def process_email(message: Message, state: FSMContext):
     # Получаем все сохранённые данные из состояния
     data = await state.get_data()
     
-    # Хэшируем пароль с помощью bcrypt
-    password_hash = bcrypt.hashpw(
-        data["password"].encode(),  # Кодируем пароль в bytes
-        bcrypt.gensalt()            # Генерируем "соль" для хэширования
-    ).decode()  # Декодируем обратно в строку
+    # Хэшируем пароль argon2id (в отдельном потоке, не блокируя бота)
+    password_hash = await hash_password(data["password"])
     
-    # Создаём пользователя в БД и получаем его 6-значный код
-    user_code = await create_user(data["telegram_id"], password_hash)
-    
-    # Сохраняем имя и фамилию в БД
-    await update_user_name(
+    # Создаём пользователя в БД (вместе с именем, фамилией и email)
+    # и получаем его 6-значный код
+    user_code = await create_user(
         data["telegram_id"], 
-        data["first_name"], 
-        data["last_name"]
+        password_hash, 
+        first_name=data["first_name"], 
+        last_name=data["last_name"], 
+        email=email
     )
     
-    # Сохраняем email в БД
-    await update_user_email(data["telegram_id"], email)
-    
     # Показываем завершающее сообщение с кодом пользователя
     await message.answer(
         f"✅ Регистрация завершена!\nВаш персональный ID: <b>{user_code}</b>",
@@ -28,8 +28,7 @@ from keyboards import (
 )
 from handlers.logout import return_to_role_menu
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
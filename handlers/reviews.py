@@ -20,8 +20,7 @@ from keyboards import (
     InlineKeyboardButton
 )
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -15,9 +15,8 @@ from FSMstates import ServiceRecordStates
 from database import (
     get_user_telegram_id_by_code,
     get_active_chat_by_provider,
-    create_service_record,
+    create_service_record_with_notifications,
     get_records_by_date_for_provider,
-    create_notification,
     get_user_name
 )
 from keyboards import (
@@ -27,8 +26,7 @@ from keyboards import (
 )
 from handlers.logout import return_to_role_menu
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки записей
@@ -312,18 +310,6 @@ async def process_comments_and_send(message: Message, state: FSMContext, bot):
     date_obj = data["date"]
     time_obj = data["time"]
     
-    # Сохраняем запись в БД
-    await create_service_record(
-        provider_id=message.from_user.id,
-        client_id=client_id,
-        service_name=service_name,
-        cost=int(cost),
-        address=address,
-        date=date_obj,
-        time=time_obj,
-        comments=comments
-    )
-    
     # Получаем имя и фамилию клиента из БД для отображения
     client_info = await get_user_name(client_id)
     if client_info and (client_info["first_name"] or client_info["last_name"]):
@@ -354,23 +340,25 @@ async def process_comments_and_send(message: Message, state: FSMContext, bot):
         record_text = record_text[:3997] + "..."
     
     # ============================================================================
-    # СОХРАНЯЕМ УВЕДОМЛЕНИЯ ДЛЯ ОБЕИХ СТОРОН (БЕЗ ПРЯМОЙ ОТПРАВКИ)
+    # СОХРАНЯЕМ ЗАПИСЬ И УВЕДОМЛЕНИЯ ДЛЯ ОБЕИХ СТОРОН (ОДНОЙ ТРАНЗАКЦИЕЙ)
     # ============================================================================
     
-    # Для мастера - сохраняем уведомление
-    await create_notification(
-        telegram_id=message.from_user.id,
-        role="provider",
-        message_text=record_text
-    )
-    
-    # Для клиента - сохраняем уведомление (если не сам себе)
+    # Для мастера - всегда, для клиента - если не сам себе
+    notifications = [(message.from_user.id, "provider", record_text)]
     if client_id != message.from_user.id:
-        await create_notification(
-            telegram_id=client_id,
-            role="client",
-            message_text=record_text
-        )
+        notifications.append((client_id, "client", record_text))
+    
+    await create_service_record_with_notifications(
+        provider_id=message.from_user.id,
+        client_id=client_id,
+        service_name=service_name,
+        cost=int(cost),
+        address=address,
+        date=date_obj,
+        time=time_obj,
+        comments=comments,
+        notifications=notifications
+    )
     
     # ============================================================================
     # ПОДТВЕРЖДЕНИЕ МАСТЕРУ
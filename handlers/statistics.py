@@ -14,8 +14,7 @@ from database import get_statistics, get_tax_rate  # ← Теперь работ
 from keyboards import statistics_period_keyboard, cancel_menu_keyboard
 from handlers.logout import return_to_role_menu
 
-# Настройка логгера
-logging.basicConfig(level=logging.INFO)
+# Настройка логгера (формат и уровень задаются в main.py)
 logger = logging.getLogger(__name__)
 
 # Создаём роутер для обработки статистики
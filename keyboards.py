@@ -5,8 +5,8 @@ keyboards.py
 Поддерживает как обычные (Reply), так и inline-клавиатуры
 """
 
+from functools import lru_cache
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from calendar import month_name
 from datetime import datetime
 
 
@@ -14,10 +14,14 @@ from datetime import datetime
 # ГЛАВНОЕ МЕНЮ (с учётом регистрации и счётчиков уведомлений)
 # ============================================================================
 
+@lru_cache(maxsize=128)
 def main_menu_keyboard(is_registered: bool = False, client_count: int = 0, provider_count: int = 0):
     """
     Создаёт главное меню в зависимости от статуса регистрации
     
+    Клавиатуры кэшируются: вариантов немного (счётчики уведомлений обычно
+    малы), и одинаковое меню не собирается заново на каждое сообщение.
+    
     Args:
         is_registered (bool): Зарегистрирован ли пользователь
         client_count (int): Количество непрочитанных уведомлений для клиента
@@ -50,104 +54,119 @@ def main_menu_keyboard(is_registered: bool = False, client_count: int = 0, provi
 # МЕНЮ КЛИЕНТА (после успешного входа)
 # ============================================================================
 
+CLIENT_MENU_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="Связаться с мастером"),
+            KeyboardButton(text="Календарь")
+        ],
+        [
+            KeyboardButton(text="История записей"),
+            KeyboardButton(text="👤 Профиль мастера")
+        ],
+        [
+            KeyboardButton(text="Сбросить пароль"),
+            KeyboardButton(text="Выйти из аккаунта")
+        ]
+    ],
+    resize_keyboard=True
+)
+
+
 def client_menu_keyboard():
     """
     Создаёт компактное меню для авторизованного клиента (2 колонки)
     """
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text="Связаться с мастером"),
-                KeyboardButton(text="Календарь")
-            ],
-            [
-                KeyboardButton(text="История записей"),
-                KeyboardButton(text="👤 Профиль мастера")
-            ],
-            [
-                KeyboardButton(text="Сбросить пароль"),
-                KeyboardButton(text="Выйти из аккаунта")
-            ]
-        ],
-        resize_keyboard=True
-    )
+    return CLIENT_MENU_KB
 
 
 # ============================================================================
 # МЕНЮ МАСТЕРА (после успешного входа)
 # ============================================================================
 
+PROVIDER_MENU_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="Добавить запись"),
+            KeyboardButton(text="Завершить услугу")
+        ],
+        [
+            KeyboardButton(text="Отменить запись"),
+            KeyboardButton(text="Статистика")
+        ],
+        [
+            KeyboardButton(text="Траты"),
+            KeyboardButton(text="📥 Запросы")
+        ],
+        [
+            KeyboardButton(text="📍 Адреса работы"),
+            KeyboardButton(text="🔧 Мои услуги")
+        ],
+        [
+            KeyboardButton(text="📸 Фото профиля"),
+            KeyboardButton(text="Календарь")
+        ],
+        [
+            KeyboardButton(text="Сбросить пароль"),
+            KeyboardButton(text="Выйти из аккаунта")
+        ]
+    ],
+    resize_keyboard=True
+)
+
+
 def provider_menu_keyboard():
     """
     Создаёт компактное меню для авторизованного мастера (2 колонки)
     """
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text="Добавить запись"),
-                KeyboardButton(text="Завершить услугу")
-            ],
-            [
-                KeyboardButton(text="Отменить запись"),
-                KeyboardButton(text="Статистика")
-            ],
-            [
-                KeyboardButton(text="Траты"),
-                KeyboardButton(text="📥 Запросы")
-            ],
-            [
-                KeyboardButton(text="📍 Адреса работы"),
-                KeyboardButton(text="🔧 Мои услуги")
-            ],
-            [
-                KeyboardButton(text="📸 Фото профиля"),
-                KeyboardButton(text="Календарь")
-            ],
-            [
-                KeyboardButton(text="Сбросить пароль"),
-                KeyboardButton(text="Выйти из аккаунта")
-            ]
-        ],
-        resize_keyboard=True
-    )
+    return PROVIDER_MENU_KB
 
 
 # ============================================================================
 # КЛАВИАТУРЫ АКТИВНОГО ЧАТА
 # ============================================================================
 
+CLIENT_CHAT_ACTIVE_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="Завершить чат")]
+    ],
+    resize_keyboard=True
+)
+
+
 def client_chat_active_keyboard():
     """Клавиатура для клиента во время активного чата"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Завершить чат")]
-        ],
-        resize_keyboard=True
-    )
+    return CLIENT_CHAT_ACTIVE_KB
+
+
+PROVIDER_CHAT_ACTIVE_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="Завершить чат")]
+    ],
+    resize_keyboard=True
+)
 
 
 def provider_chat_active_keyboard():
     """Клавиатура для мастера во время активного чата"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Завершить чат")]
-        ],
-        resize_keyboard=True
-    )
+    return PROVIDER_CHAT_ACTIVE_KB
 
 
 # ============================================================================
 # КЛАВИАТУРА ОТМЕНЫ
 # ============================================================================
 
+CANCEL_MENU_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
+
+
 def cancel_menu_keyboard():
     """Клавиатура с кнопкой отмены"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return CANCEL_MENU_KB
 
 
 # ============================================================================
@@ -176,125 +195,170 @@ def chat_request_inline(chat_id: int):
     ])
 
 
+# Постоянные части клавиатуры создания записи после чата (меняется только ID чата)
+_RECORD_YES_TEXT = "✅ Да"
+_RECORD_NO_TEXT = "❌ Нет"
+_RECORD_YES_PREFIX = "create_record_yes_"
+_RECORD_NO_PREFIX = "create_record_no_"
+
+
 def create_record_after_chat_inline(chat_id: int):
     """Inline-клавиатура подтверждения создания записи после чата"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Да", callback_data=f"create_record_yes_{chat_id}"),
-            InlineKeyboardButton(text="❌ Нет", callback_data=f"create_record_no_{chat_id}")
-        ]
+    suffix = str(chat_id)
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=_RECORD_YES_TEXT, callback_data=_RECORD_YES_PREFIX + suffix),
+        InlineKeyboardButton(text=_RECORD_NO_TEXT, callback_data=_RECORD_NO_PREFIX + suffix)
+    ]])
+
+
+def cancellation_records_inline(records) -> InlineKeyboardMarkup:
+    """Inline-клавиатура выбора записи для отмены (ID записи в callback_data)"""
+    buttons = [
+        [InlineKeyboardButton(
+            text=f"{i}. {record['service_name']} — {record['service_date']} {record['service_time']}",
+            callback_data=f"cxl_{record['id']}"
+        )]
+        for i, record in enumerate(records, 1)
+    ]
+    buttons.append([
+        InlineKeyboardButton(text="🏠 В меню", callback_data="cxl_menu")
     ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+STATISTICS_PERIOD_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📊 За день")],
+        [KeyboardButton(text="📅 За неделю")],
+        [KeyboardButton(text="📆 За месяц")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
 
 
 def statistics_period_keyboard():
     """Клавиатура выбора периода статистики"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📊 За день")],
-            [KeyboardButton(text="📅 За неделю")],
-            [KeyboardButton(text="📆 За месяц")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return STATISTICS_PERIOD_KB
+
+
+YES_NO_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="✅ Да")],
+        [KeyboardButton(text="❌ Нет")]
+    ],
+    resize_keyboard=True
+)
 
 
 def yes_no_keyboard():
     """Универсальная клавиатура Да/Нет"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✅ Да")],
-            [KeyboardButton(text="❌ Нет")]
-        ],
-        resize_keyboard=True
-    )
+    return YES_NO_KB
 
 
 # ============================================================================
 # КЛАВИАТУРЫ ЗАПРОСОВ ПОВТОРНОЙ ЗАПИСИ
 # ============================================================================
 
+REPEAT_REQUEST_MENU_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="👤 Выбрать из истории")],
+        [KeyboardButton(text="🔍 Найти мастера")],
+        [KeyboardButton(text="📋 Мои запросы")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
+
+
 def repeat_request_menu_keyboard():
     """Клавиатура меню запросов для клиента"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="👤 Выбрать из истории")],
-            [KeyboardButton(text="🔍 Найти мастера")],
-            [KeyboardButton(text="📋 Мои запросы")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return REPEAT_REQUEST_MENU_KB
+
+
+SEARCH_TYPE_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="По услуге")],
+        [KeyboardButton(text="По имени мастера")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
 
 
 def search_type_keyboard():
     """Клавиатура выбора типа поиска"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="По услуге")],
-            [KeyboardButton(text="По имени мастера")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return SEARCH_TYPE_KB
+
+
+PROVIDER_REQUESTS_MENU_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📥 Новые запросы")],
+        [KeyboardButton(text="💬 Мои диалоги")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
 
 
 def provider_requests_menu_keyboard():
     """Клавиатура меню запросов для мастера"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📥 Новые запросы")],
-            [KeyboardButton(text="💬 Мои диалоги")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return PROVIDER_REQUESTS_MENU_KB
+
+
+REQUEST_ACTION_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="✅ Принять")],
+        [KeyboardButton(text="❌ Отклонить")],
+        [KeyboardButton(text="✏️ Ответить")],
+        [KeyboardButton(text="📄 Создать запись")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
 
 
 def request_action_keyboard():
     """Клавиатура действий с запросом (мастер)"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✅ Принять")],
-            [KeyboardButton(text="❌ Отклонить")],
-            [KeyboardButton(text="✏️ Ответить")],
-            [KeyboardButton(text="📄 Создать запись")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return REQUEST_ACTION_KB
+
+
+CLIENT_REQUEST_ACTION_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="✏️ Написать ответ")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
 
 
 def client_request_action_keyboard():
     """Клавиатура действий с запросом (клиент)"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✏️ Написать ответ")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return CLIENT_REQUEST_ACTION_KB
 
 
 # ============================================================================
 # КЛАВИАТУРЫ ОЦЕНОК И ОТЗЫВОВ
 # ============================================================================
 
+RATING_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [
+            KeyboardButton(text="⭐"),
+            KeyboardButton(text="⭐⭐"),
+            KeyboardButton(text="⭐⭐⭐"),
+            KeyboardButton(text="⭐⭐⭐⭐"),
+            KeyboardButton(text="⭐⭐⭐⭐⭐")
+        ],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
+
+
 def rating_keyboard():
     """Клавиатура выбора оценки (1-5 звёзд)"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(text="⭐"),
-                KeyboardButton(text="⭐⭐"),
-                KeyboardButton(text="⭐⭐⭐"),
-                KeyboardButton(text="⭐⭐⭐⭐"),
-                KeyboardButton(text="⭐⭐⭐⭐⭐")
-            ],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return RATING_KB
 
 
 def cancel_inline_keyboard():
@@ -307,20 +371,44 @@ def cancel_inline_keyboard():
     ])
 
 
+# ============================================================================
+# КЛАВИАТУРА РЕЗУЛЬТАТОВ ПОИСКА МАСТЕРОВ
+# ============================================================================
+
+@lru_cache(maxsize=64)
+def search_pages_inline(page: int, pages: int) -> InlineKeyboardMarkup:
+    """
+    Кнопки перелистывания результатов поиска мастеров
+    
+    Args:
+        page (int): Текущая страница (с нуля)
+        pages (int): Всего страниц
+    """
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"search_page_{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton(text="Ещё ▶️", callback_data=f"search_page_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+
 # ============================================================================
 # КЛАВИАТУРЫ ПРОСМОТРА ПРОФИЛЯ МАСТЕРА
 # ============================================================================
 
+PROFILE_SEARCH_METHOD_KB = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🔍 По ID мастера")],
+        [KeyboardButton(text="📋 Из истории записей")],
+        [KeyboardButton(text="В меню")]
+    ],
+    resize_keyboard=True
+)
+
+
 def profile_search_method_keyboard():
     """Клавиатура выбора способа поиска мастера"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🔍 По ID мастера")],
-            [KeyboardButton(text="📋 Из истории записей")],
-            [KeyboardButton(text="В меню")]
-        ],
-        resize_keyboard=True
-    )
+    return PROFILE_SEARCH_METHOD_KB
 
 
 def profile_actions_keyboard(provider_id: int):
@@ -355,10 +443,26 @@ def profile_actions_keyboard(provider_id: int):
 # INLINE-КЛАВИАТУРЫ КАЛЕНДАРЯ
 # ============================================================================
 
+# Названия месяцев по номеру (индекс 0 не используется).
+# Не зависят от локали системы, в отличие от calendar.month_name
+MONTH_NAMES = (
+    "", "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+)
+
+# Клавиатуры календаря зависят только от входных данных, поэтому готовые
+# объекты кэшируются по хешируемому ключу (кортежи вместо list/dict).
+# Возвращаемые клавиатуры общие для всех вызовов — их нельзя изменять.
+
 def get_years_inline(years: list[int]) -> InlineKeyboardMarkup:
     """Inline-клавиатура выбора года"""
+    return _years_inline(tuple(sorted(years, reverse=True)))
+
+
+@lru_cache(maxsize=1024)
+def _years_inline(years: tuple[int, ...]) -> InlineKeyboardMarkup:
     buttons = []
-    for year in sorted(years, reverse=True):
+    for year in years:
         buttons.append([
             InlineKeyboardButton(text=str(year), callback_data=f"cal_year_{year}")
         ])
@@ -370,13 +474,23 @@ def get_years_inline(years: list[int]) -> InlineKeyboardMarkup:
 
 def get_months_inline(year: int, month_counts: dict[int, int]) -> InlineKeyboardMarkup:
     """Inline-клавиатура выбора месяца"""
-    current_year = datetime.now().year
-    current_month = datetime.now().month
+    # Текущий месяц входит в ключ кэша: прошедшие месяцы скрываются
+    now = datetime.now()
+    return _months_inline(year, tuple(sorted(month_counts)), now.year, now.month)
+
+
+@lru_cache(maxsize=1024)
+def _months_inline(
+    year: int, 
+    months: tuple[int, ...], 
+    current_year: int, 
+    current_month: int
+) -> InlineKeyboardMarkup:
     buttons = []
     row = []
-    for month_num in sorted(month_counts.keys()):
+    for month_num in months:
         if year > current_year or (year == current_year and month_num >= current_month):
-            month_label = f"{month_name[month_num]}"
+            month_label = MONTH_NAMES[month_num]
             row.append(InlineKeyboardButton(text=month_label, callback_data=f"cal_month_{month_num}"))
             if len(row) == 2:
                 buttons.append(row)
@@ -394,7 +508,17 @@ def get_months_inline(year: int, month_counts: dict[int, int]) -> InlineKeyboard
 
 def get_calendar_inline(year: int, month: int, day_counts: dict[int, int]) -> InlineKeyboardMarkup:
     """Календарная сетка"""
+    return _calendar_inline(year, month, tuple(sorted(day_counts.items())))
+
+
+@lru_cache(maxsize=1024)
+def _calendar_inline(
+    year: int, 
+    month: int, 
+    day_count_items: tuple[tuple[int, int], ...]
+) -> InlineKeyboardMarkup:
     from calendar import monthrange
+    day_counts = dict(day_count_items)
     days_of_week = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
     first_day, num_days = monthrange(year, month)
     
@@ -8,10 +8,10 @@ main.py
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from config import BOT_TOKEN
+from fsm_storage import create_fsm_storage
 
 # Настройка логгера для записи всех событий
 logging.basicConfig(
@@ -24,7 +24,7 @@ logger = logging.getLogger(__name__)
 bot = Bot(token=BOT_TOKEN)
 
 # Создаём диспетчер для обработки сообщений
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=create_fsm_storage())
 
 # Создаём планировщик задач для периодических операций
 scheduler = AsyncIOScheduler()
@@ -170,6 +170,18 @@ async def main():
     
     Инициализирует планировщик и подключает обработчики
     """
+    # ============================================================================
+    # ПОДГОТОВКА БАЗЫ ДАННЫХ
+    # ============================================================================
+    
+    from database import get_db_pool
+    
+    # Столбцы и индексы создаёт разовая миграция (python migrate.py),
+    # а не каждый запуск бота.
+    # Открываем пул подключений заранее, а не на первом запросе пользователя
+    await get_db_pool()
+    logger.info("Пул подключений к БД создан")
+    
     # ============================================================================
     # НАСТРОЙКА ПЛАНИРОВЩИКА ЗАДАЧ
     # ============================================================================
@@ -190,10 +202,22 @@ async def main():
         replace_existing=True
     )
     
+    # Поддерживаем SMTP-соединение открытым (каждые 4 минуты)
+    from email_utils import smtp_keepalive, start_email_worker
+    scheduler.add_job(
+        smtp_keepalive,
+        trigger=IntervalTrigger(minutes=4),
+        id='smtp_keepalive',
+        replace_existing=True
+    )
+    
     # Запускаем планировщик
     scheduler.start()
     logger.info("Планировщик запущен")
     
+    # Запускаем фоновую отправку писем с кодами сброса пароля
+    start_email_worker(bot)
+    
     # ============================================================================
     # ПОДКЛЮЧЕНИЕ ОБРАБОТЧИКОВ (ВАЖЕН ПОРЯДОК!)
     # ============================================================================
@@ -206,6 +230,7 @@ async def main():
     from handlers.password_reset import router as password_reset_router
     from handlers.chat import router as chat_router
     from handlers.service_record import router as service_record_router
+    from handlers.menu import router as menu_router
     from handlers.completion import router as completion_router
     from handlers.cancellation import router as cancellation_router
     from handlers.expenses import router as expenses_router
@@ -231,6 +256,7 @@ async def main():
     dp.include_router(password_reset_router)
     dp.include_router(chat_router)
     dp.include_router(service_record_router)
+    dp.include_router(menu_router)          # кнопки меню мастера (до их роутеров)
     dp.include_router(completion_router)
     dp.include_router(cancellation_router)
     dp.include_router(expenses_router)
@@ -252,7 +278,21 @@ async def main():
     logger.info("Бот запускается...")
     
     # Запускаем бота в режиме опроса (polling)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Останавливаем отправку писем и закрываем общее SMTP-соединение
+        from email_utils import stop_email_worker, close_smtp
+        await stop_email_worker()
+        await close_smtp()
+        
+        # Закрываем соединение хранилища состояний (Redis)
+        await dp.storage.close()
+        
+        # Закрываем HTTP-сессию геокодера и пул подключений к БД
+        from database import close_geocoder, close_db_pool
+        await close_geocoder()
+        await close_db_pool()
 
 
 # ============================================================================
@@ -263,5 +303,12 @@ if __name__ == "__main__":
     """
     Проверка, что файл запущен напрямую (а не импортирован)
     """
-    # Запускаем основную функцию
-    asyncio.run(main())
\ No newline at end of file
+    # Запускаем основную функцию на uvloop, если он установлен
+    # (на Windows недоступен — тогда стандартный цикл asyncio)
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        logger.info("Используется цикл событий uvloop")
+        uvloop.run(main())
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+middlewares.py
+==============
+Middleware для роутеров бота
+"""
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class FSMDataMiddleware(BaseMiddleware):
+    """
+    Загружает данные FSM один раз на событие и передаёт их в обработчик
+    аргументом fsm_data.
+    
+    Обработчикам не нужно самим вызывать state.get_data() — это избавляет
+    от повторных обращений к хранилищу состояний.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        state = data.get("state")
+        data["fsm_data"] = await state.get_data() if state is not None else {}
+        return await handler(event, data)
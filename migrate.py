@@ -0,0 +1,33 @@
+"""
+migrate.py
+==========
+Разовая миграция схемы БД: недостающие столбцы и индексы для горячих запросов.
+Запускается вручную перед запуском новой версии бота:
+
+    python migrate.py
+
+Индексы собираются с CONCURRENTLY и не блокируют запись в таблицы,
+поэтому миграцию можно выполнять при работающем боте.
+"""
+
+import asyncio
+import logging
+
+from database import ensure_indexes, close_db_pool
+
+
+async def migrate():
+    """Применяет миграцию и закрывает пул подключений"""
+    try:
+        await ensure_indexes()
+        logging.info("Столбцы и индексы БД созданы")
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(migrate())
@@ -0,0 +1,176 @@
+"""
+telegram_utils.py
+=================
+Вспомогательные функции для вызовов Telegram Bot API.
+Ограничивают частоту отправки и редактирования сообщений, чтобы не упираться
+в лимиты Telegram (~1 сообщение в секунду на чат, ~30 в секунду всего).
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# ОГРАНИЧЕНИЕ ЧАСТОТЫ (TOKEN BUCKET)
+# ============================================================================
+
+class RateLimiter:
+    """
+    Ограничитель частоты по алгоритму token bucket.
+    
+    Допускает не более max_rate операций за time_period секунд;
+    acquire() ждёт, пока не освободится «жетон».
+    """
+
+    def __init__(self, max_rate: float, time_period: float = 1.0):
+        self._capacity = max_rate
+        self._rate = max_rate / time_period
+        self._tokens = max_rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ожидает свободный жетон и забирает его"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, 
+                    self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+# Лимиты Telegram: ~1 сообщение в секунду на чат и ~30 в секунду на бота
+# (глобальный лимит взят с запасом; отправка и редактирование делят общие лимиты)
+CHAT_RATE_LIMIT = 1
+GLOBAL_RATE_LIMIT = 25
+MAX_TRACKED_CHATS = 10000
+
+_global_limiter = RateLimiter(GLOBAL_RATE_LIMIT)
+_chat_limiters = OrderedDict()
+
+
+def _get_chat_limiter(chat_id: int) -> RateLimiter:
+    """Возвращает ограничитель для чата (давно неактивные чаты вытесняются)"""
+    limiter = _chat_limiters.get(chat_id)
+    if limiter is None:
+        limiter = _chat_limiters[chat_id] = RateLimiter(CHAT_RATE_LIMIT)
+        if len(_chat_limiters) > MAX_TRACKED_CHATS:
+            _chat_limiters.popitem(last=False)
+    else:
+        _chat_limiters.move_to_end(chat_id)
+    return limiter
+
+
+async def _throttle(chat_id: int):
+    """Ждёт свободный слот в ограничителях чата и бота"""
+    await _get_chat_limiter(chat_id).acquire()
+    await _global_limiter.acquire()
+
+
+# ============================================================================
+# ОТПРАВКА СООБЩЕНИЙ
+# ============================================================================
+
+async def safe_send(bot: Bot, chat_id: int, text: str, **kwargs):
+    """
+    Отправляет сообщение с учётом лимитов Telegram.
+    
+    Перед запросом ждёт свободный слот в ограничителях чата и бота;
+    при ответе 429 (TelegramRetryAfter) ждёт указанное время и повторяет.
+    Остальные ошибки (например, TelegramForbiddenError) пробрасываются.
+    
+    Args:
+        bot (Bot): Экземпляр бота
+        chat_id (int): ID получателя
+        text (str): Текст сообщения
+        **kwargs: Остальные параметры Bot.send_message (reply_markup и т.д.)
+    
+    Returns:
+        Message: Отправленное сообщение
+    """
+    while True:
+        await _throttle(chat_id)
+        try:
+            return await bot.send_message(chat_id, text, **kwargs)
+        except TelegramRetryAfter as e:
+            logger.warning(
+                f"Лимит Telegram для чата {chat_id}, "
+                f"повтор через {e.retry_after} с"
+            )
+            await asyncio.sleep(e.retry_after)
+
+
+async def safe_copy(bot: Bot, chat_id: int, message: Message, **kwargs):
+    """
+    Копирует сообщение (в том числе с медиа) другому пользователю
+    с учётом лимитов Telegram.
+    
+    Содержимое пересылается серверами Telegram (copy_message) —
+    файлы не скачиваются и не загружаются ботом повторно.
+    
+    Args:
+        bot (Bot): Экземпляр бота
+        chat_id (int): ID получателя
+        message (Message): Копируемое сообщение
+        **kwargs: Остальные параметры Bot.copy_message (caption и т.д.)
+    
+    Returns:
+        MessageId: ID созданной копии
+    """
+    while True:
+        await _throttle(chat_id)
+        try:
+            return await bot.copy_message(
+                chat_id, 
+                from_chat_id=message.chat.id, 
+                message_id=message.message_id, 
+                **kwargs
+            )
+        except TelegramRetryAfter as e:
+            logger.warning(
+                f"Лимит Telegram для чата {chat_id}, "
+                f"повтор через {e.retry_after} с"
+            )
+            await asyncio.sleep(e.retry_after)
+
+
+# ============================================================================
+# РЕДАКТИРОВАНИЕ СООБЩЕНИЙ
+# ============================================================================
+
+async def safe_edit(message: Message, text: str, **kwargs):
+    """
+    Редактирует текст сообщения с учётом лимитов Telegram.
+    
+    Перед запросом ждёт свободный слот в ограничителях чата и бота;
+    при ответе 429 (TelegramRetryAfter) ждёт указанное время и повторяет.
+    
+    Args:
+        message (Message): Редактируемое сообщение
+        text (str): Новый текст
+        **kwargs: Остальные параметры Message.edit_text (reply_markup и т.д.)
+    """
+    while True:
+        await _throttle(message.chat.id)
+        try:
+            return await message.edit_text(text, **kwargs)
+        except TelegramRetryAfter as e:
+            logger.warning(
+                f"Лимит Telegram для чата {message.chat.id}, "
+                f"повтор через {e.retry_after} с"
+            )
+            await asyncio.sleep(e.retry_after)